@@ -1,69 +1,170 @@
-import nltk
-from textblob.download_corpora import download_all
-from transformers import AutoTokenizer, AutoModel
-import os
-import sys
-import logging
-
-# Configurar logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-logger = logging.getLogger(__name__)
-
-def download_essential_resources():
-    """Descarga todos los recursos necesarios para NLP y LLMs"""
-    logger.info("="*60)
-    logger.info("CONFIGURANDO RECURSOS PARA EL PROYECTO FINAL")
-    logger.info("="*60)
-    
-    # 1. Recursos de NLTK
-    nltk_resources = [
-        'punkt', 'stopwords', 'wordnet',
-        'averaged_perceptron_tagger', 'omw-1.4'
-    ]
-    
-    logger.info("\nDescargando recursos de NLTK...")
-    for resource in nltk_resources:
-        try:
-            nltk.download(resource, quiet=True)
-            logger.info(f"✅ {resource}")
-        except Exception as e:
-            logger.error(f"⚠️ Error con {resource}: {str(e)}")
-    
-    # 2. Recursos de TextBlob
-    logger.info("\nDescargando recursos de TextBlob...")
-    try:
-        download_all()
-        logger.info("✅ TextBlob Corpora")
-    except Exception as e:
-        logger.error(f"⚠️ TextBlob: {str(e)}")
-    
-    # 3. Modelo LLM (DistilRoBERTa - versión ligera)
-    logger.info("\n⏳ Descargando modelo de lenguaje (distilroberta-base)...")
-    try:
-        # Intento de carga para verificar si ya existe
-        try:
-            tokenizer = AutoTokenizer.from_pretrained("distilroberta-base")
-            model = AutoModel.from_pretrained("distilroberta-base")
-            logger.info("✅ Modelo ya existe en caché")
-        except:
-            logger.info("Descargando modelo (≈300MB)...")
-            tokenizer = AutoTokenizer.from_pretrained("distilroberta-base")
-            model = AutoModel.from_pretrained("distilroberta-base")
-            logger.info("✅ Modelo descargado")
-        
-        # Test de funcionamiento rápido
-        inputs = tokenizer("Prueba de integración LLM exitosa", return_tensors="pt")
-        outputs = model(**inputs)
-        logger.info(f"🧪 Test de embeddings: Vector de {outputs.last_hidden_state.size()}")
-        
-    except Exception as e:
-        logger.error(f"❌ Error crítico: {str(e)}")
-        logger.error("El sistema no funcionará correctamente sin el modelo")
-        sys.exit(1)
-    
-    logger.info("\n" + "="*60)
-    logger.info("¡TODOS LOS RECURSOS ESTÁN LISTOS PARA EL PROYECTO FINAL!")
-    logger.info("="*60)
-
-if __name__ == "__main__":
-    download_essential_resources()
\ No newline at end of file
+import argparse
+import json
+import sys
+import time
+import logging
+from pathlib import Path
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+BASE_DIR = Path(__file__).resolve().parent
+STAMP_FILE = BASE_DIR / 'models' / '.resources_stamp.json'
+
+# Recursos de NLTK usados por el proyecto
+NLTK_RESOURCES = ['punkt', 'stopwords', 'wordnet', 'averaged_perceptron_tagger', 'omw-1.4']
+
+# Categoría de cada paquete dentro de nltk_data (para comprobar sin red)
+NLTK_CATEGORIES = {
+    'punkt': 'tokenizers', 'punkt_tab': 'tokenizers',
+    'averaged_perceptron_tagger': 'taggers', 'averaged_perceptron_tagger_eng': 'taggers'
+}
+
+# Modelo de lenguaje (DistilRoBERTa - versión ligera)
+LLM_MODEL_NAME = "distilroberta-base"
+
+
+def _textblob_corpora():
+    """Corpora que descargaría TextBlob (la lista depende de su versión)"""
+    try:
+        from textblob.download_corpora import ALL_CORPORA
+        return list(ALL_CORPORA)
+    except ImportError:
+        return []
+
+
+def _nltk_installed(resource):
+    import nltk
+    category = NLTK_CATEGORIES.get(resource, 'corpora')
+    try:
+        nltk.data.find(f'{category}/{resource}')
+        return True
+    except LookupError:
+        return False
+
+
+def _hf_cached(model_name):
+    """Comprueba si el modelo está en la caché local de Hugging Face (o es un directorio local)"""
+    if Path(model_name).is_dir():
+        return (Path(model_name) / 'config.json').exists()
+    try:
+        from huggingface_hub import try_to_load_from_cache
+    except ImportError:
+        return False
+    return isinstance(try_to_load_from_cache(model_name, 'config.json'), str)
+
+
+def _expected_stamp(model_name):
+    import nltk
+    import transformers
+    return {
+        'nltk': sorted(set(NLTK_RESOURCES) | set(_textblob_corpora())),
+        'hf_model': model_name,
+        'nltk_version': nltk.__version__,
+        'transformers_version': transformers.__version__
+    }
+
+
+def ensure_resources(download=False, model_name=LLM_MODEL_NAME, load_model=False):
+    """Verifica (y opcionalmente descarga) los recursos de NLTK, TextBlob y Hugging Face
+
+    La comprobación rápida usa un fichero de sello en models/: si coincide con la
+    configuración actual no se consulta nada más. Solo se descarga cuando
+    `download=True`; en nodos sin red basta con tener las cachés pobladas.
+
+    Args:
+        download: Descargar lo que falte (requiere red)
+        model_name: Modelo de Hugging Face a verificar
+        load_model: Cargar y devolver tokenizer y modelo (para reutilizarlos en LLMEmbedder)
+    Returns:
+        Diccionario con 'missing', 'timings' (segundos por etapa) y, si
+        load_model=True, 'tokenizer' y 'model'
+    """
+    timings = {}
+    start = time.perf_counter()
+    expected = _expected_stamp(model_name)
+    missing = []
+
+    stamp_ok = False
+    if STAMP_FILE.exists():
+        try:
+            stamp_ok = json.loads(STAMP_FILE.read_text(encoding='utf-8')) == expected
+        except ValueError:
+            stamp_ok = False
+
+    if not stamp_ok:
+        # 1. Recursos de NLTK y corpora de TextBlob
+        import nltk
+        for resource in expected['nltk']:
+            if _nltk_installed(resource):
+                continue
+            if download:
+                logger.info(f"Descargando recurso NLTK '{resource}'...")
+                if not nltk.download(resource, quiet=True):
+                    missing.append(f'nltk:{resource}')
+            else:
+                missing.append(f'nltk:{resource}')
+        timings['nltk'] = time.perf_counter() - start
+
+        # 2. Modelo de Hugging Face
+        hf_start = time.perf_counter()
+        if not _hf_cached(model_name):
+            if download:
+                logger.info(f"⏳ Descargando modelo de lenguaje ({model_name}, ≈300MB)...")
+                from transformers import AutoTokenizer, AutoModel
+                AutoTokenizer.from_pretrained(model_name)
+                AutoModel.from_pretrained(model_name)
+            else:
+                missing.append(f'hf:{model_name}')
+        timings['hf_check'] = time.perf_counter() - hf_start
+
+        if not missing:
+            STAMP_FILE.parent.mkdir(parents=True, exist_ok=True)
+            STAMP_FILE.write_text(json.dumps(expected, indent=2), encoding='utf-8')
+    timings['check'] = time.perf_counter() - start
+
+    result = {'missing': missing, 'stamp_hit': stamp_ok, 'timings': timings}
+
+    # 3. Cargar el modelo una sola vez para entregarlo al LLMEmbedder
+    if load_model and f'hf:{model_name}' not in missing:
+        load_start = time.perf_counter()
+        from transformers import AutoTokenizer, AutoModel
+        result['tokenizer'] = AutoTokenizer.from_pretrained(model_name, local_files_only=not download)
+        result['model'] = AutoModel.from_pretrained(model_name, local_files_only=not download)
+        timings['model_load'] = time.perf_counter() - load_start
+
+    timings['total'] = time.perf_counter() - start
+    return result
+
+
+def download_essential_resources():
+    """Descarga todos los recursos necesarios para NLP y LLMs"""
+    logger.info("="*60)
+    logger.info("CONFIGURANDO RECURSOS PARA EL PROYECTO FINAL")
+    logger.info("="*60)
+
+    result = ensure_resources(download=True)
+    if result['missing']:
+        for resource in result['missing']:
+            logger.error(f"⚠️ No se pudo obtener {resource}")
+        logger.error("El sistema no funcionará correctamente sin estos recursos")
+        sys.exit(1)
+
+    logger.info(f"✅ Recursos verificados en {result['timings']['total']:.2f}s")
+    logger.info("\n" + "="*60)
+    logger.info("¡TODOS LOS RECURSOS ESTÁN LISTOS PARA EL PROYECTO FINAL!")
+    logger.info("="*60)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Verifica o descarga los recursos de NLP/LLM")
+    parser.add_argument('--check', action='store_true', help="Solo verificar, sin descargar")
+    args = parser.parse_args()
+
+    if args.check:
+        result = ensure_resources(download=False)
+        print(json.dumps({'missing': result['missing'], 'stamp_hit': result['stamp_hit'],
+                          'timings': result['timings']}, indent=2))
+        sys.exit(1 if result['missing'] else 0)
+    download_essential_resources()
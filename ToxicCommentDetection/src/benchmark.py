@@ -0,0 +1,287 @@
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import sys
+import time
+from datetime import datetime, timezone
+import numpy as np
+import pandas as pd
+from config import IDENTITY_TERMS, RANDOM_STATE
+from modules.metrics import peak_rss_mb
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+ALL_STAGES = ['clean', 'identity', 'context', 'adjust', 'embed', 'forest', 'predict']
+
+# Vocabulario para el corpus sintético (mezcla de comentarios neutros, tóxicos e identidades)
+SYNTHETIC_VOCAB = (
+    "hoy es un día soleado me encanta este lugar gracias por el apoyo excelente trabajo "
+    "eres un completo idiota estúpido imbécil voy a matarte maldito pedazo de mierda "
+    "los musulmanes cristianos judíos mujeres hombres negros latinos gay lesbiana "
+    "vaya solución tan brillante claro que sí como no genial idea no nunca jamás "
+    "good bad great terrible really very not happy sad awful love hate first lol "
+    "http://example.com www.spam.net ! ? !! ... :)"
+).split()
+
+
+def synthetic_corpus(size, length_dist='lognormal', mean_words=40, seed=RANDOM_STATE):
+    """Genera comentarios sintéticos con la distribución de longitudes indicada
+
+    Args:
+        size: Número de comentarios
+        length_dist: 'lognormal' (sesgada, como Jigsaw), 'uniform' o 'fixed'
+        mean_words: Longitud media en palabras
+        seed: Semilla para reproducibilidad
+    """
+    rng = np.random.default_rng(seed)
+    if length_dist == 'lognormal':
+        sigma = 0.9
+        lengths = rng.lognormal(np.log(mean_words) - sigma ** 2 / 2, sigma, size)
+    elif length_dist == 'uniform':
+        lengths = rng.uniform(1, 2 * mean_words, size)
+    elif length_dist == 'fixed':
+        lengths = np.full(size, mean_words)
+    else:
+        raise ValueError(f"Distribución de longitudes desconocida: {length_dist}")
+    lengths = np.clip(lengths.astype(int), 1, 20 * mean_words)
+    vocab = np.array(SYNTHETIC_VOCAB)
+    return [' '.join(vocab[rng.integers(0, len(vocab), n)]) for n in lengths]
+
+
+def sampled_corpus(path, size, seed=RANDOM_STATE):
+    """Muestra `size` comentarios de un CSV con columna comment_text"""
+    df = pd.read_csv(path, usecols=['comment_text'])
+    df = df.sample(min(size, len(df)), random_state=seed)
+    return df['comment_text'].fillna('').astype(str).tolist()
+
+
+def measure(fn, items, batch_size=1, warmup=1):
+    """Ejecuta `fn` sobre lotes de `items` y mide latencias por llamada
+
+    Returns:
+        Diccionario con throughput (items/s), percentiles de latencia por
+        llamada en ms y pico de RSS del proceso
+    """
+    batches = [items[i:i + batch_size] for i in range(0, len(items), batch_size)]
+    for batch in batches[:warmup]:
+        fn(batch)
+
+    rss_before = peak_rss_mb()
+    latencies = np.empty(len(batches), dtype=np.float64)
+    start = time.perf_counter()
+    for i, batch in enumerate(batches):
+        call_start = time.perf_counter()
+        fn(batch)
+        latencies[i] = time.perf_counter() - call_start
+    total = time.perf_counter() - start
+
+    p50, p95, p99 = np.percentile(latencies * 1000, [50, 95, 99]) if len(latencies) else (0.0, 0.0, 0.0)
+    return {
+        'items': len(items),
+        'batch_size': batch_size,
+        'calls': len(batches),
+        'seconds': total,
+        'throughput': len(items) / total if total > 0 else 0.0,
+        'p50_ms': float(p50),
+        'p95_ms': float(p95),
+        'p99_ms': float(p99),
+        'peak_rss_mb': peak_rss_mb(),
+        'rss_growth_mb': peak_rss_mb() - rss_before
+    }
+
+
+def _per_text(fn):
+    return lambda batch: [fn(text) for text in batch]
+
+
+def _fresh(factory, *args):
+    """Instancia nueva con la memo de polaridad del módulo vaciada (medición en frío)"""
+    from modules.context_analysis import _polarity
+    _polarity.cache_clear()
+    return factory(*args)
+
+
+def run_benchmarks(texts, stages, batch_sizes, backends, model_path=None):
+    results = {}
+    model = None
+    if model_path and ({'adjust', 'forest', 'predict'} & set(stages)):
+        from modules.models import ToxicityModel
+        model = ToxicityModel.load(model_path)
+
+    # Cada medición usa una instancia nueva con las memos vacías. Los lotes de
+    # corpus completo se miden sin calentamiento (en frío) y, aparte, en una
+    # segunda pasada sobre la misma instancia (en caliente, `*_batch_warm`)
+    if 'clean' in stages:
+        from modules.text_processing import TextCleaner
+        results['clean'] = measure(_per_text(_fresh(TextCleaner).clean), texts)
+        cleaner = _fresh(TextCleaner)
+        results['clean_batch'] = measure(cleaner.clean_batch, texts, batch_size=len(texts), warmup=0)
+        results['clean_batch']['stem_cache'] = cleaner.stats()
+        results['clean_batch_warm'] = measure(cleaner.clean_batch, texts, batch_size=len(texts), warmup=0)
+
+    if 'identity' in stages:
+        from modules.identity_detection import IdentityDetector
+        results['identity'] = measure(_per_text(_fresh(IdentityDetector, IDENTITY_TERMS).detect), texts)
+        detector = _fresh(IdentityDetector, IDENTITY_TERMS)
+        results['identity_batch'] = measure(detector.detect_batch, texts, batch_size=len(texts), warmup=0)
+        results['identity_batch_warm'] = measure(detector.detect_batch, texts, batch_size=len(texts), warmup=0)
+
+    if 'context' in stages:
+        from modules.context_analysis import ContextAnalyzer
+        results['context'] = measure(_per_text(_fresh(ContextAnalyzer).analyze), texts)
+        analyzer = _fresh(ContextAnalyzer)
+        results['context_batch'] = measure(analyzer.analyze_batch, texts, batch_size=len(texts), warmup=0)
+        results['context_batch_warm'] = measure(analyzer.analyze_batch, texts, batch_size=len(texts), warmup=0)
+
+    if 'adjust' in stages:
+        from modules.contextual_adjustment import ContextualAdjuster
+        adjuster = ContextualAdjuster(IDENTITY_TERMS)
+        base = np.full(len(texts), 0.5)
+        for batch_size in batch_sizes:
+            # Coste del ajuste aislado (características + reglas), en serie
+            result = measure(lambda batch: adjuster.adjust(base[:len(batch)], adjuster.features(batch)),
+                             texts, batch_size=batch_size)
+            result['us_per_text'] = result['seconds'] / len(texts) * 1e6 if texts else 0.0
+            results[f'adjust[bs={batch_size}]'] = result
+            if model is not None:
+                # Latencia de predict con el ajuste en paralelo al embedding (frente a 'predict')
+                previous, model.adjuster = model.adjuster, adjuster
+                results[f'predict_adjusted[bs={batch_size}]'] = measure(model.predict_batch, texts, batch_size=batch_size)
+                model.adjuster = previous
+
+    if 'embed' in stages:
+        from modules.llm_embedder import LLMEmbedder
+        for backend in backends:
+            try:
+                embedder = LLMEmbedder(use_cache=False, backend=backend, parallel=False)
+                embedder.load()
+            except Exception as e:
+                logger.warning(f"⚠️ Backend '{backend}' omitido: {e}")
+                results[f'embed[{backend}]'] = {'skipped': str(e)}
+                continue
+            for batch_size in batch_sizes:
+                embedder.pipeline = False
+                results[f'embed[{backend},bs={batch_size}]'] = measure(embedder.embed, texts, batch_size=batch_size)
+                embedder.pipeline = True
+                results[f'embed_pipelined[{backend},bs={batch_size}]'] = measure(embedder.embed, texts, batch_size=batch_size)
+
+    if 'forest' in stages:
+        if model is not None:
+            clf = model.clf
+        else:
+            # Bosque con los mismos hiperparámetros que ToxicityModel sobre datos aleatorios
+            from sklearn.ensemble import RandomForestClassifier
+            rng = np.random.default_rng(RANDOM_STATE)
+            X_fit = rng.normal(size=(2000, 768)).astype(np.float32)
+            clf = RandomForestClassifier(n_estimators=100, max_depth=10, class_weight='balanced',
+                                         n_jobs=-1, random_state=RANDOM_STATE)
+            clf.fit(X_fit, (X_fit[:, 0] > 0).astype(int))
+        X = np.random.default_rng(RANDOM_STATE + 1).normal(size=(len(texts), clf.n_features_in_)).astype(np.float32)
+        from modules.fast_forest import FlatForest
+        flat = model.forest if model is not None and model.forest is not None else FlatForest.from_sklearn(clf)
+        for batch_size in batch_sizes:
+            results[f'forest[bs={batch_size}]'] = measure(clf.predict_proba, X, batch_size=batch_size)
+            results[f'flat_forest[bs={batch_size}]'] = measure(flat.predict_proba, X, batch_size=batch_size)
+
+    if 'predict' in stages:
+        if model is None:
+            logger.warning("⚠️ Etapa 'predict' omitida: indique --model")
+            results['predict'] = {'skipped': 'sin --model'}
+        else:
+            for batch_size in batch_sizes:
+                results[f'predict[bs={batch_size}]'] = measure(model.predict_batch, texts, batch_size=batch_size)
+
+    return results
+
+
+def compare(current, baseline, tolerance):
+    """Compara contra una línea base y devuelve la lista de regresiones
+
+    Una etapa regresa si su throughput cae o su p95 sube más que `tolerance`.
+    """
+    regressions = []
+    for stage, result in current['stages'].items():
+        base = baseline.get('stages', {}).get(stage)
+        if not base or 'throughput' not in base or 'throughput' not in result:
+            continue
+        if result['throughput'] < base['throughput'] * (1 - tolerance):
+            regressions.append((stage, 'throughput', base['throughput'], result['throughput']))
+        if base['p95_ms'] > 0 and result['p95_ms'] > base['p95_ms'] * (1 + tolerance):
+            regressions.append((stage, 'p95_ms', base['p95_ms'], result['p95_ms']))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de rendimiento del pipeline de toxicidad")
+    parser.add_argument('--size', type=int, default=1000, help="Número de comentarios")
+    parser.add_argument('--length-dist', default='lognormal', choices=['lognormal', 'uniform', 'fixed'])
+    parser.add_argument('--mean-words', type=int, default=40)
+    parser.add_argument('--corpus', help="CSV con comment_text para muestrear en lugar del corpus sintético")
+    parser.add_argument('--stages', default=','.join(ALL_STAGES), help=f"Etapas a medir ({','.join(ALL_STAGES)})")
+    parser.add_argument('--batch-sizes', default='1,32,256', help="Tamaños de lote para embed/forest/predict")
+    parser.add_argument('--backends', default='torch', help="Backends del embedder (torch,torch_int8,onnx)")
+    parser.add_argument('--model', help="Directorio del modelo entrenado (para forest/predict)")
+    parser.add_argument('--seed', type=int, default=RANDOM_STATE)
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--compare', help="JSON de línea base para detectar regresiones")
+    parser.add_argument('--tolerance', type=float, default=0.10, help="Margen permitido antes de marcar regresión")
+    args = parser.parse_args()
+
+    stages = [stage.strip() for stage in args.stages.split(',') if stage.strip()]
+    unknown = set(stages) - set(ALL_STAGES)
+    if unknown:
+        parser.error(f"Etapas desconocidas: {', '.join(sorted(unknown))}")
+    batch_sizes = [int(b) for b in args.batch_sizes.split(',')]
+    backends = [b.strip() for b in args.backends.split(',') if b.strip()]
+
+    random.seed(args.seed)
+    if args.corpus:
+        texts = sampled_corpus(args.corpus, args.size, args.seed)
+    else:
+        texts = synthetic_corpus(args.size, args.length_dist, args.mean_words, args.seed)
+    logger.info(f"📊 Corpus: {len(texts)} comentarios, {np.mean([len(t.split()) for t in texts]):.1f} palabras de media")
+
+    report = {
+        'meta': {
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'size': len(texts),
+            'corpus': args.corpus or f'synthetic:{args.length_dist}:{args.mean_words}',
+            'seed': args.seed,
+            'stages': stages,
+            'batch_sizes': batch_sizes,
+            'backends': backends
+        },
+        'stages': run_benchmarks(texts, stages, batch_sizes, backends, args.model)
+    }
+
+    for stage, result in report['stages'].items():
+        if 'throughput' in result:
+            logger.info(f"⏱️ {stage:<28} {result['throughput']:>12.1f} items/s | "
+                        f"p50 {result['p50_ms']:.3f} ms | p95 {result['p95_ms']:.3f} ms | "
+                        f"p99 {result['p99_ms']:.3f} ms | RSS {result['peak_rss_mb']:.0f} MB")
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    logger.info(f"✅ Resultados guardados en {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.tolerance)
+        for stage, metric, base, value in regressions:
+            logger.error(f"❌ Regresión en {stage}: {metric} {base:.3f} -> {value:.3f}")
+        if regressions:
+            sys.exit(1)
+        logger.info(f"✅ Sin regresiones frente a {args.compare} (tolerancia {args.tolerance:.0%})")
+
+
+if __name__ == "__main__":
+    main()
@@ -28,3 +28,62 @@ SARCASM_PHRASES = [
     "fantástico trabajo",
     "vaya manera de hacerlo"
 ]
+
+# Servicio HTTP de puntuación
+SERVICE_HOST = '127.0.0.1'
+SERVICE_PORT = 8000
+SERVICE_MAX_BATCH_SIZE = 64   # Textos máximos por micro-lote
+SERVICE_MAX_WAIT_MS = 10      # Espera máxima para completar un micro-lote
+SERVICE_MAX_BODY_BYTES = 10 * 1024 * 1024   # Cuerpo máximo por petición (mayor: 413)
+
+# Instrumentación (timers/contadores por etapa); desactivada no tiene coste
+METRICS_ENABLED = False
+METRICS_JSONL_PATH = MODELS_DIR / 'metrics.jsonl'   # Una línea JSON por emisión
+METRICS_PROM_PATH = MODELS_DIR / 'metrics.prom'     # Formato de texto de Prometheus
+
+# Reentrenamiento incremental (almacén de embeddings + árboles añadidos por tanda)
+EMBEDDING_STORE_DIR = MODELS_DIR / 'embedding_store'
+INCREMENTAL_NEW_TREES = 20
+INCREMENTAL_MAX_TREES = 300   # Por encima se descartan los árboles más antiguos
+
+# Entrenamiento fuera de memoria (corpus completo de ~1.8M comentarios)
+TRAIN_OUT_OF_CORE = False
+TRAIN_WORK_DIR = MODELS_DIR / 'train_embeddings'   # Memmap de embeddings en disco
+TRAIN_EMBED_DTYPE = 'float16'                      # float16 reduce el disco y la E/S a la mitad
+TRAIN_CHUNK_SIZE = 8192                            # Textos por bloque de embedding
+TRAIN_MEMORY_BUDGET_MB = 4096                      # Techo de RSS para el ajuste del bosque
+
+# Deduplicación antes de puntuar (exactos por texto normalizado + casi duplicados por MinHash/LSH)
+# Desactivada por defecto: los textos agrupados comparten puntuación, lo que cambia la submission
+DEDUP_ENABLED = False
+DEDUP_NEAR_DUPLICATES = False   # Opcional: agrupa también textos que difieren en pocas palabras
+DEDUP_THRESHOLD = 0.9     # Similitud de Jaccard mínima (shingles de 3 palabras) para agrupar
+DEDUP_NUM_PERM = 64       # Permutaciones MinHash (más = estimación más precisa, más lenta)
+
+# Cascada TF-IDF -> LLM: solo los textos con probabilidad TF-IDF dentro de la banda pasan al LLM
+CASCADE_ENABLED = False
+CASCADE_LOW = 0.2
+CASCADE_HIGH = 0.8
+
+# Embeddings compactos: proyección antes del bosque, guardada en float16 (None = dimensión completa)
+# El pooling del LLM ('cls', 'mean', 'max') se elige con LLM_POOLING en modules/llm_config.py
+REDUCTION_DIM = None                   # p. ej. 64, 128 o 256
+REDUCTION_METHOD = 'pca'               # 'pca' o 'random' (proyección gaussiana)
+REDUCTION_REPORT = False               # Comparar AUC/memoria/velocidad frente a los embeddings completos
+REDUCTION_REPORT_DIMS = (64, 128, 256)
+
+# Submission de Kaggle por bloques con checkpoint (reanudable tras un corte)
+SUBMISSION_PATH = MODELS_DIR / 'kaggle_submission.csv'
+SUBMISSION_CHUNK_SIZE = 2000   # Filas del CSV de test puntuadas y escritas por bloque
+
+# Ajuste contextual de las probabilidades (sarcasmo / identidad con sentimiento), calculado en paralelo al embedding
+CONTEXT_ADJUST_ENABLED = False
+CONTEXT_SARCASM_BOOST = 0.25            # Sarcasmo detectado
+CONTEXT_POSITIVE_IDENTITY_SHIFT = -0.2  # Identidad mencionada con sentimiento positivo
+CONTEXT_NEGATIVE_IDENTITY_BOOST = 0.1   # Identidad mencionada con sentimiento negativo
+CONTEXT_SENTIMENT_THRESHOLD = 0.3
+
+# Puntuación distribuida por shards (cola de leases en un directorio compartido)
+DISTRIBUTED_SHARD_SIZE = 50_000    # Filas por shard
+DISTRIBUTED_LEASE_SECONDS = 300    # Sin latido durante este tiempo, el shard vuelve a la cola
+DISTRIBUTED_POLL_SECONDS = 5       # Espera entre intentos cuando no hay shards libres
@@ -0,0 +1,337 @@
+import argparse
+import json
+import logging
+import os
+import secrets
+import shutil
+import socket
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+import pandas as pd
+from modules.models import load_model
+from modules.deduplication import Deduplicator
+from modules.parallel_embedding import available_cpus
+from submission import write_submission
+from config import (
+    MODELS_DIR, SUBMISSION_CHUNK_SIZE,
+    DEDUP_ENABLED, DEDUP_THRESHOLD, DEDUP_NUM_PERM, DEDUP_NEAR_DUPLICATES,
+    DISTRIBUTED_SHARD_SIZE, DISTRIBUTED_LEASE_SECONDS, DISTRIBUTED_POLL_SECONDS
+)
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Estados de un shard = subdirectorios de la cola; se pasa de uno a otro con os.rename (atómico)
+PENDING, LEASED, DONE = 'pending', 'leased', 'done'
+
+# Un lease es `leased/<shard>.lease-<dueño>`: el dueño viaja en el nombre del archivo
+LEASE_SEP = '.lease-'
+
+
+def input_fingerprint(path):
+    """Identifica la entrada de una cola: ruta, tamaño y mtime"""
+    stat = Path(path).stat()
+    return {'input': str(Path(path).resolve()), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def _read_input(path, chunk_size):
+    """Itera DataFrames (id, comment_text) de un CSV o Parquet sin cargarlo entero"""
+    path = Path(path)
+    if path.suffix.lower() in ('.parquet', '.pq'):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise ImportError("Leer Parquet requiere 'pyarrow' (pip install pyarrow)") from e
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size, columns=['id', 'comment_text']):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(path, usecols=['id', 'comment_text'], chunksize=chunk_size)
+
+
+class ShardQueue:
+    """Cola de trabajo en un directorio compartido (NFS, disco local...) sin servicios externos
+
+    - pending/: shards sin asignar
+    - leased/: shards reclamados, renombrados a `<shard>.lease-<worker>-<nonce>`;
+      el mtime del archivo es el latido del worker
+    - done/: salida puntuada de cada shard
+
+    Un worker reclama un shard moviéndolo de pending/ a leased/ con os.rename:
+    solo un rename puede tener éxito. Mientras puntúa, refresca el mtime cada
+    `lease_seconds / 3`; un shard sin latido durante `lease_seconds` vuelve a
+    pending/ y otro worker lo retoma. Como cada reclamo usa un nombre propio,
+    un worker cuyo lease caducó no puede refrescar ni borrar el lease del
+    nuevo dueño: su archivo ya no existe. Puntuar un shard es idempotente, así
+    que un worker lento que termine después solo reescribe la misma salida.
+    """
+
+    def __init__(self, path, lease_seconds=300):
+        self.path = Path(path)
+        self.lease_seconds = lease_seconds
+        self.pending = self.path / PENDING
+        self.leased = self.path / LEASED
+        self.done = self.path / DONE
+
+    @property
+    def meta(self):
+        return json.loads((self.path / 'queue.json').read_text(encoding='utf-8'))
+
+    def exists(self):
+        return (self.path / 'queue.json').exists()
+
+    def matches(self, input_path):
+        """True si la cola se dividió a partir de este mismo archivo (sin cambios desde entonces)"""
+        return self.meta.get('fingerprint') == input_fingerprint(input_path)
+
+    def shard_names(self):
+        return [f'shard-{i:06d}.csv' for i in range(self.meta['shards'])]
+
+    @staticmethod
+    def shard_name(lease):
+        """Nombre del shard de un lease (sin el dueño)"""
+        return lease.name.split(LEASE_SEP, 1)[0]
+
+    def split(self, input_path, shard_size):
+        """Divide la entrada en shards CSV numerados (el orden define el orden de la salida final)"""
+        if self.exists():
+            raise FileExistsError(f"{self.path} ya contiene una cola; use otro directorio")
+        for directory in (self.pending, self.leased, self.done):
+            directory.mkdir(parents=True, exist_ok=True)
+        shards, rows = 0, 0
+        for chunk in _read_input(input_path, shard_size):
+            name = f'shard-{shards:06d}.csv'
+            tmp_path = self.path / f'{name}.tmp'
+            chunk.to_csv(tmp_path, index=False)
+            tmp_path.replace(self.pending / name)
+            shards += 1
+            rows += len(chunk)
+        fingerprint = input_fingerprint(input_path)
+        meta = {'input': fingerprint['input'], 'fingerprint': fingerprint, 'shards': shards, 'rows': rows, 'shard_size': shard_size}
+        (self.path / 'queue.json').write_text(json.dumps(meta, indent=2), encoding='utf-8')
+        logger.info(f"🧩 {rows} filas divididas en {shards} shards de hasta {shard_size} en {self.path}")
+        return meta
+
+    def reclaim_expired(self):
+        """Devuelve a pending/ los shards cuyo latido caducó; devuelve cuántos"""
+        reclaimed = 0
+        now = time.time()
+        for lease in self.leased.glob(f'shard-*.csv{LEASE_SEP}*'):
+            try:
+                expired = now - lease.stat().st_mtime > self.lease_seconds
+                if expired:
+                    lease.rename(self.pending / self.shard_name(lease))
+                    reclaimed += 1
+                    logger.warning(f"⏰ Lease caducado: {lease.name} vuelve a la cola")
+            except FileNotFoundError:
+                continue   # Otro worker lo terminó o lo recuperó antes
+        return reclaimed
+
+    def claim(self, worker_id):
+        """Reclama el primer shard pendiente a nombre de `worker_id`; None si no hay ninguno"""
+        for shard in sorted(self.pending.glob('shard-*.csv')):
+            # El nonce distingue reclamos sucesivos del mismo shard por el mismo worker
+            lease = self.leased / f'{shard.name}{LEASE_SEP}{worker_id}-{secrets.token_hex(4)}'
+            try:
+                # El lease empieza ahora, no cuando se creó el shard (rename conserva el mtime)
+                os.utime(shard)
+                shard.rename(lease)
+            except FileNotFoundError:
+                continue   # Otro worker ganó el rename
+            if (self.done / shard.name).exists():
+                # Ya terminado por un worker cuyo lease había caducado
+                lease.unlink(missing_ok=True)
+                continue
+            return lease
+        return None
+
+    def heartbeat(self, lease, stop, lost):
+        """Refresca el mtime del lease hasta que `stop` se active (se ejecuta en un hilo)
+
+        Si el lease caducó y volvió a la cola, el archivo de este dueño ya no
+        existe: se activa `lost` y se deja de latir.
+        """
+        while not stop.wait(self.lease_seconds / 3):
+            try:
+                os.utime(lease)
+            except FileNotFoundError:
+                logger.warning(f"⚠️ Se perdió el lease de {self.shard_name(lease)}; se termina igualmente")
+                lost.set()
+                return
+
+    def complete(self, lease, output):
+        """Publica la salida del shard y libera el lease
+
+        Solo se borra el archivo de este dueño: si el lease se perdió, ya no
+        existe y el lease del nuevo dueño queda intacto.
+        """
+        output.replace(self.done / self.shard_name(lease))
+        lease.unlink(missing_ok=True)
+
+    def finished(self):
+        return all((self.done / name).exists() for name in self.shard_names())
+
+    def merge(self, output_path):
+        """Concatena las salidas en el orden de los shards (una sola cabecera)"""
+        names = self.shard_names()
+        missing = [name for name in names if not (self.done / name).exists()]
+        if missing:
+            raise RuntimeError(f"Faltan {len(missing)} de {len(names)} shards por puntuar (p. ej. {missing[0]})")
+        output_path = Path(output_path)
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = output_path.with_name(output_path.name + '.tmp')
+        with open(tmp_path, 'wb') as output:
+            for i, name in enumerate(names):
+                with open(self.done / name, 'rb') as shard:
+                    header = shard.readline()
+                    if i == 0:
+                        output.write(header)
+                    while block := shard.read(1 << 20):
+                        output.write(block)
+        tmp_path.replace(output_path)
+        logger.info(f"✅ {len(names)} shards combinados en {output_path}")
+        return output_path
+
+    def clear(self):
+        """Borra la cola (shards, salidas y queue.json) para que el directorio pueda reutilizarse"""
+        for directory in (self.pending, self.leased, self.done):
+            shutil.rmtree(directory, ignore_errors=True)
+        (self.path / 'queue.json').unlink(missing_ok=True)
+        for tmp_path in self.path.glob('shard-*.csv.tmp'):
+            tmp_path.unlink()
+
+
+def run_worker(queue, model_path, worker_id=None, threads=None, chunk_size=SUBMISSION_CHUNK_SIZE,
+               dedup=False, poll_seconds=DISTRIBUTED_POLL_SECONDS):
+    """Reclama y puntúa shards hasta que todos estén terminados
+
+    Returns:
+        Número de shards puntuados por este worker
+    """
+    worker_id = worker_id or f'{socket.gethostname()}-{os.getpid()}'
+    model = load_model(model_path, use_cache=False)
+    if threads and getattr(model, 'use_llm', True):
+        # El transformer se carga al primer embed: basta con fijar sus hilos aquí
+        model.embedder.num_threads = threads
+    deduplicator = None
+    if dedup:
+        deduplicator = Deduplicator(threshold=DEDUP_THRESHOLD, num_perm=DEDUP_NUM_PERM, near_duplicates=DEDUP_NEAR_DUPLICATES)
+
+    scored = 0
+    while True:
+        queue.reclaim_expired()
+        lease = queue.claim(worker_id)
+        if lease is None:
+            if queue.finished():
+                break
+            time.sleep(poll_seconds)   # Quedan shards en manos de otros workers
+            continue
+
+        shard = queue.shard_name(lease)
+        logger.info(f"🔒 [{worker_id}] {shard} reclamado")
+        stop, lost = threading.Event(), threading.Event()
+        beat = threading.Thread(target=queue.heartbeat, args=(lease, stop, lost), daemon=True)
+        beat.start()
+        try:
+            output = lease.with_name(lease.name.replace(LEASE_SEP, '.') + '.out')
+            report = write_submission(model, lease, output, chunk_size=chunk_size, dedup=deduplicator)
+        finally:
+            stop.set()
+            beat.join()
+        queue.complete(lease, output)
+        if lost.is_set():
+            logger.info(f"♻️ [{worker_id}] {shard} terminado tras perder el lease (la salida es idempotente)")
+        scored += 1
+        logger.info(f"✅ [{worker_id}] {shard}: {report['rows']} filas a {report['throughput']:.0f} textos/s")
+    logger.info(f"🏁 [{worker_id}] Sin shards pendientes ({scored} puntuados por este worker)")
+    return scored
+
+
+def run_local(input_path, output_path, queue_dir, model_path, workers, shard_size, lease_seconds, dedup=False):
+    """Coordinador y N workers en esta máquina (procesos independientes, como hosts distintos)
+
+    Una cola existente solo se reanuda si se dividió a partir de la misma
+    entrada (ruta, tamaño y mtime); si no, se aborta en lugar de publicar
+    puntuaciones de otro archivo. Tras combinar la salida, la cola se borra.
+    """
+    queue = ShardQueue(queue_dir, lease_seconds)
+    if not queue.exists():
+        queue.split(input_path, shard_size)
+    elif queue.matches(input_path):
+        logger.info(f"⏯️ Reanudando la cola de {queue.path} ({queue.meta['rows']} filas)")
+    else:
+        raise ValueError(f"La cola de {queue.path} corresponde a otra entrada ({queue.meta.get('input')}); "
+                         f"use otro directorio con --queue o bórrela para puntuar {input_path}")
+    threads = max(1, available_cpus() // workers)
+    command = [
+        sys.executable, str(Path(__file__).resolve()), 'worker', str(queue.path),
+        '--model', str(model_path), '--threads', str(threads), '--lease-seconds', str(lease_seconds)
+    ]
+    if dedup:
+        command.append('--dedup')
+
+    start = time.perf_counter()
+    logger.info(f"🚀 Lanzando {workers} workers locales ({threads} hilos c/u)...")
+    processes = [subprocess.Popen(command + ['--worker-id', f'local-{i}']) for i in range(workers)]
+    failed = [i for i, process in enumerate(processes) if process.wait() != 0]
+    if failed:
+        if not queue.finished():
+            raise RuntimeError(f"Workers con error: {failed}; la cola queda en {queue.path} para reanudarla")
+        logger.warning(f"⚠️ Workers con error: {failed} (el resto terminó todos los shards)")
+    queue.merge(output_path)
+    seconds = time.perf_counter() - start
+    rows = queue.meta['rows']
+    queue.clear()
+    logger.info(f"⏱️ {rows} filas puntuadas en {seconds:.1f}s con {workers} workers ({rows / seconds:.0f} textos/s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Puntuación por shards con una cola de leases en un directorio compartido")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    split = subparsers.add_parser('split', help="Divide un CSV/Parquet (id, comment_text) en shards")
+    split.add_argument('input')
+    split.add_argument('queue', help="Directorio compartido de la cola")
+    split.add_argument('--shard-size', type=int, default=DISTRIBUTED_SHARD_SIZE)
+
+    worker = subparsers.add_parser('worker', help="Reclama y puntúa shards hasta vaciar la cola")
+    worker.add_argument('queue')
+    worker.add_argument('--model', default=str(MODELS_DIR / 'llm_toxicity_model'))
+    worker.add_argument('--worker-id')
+    worker.add_argument('--threads', type=int, help="Hilos de torch de este worker")
+    worker.add_argument('--lease-seconds', type=float, default=DISTRIBUTED_LEASE_SECONDS)
+    worker.add_argument('--dedup', action='store_true', help="Puntuar un solo texto por grupo de duplicados")
+
+    merge = subparsers.add_parser('merge', help="Combina las salidas de los shards en orden")
+    merge.add_argument('queue')
+    merge.add_argument('output')
+
+    local = subparsers.add_parser('run-local', help="split + N workers locales + merge")
+    local.add_argument('input')
+    local.add_argument('output')
+    local.add_argument('--queue', default=str(MODELS_DIR / 'scoring_queue'))
+    local.add_argument('--model', default=str(MODELS_DIR / 'llm_toxicity_model'))
+    local.add_argument('--workers', type=int, default=2)
+    local.add_argument('--shard-size', type=int, default=DISTRIBUTED_SHARD_SIZE)
+    local.add_argument('--lease-seconds', type=float, default=DISTRIBUTED_LEASE_SECONDS)
+    local.add_argument('--dedup', action='store_true', help="Puntuar un solo texto por grupo de duplicados")
+    args = parser.parse_args()
+
+    if args.command == 'split':
+        ShardQueue(args.queue).split(args.input, args.shard_size)
+    elif args.command == 'worker':
+        queue = ShardQueue(args.queue, args.lease_seconds)
+        run_worker(queue, args.model, worker_id=args.worker_id, threads=args.threads,
+                   dedup=DEDUP_ENABLED or args.dedup)
+    elif args.command == 'merge':
+        ShardQueue(args.queue).merge(args.output)
+    else:
+        run_local(args.input, args.output, args.queue, args.model, args.workers, args.shard_size,
+                  args.lease_seconds, dedup=DEDUP_ENABLED or args.dedup)
+
+
+if __name__ == "__main__":
+    main()
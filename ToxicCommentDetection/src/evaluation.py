@@ -1,18 +1,21 @@
 from sklearn.metrics import roc_auc_score, accuracy_score, confusion_matrix, f1_score
+import argparse
+import numpy as np
 import pandas as pd
 
-def evaluate_model(model, X_test, y_test):
+def evaluate_model(model, X_test, y_test, threshold=0.5):
     """
     Evalúa el modelo con métricas estándar
     Args:
         model: Modelo entrenado
         X_test: Datos de prueba vectorizados
         y_test: Etiquetas verdaderas
+        threshold: Umbral de decisión
     Returns:
         Diccionario con métricas de evaluación
     """
     y_pred = model.predict(X_test)
-    y_pred_binary = (y_pred >= 0.5).astype(int)
+    y_pred_binary = (y_pred >= threshold).astype(int)
     
     tn, fp, fn, tp = confusion_matrix(y_test, y_pred_binary).ravel()
     
@@ -26,7 +29,7 @@ def evaluate_model(model, X_test, y_test):
         'fn_rate': fn / (fn + tp) if (fn + tp) > 0 else 0
     }
 
-def bias_analysis(model, vectorizer, test_df, identity_terms):
+def bias_analysis(model, vectorizer, test_df, identity_terms, scores=None, threshold=0.5):
     """
     Analiza el sesgo del modelo por grupos de identidad
     Args:
@@ -34,6 +37,8 @@ def bias_analysis(model, vectorizer, test_df, identity_terms):
         vectorizer: Vectorizador TF-IDF ajustado
         test_df: DataFrame con datos de prueba
         identity_terms: Diccionario con términos de identidad
+        scores: Puntuaciones ya calculadas (evita vectorizar y predecir de nuevo)
+        threshold: Umbral de decisión
     Returns:
         Diccionario con métricas de sesgo por categoría
     """
@@ -43,23 +48,26 @@ def bias_analysis(model, vectorizer, test_df, identity_terms):
     if 'clean_text' not in test_df.columns:
         from modules.text_processing import TextCleaner
         cleaner = TextCleaner()
-        test_df['clean_text'] = test_df['comment_text'].apply(cleaner.clean)
+        test_df['clean_text'] = cleaner.clean_batch(test_df['comment_text'])
     
-    # Vectorizar el texto
-    X_test = vectorizer.transform(test_df['clean_text'])
-    
-    # Obtener predicciones
-    y_pred = (model.predict(X_test) >= 0.5).astype(int)
+    # Vectorizar y predecir solo si no se entregan las puntuaciones
+    if scores is None:
+        scores = model.predict(vectorizer.transform(test_df['clean_text']))
+    y_pred = (np.asarray(scores) >= threshold).astype(int)
     
     # Solo proceder si tenemos labels verdaderos
     if 'target_binary' in test_df.columns:
         y_test = test_df['target_binary']
         
-        for category, terms in identity_terms.items():
+        # Una sola pasada sobre el texto para todas las categorías
+        from modules.identity_detection import IdentityDetector
+        identity_matrix = IdentityDetector(identity_terms).detect_batch(test_df['clean_text'])
+        
+        for category in identity_terms:
             # Filtrar comentarios que mencionan esta categoría
-            mask = test_df['clean_text'].str.contains('|'.join(terms), case=False, na=False)
+            mask = identity_matrix[category]
             
-            if sum(mask) == 0:
+            if mask.sum() == 0:
                 continue
                 
             # Calcular métricas para este grupo
@@ -68,9 +76,249 @@ def bias_analysis(model, vectorizer, test_df, identity_terms):
             results[category] = {
                 'fp_rate': fp / (fp + tn) if (fp + tn) > 0 else 0,
                 'fn_rate': fn / (fn + tp) if (fn + tp) > 0 else 0,
-                'support': sum(mask),
+                'support': int(mask.sum()),
                 'precision': tp / (tp + fp) if (tp + fp) > 0 else 0,
                 'recall': tp / (tp + fn) if (tp + fn) > 0 else 0
             }
     
-    return results
\ No newline at end of file
+    return results
+
+
+class ScoreHistogram:
+    """Conteos de positivos y negativos por valor distinto de puntuación
+
+    Es la estadística suficiente para el barrido de umbrales y para el AUC:
+    ocupa memoria proporcional al número de puntuaciones distintas, no al de
+    filas. Con `decimals` se redondean las puntuaciones para acotarla.
+    """
+
+    def __init__(self, decimals=6):
+        self.decimals = decimals
+        self.values = np.empty(0, dtype=np.float64)
+        self.pos = np.empty(0, dtype=np.int64)
+        self.neg = np.empty(0, dtype=np.int64)
+
+    def add(self, scores, labels):
+        scores = np.asarray(scores, dtype=np.float64)
+        labels = np.asarray(labels).astype(bool)
+        if self.decimals is not None:
+            scores = np.round(scores, self.decimals)
+        values, inverse = np.unique(np.concatenate([self.values, scores]), return_inverse=True)
+        old, new = inverse[:len(self.values)], inverse[len(self.values):]
+        pos = np.bincount(old, weights=self.pos, minlength=len(values)) + np.bincount(new[labels], minlength=len(values))
+        neg = np.bincount(old, weights=self.neg, minlength=len(values)) + np.bincount(new[~labels], minlength=len(values))
+        self.values, self.pos, self.neg = values, pos.astype(np.int64), neg.astype(np.int64)
+
+    def on_grid(self, grid):
+        """Conteos (pos, neg) reindexados sobre una rejilla que contiene a `values`"""
+        idx = np.searchsorted(grid, self.values)
+        pos = np.zeros(len(grid), dtype=np.int64)
+        neg = np.zeros(len(grid), dtype=np.int64)
+        pos[idx] = self.pos
+        neg[idx] = self.neg
+        return pos, neg
+
+
+def histogram_auc(pos, neg):
+    """AUC (Mann-Whitney, empates = 0.5) a partir de conteos sobre una rejilla ascendente"""
+    n_pos, n_neg = pos.sum(), neg.sum()
+    if n_pos == 0 or n_neg == 0:
+        return float('nan')
+    neg_below = np.cumsum(neg) - neg
+    wins = np.dot(pos.astype(np.float64), neg_below) + 0.5 * np.dot(pos.astype(np.float64), neg)
+    return float(wins / (float(n_pos) * float(n_neg)))
+
+
+def power_mean(values, p):
+    values = np.asarray(values, dtype=np.float64)
+    return float(np.mean(values ** p) ** (1 / p))
+
+
+class StreamingEvaluator:
+    """Evaluación por bloques sobre puntuaciones ya calculadas
+
+    Cada `update` acumula histogramas del bloque (global y por subgrupo de
+    identidad); el conjunto de prueba nunca tiene que estar entero en memoria.
+    El fondo (background) de cada subgrupo se obtiene restando su histograma
+    del global.
+    """
+
+    def __init__(self, decimals=6):
+        self.decimals = decimals
+        self.overall = ScoreHistogram(decimals)
+        self.subgroups = {}
+        self.rows = 0
+
+    def update(self, scores, labels, subgroup_masks=None):
+        """
+        Añade un bloque
+        Args:
+            scores: Probabilidades de toxicidad del bloque
+            labels: Etiquetas verdaderas (0/1)
+            subgroup_masks: DataFrame o diccionario {subgrupo: máscara booleana}
+        """
+        scores = np.asarray(scores, dtype=np.float64)
+        labels = np.asarray(labels).astype(bool)
+        self.overall.add(scores, labels)
+        self.rows += len(scores)
+        if subgroup_masks is not None:
+            for name in subgroup_masks:
+                mask = np.asarray(subgroup_masks[name]).astype(bool)
+                histogram = self.subgroups.setdefault(name, ScoreHistogram(self.decimals))
+                if mask.any():
+                    histogram.add(scores[mask], labels[mask])
+        return self
+
+    def auc(self):
+        return histogram_auc(self.overall.pos, self.overall.neg)
+
+    def threshold_sweep(self):
+        """
+        Matriz de confusión y métricas para cada umbral distinto (predicción: score >= umbral)
+        Returns:
+            DataFrame ordenado por umbral ascendente
+        """
+        pos, neg = self.overall.pos, self.overall.neg
+        # Sumas acumuladas desde el umbral más alto: positivos predichos con score >= t
+        tp = np.cumsum(pos[::-1])[::-1]
+        fp = np.cumsum(neg[::-1])[::-1]
+        fn = pos.sum() - tp
+        tn = neg.sum() - fp
+        with np.errstate(divide='ignore', invalid='ignore'):
+            precision = np.where(tp + fp > 0, tp / (tp + fp), 0.0)
+            recall = np.where(tp + fn > 0, tp / (tp + fn), 0.0)
+            f1 = np.where(precision + recall > 0, 2 * precision * recall / (precision + recall), 0.0)
+            fpr = np.where(fp + tn > 0, fp / (fp + tn), 0.0)
+            fnr = np.where(fn + tp > 0, fn / (fn + tp), 0.0)
+        return pd.DataFrame({
+            'threshold': self.overall.values,
+            'tp': tp, 'fp': fp, 'tn': tn, 'fn': fn,
+            'precision': precision, 'recall': recall, 'f1': f1,
+            'fp_rate': fpr, 'fn_rate': fnr
+        })
+
+    def best_threshold(self, metric='f1'):
+        """Fila del barrido que maximiza `metric`"""
+        sweep = self.threshold_sweep()
+        return sweep.loc[sweep[metric].idxmax()].to_dict()
+
+    def metrics_at(self, threshold):
+        """Métricas para un umbral dado (mismas claves que evaluate_model)"""
+        sweep = self.threshold_sweep()
+        above = sweep[sweep['threshold'] >= threshold]
+        pos, neg = int(self.overall.pos.sum()), int(self.overall.neg.sum())
+        if above.empty:
+            tp, fp = 0, 0
+        else:
+            tp, fp = int(above['tp'].iloc[0]), int(above['fp'].iloc[0])
+        fn, tn = pos - tp, neg - fp
+        return {
+            'auc': self.auc(),
+            'accuracy': (tp + tn) / self.rows if self.rows else 0,
+            'f1': 2 * tp / (2 * tp + fp + fn) if tp else 0,
+            'precision': tp / (tp + fp) if (tp + fp) > 0 else 0,
+            'recall': tp / (tp + fn) if (tp + fn) > 0 else 0,
+            'fp_rate': fp / (fp + tn) if (fp + tn) > 0 else 0,
+            'fn_rate': fn / (fn + tp) if (fn + tp) > 0 else 0
+        }
+
+    def bias_metrics(self):
+        """
+        Métricas de sesgo de Jigsaw por subgrupo de identidad
+        Returns:
+            DataFrame con subgroup_auc, bpsn_auc (fondo positivo, subgrupo
+            negativo) y bnsp_auc (fondo negativo, subgrupo positivo)
+        """
+        grid = self.overall.values
+        rows = []
+        for name, histogram in self.subgroups.items():
+            sub_pos, sub_neg = histogram.on_grid(grid)
+            bg_pos, bg_neg = self.overall.pos - sub_pos, self.overall.neg - sub_neg
+            rows.append({
+                'subgroup': name,
+                'subgroup_size': int(sub_pos.sum() + sub_neg.sum()),
+                'subgroup_auc': histogram_auc(sub_pos, sub_neg),
+                'bpsn_auc': histogram_auc(bg_pos, sub_neg),
+                'bnsp_auc': histogram_auc(sub_pos, bg_neg)
+            })
+        return pd.DataFrame(rows, columns=['subgroup', 'subgroup_size', 'subgroup_auc', 'bpsn_auc', 'bnsp_auc'])
+
+    def final_metric(self, power=-5, overall_weight=0.25):
+        """Métrica final de Jigsaw: AUC global ponderado con las medias potenciales de los sesgos"""
+        bias = self.bias_metrics()
+        bias_scores = [
+            power_mean(bias[column].dropna(), power)
+            for column in ('subgroup_auc', 'bpsn_auc', 'bnsp_auc')
+            if bias[column].notna().any()
+        ]
+        if not bias_scores:
+            return self.auc()
+        return overall_weight * self.auc() + (1 - overall_weight) * float(np.mean(bias_scores))
+
+
+def evaluate_stream(chunks, identity_terms=None, identity_columns=None, score_column='prediction',
+                    label_column='target_binary', decimals=6):
+    """
+    Evalúa un conjunto grande bloque a bloque
+    Args:
+        chunks: Iterable de DataFrames (p. ej. pd.read_csv(..., chunksize=...))
+        identity_terms: Términos de identidad para detectar subgrupos en comment_text
+        identity_columns: Columnas de identidad de Jigsaw (subgrupo si >= 0.5); tienen prioridad
+        score_column: Columna con la probabilidad predicha
+        label_column: Columna con la etiqueta (si es continua se binariza en 0.5)
+        decimals: Redondeo de puntuaciones (None = exacto)
+    Returns:
+        StreamingEvaluator con todo acumulado
+    """
+    evaluator = StreamingEvaluator(decimals)
+    detector = cleaner = None
+    if identity_terms and not identity_columns:
+        from modules.identity_detection import IdentityDetector
+        from modules.text_processing import TextCleaner
+        detector, cleaner = IdentityDetector(identity_terms), TextCleaner()
+
+    for chunk in chunks:
+        labels = chunk[label_column]
+        if labels.dtype == 'float64':
+            labels = labels >= 0.5
+        if identity_columns:
+            masks = {col: chunk[col].fillna(0).to_numpy() >= 0.5 for col in identity_columns}
+        elif detector is not None:
+            clean_text = cleaner.clean_batch(chunk['comment_text'].fillna('').astype(str))
+            identity_matrix = detector.detect_batch(clean_text)
+            masks = {category: identity_matrix[category].to_numpy() for category in identity_terms}
+        else:
+            masks = None
+        evaluator.update(chunk[score_column].to_numpy(), labels.to_numpy(), masks)
+    return evaluator
+
+
+if __name__ == "__main__":
+    from config import IDENTITY_TERMS
+
+    parser = argparse.ArgumentParser(description="Evaluación por bloques de puntuaciones ya calculadas")
+    parser.add_argument('scores', help="CSV con la puntuación, la etiqueta y comment_text o columnas de identidad")
+    parser.add_argument('--score-column', default='prediction')
+    parser.add_argument('--label-column', default='target_binary')
+    parser.add_argument('--identity-columns', help="Columnas de identidad separadas por comas (formato Jigsaw)")
+    parser.add_argument('--chunksize', type=int, default=200_000)
+    parser.add_argument('--decimals', type=int, default=6)
+    parser.add_argument('--sweep-output', help="CSV donde guardar el barrido completo de umbrales")
+    args = parser.parse_args()
+
+    identity_columns = args.identity_columns.split(',') if args.identity_columns else None
+    evaluator = evaluate_stream(
+        pd.read_csv(args.scores, chunksize=args.chunksize),
+        identity_terms=None if identity_columns else IDENTITY_TERMS,
+        identity_columns=identity_columns,
+        score_column=args.score_column,
+        label_column=args.label_column,
+        decimals=args.decimals
+    )
+    best = evaluator.best_threshold('f1')
+    print(f"📊 {evaluator.rows} filas | AUC {evaluator.auc():.4f} | métrica final Jigsaw {evaluator.final_metric():.4f}")
+    print(f"🎯 Mejor umbral por F1: {best['threshold']:.4f} (F1 {best['f1']:.4f}, precisión {best['precision']:.4f}, recall {best['recall']:.4f})")
+    print(evaluator.bias_metrics().to_string(index=False))
+    if args.sweep_output:
+        evaluator.threshold_sweep().to_csv(args.sweep_output, index=False)
+        print(f"✅ Barrido de umbrales guardado en {args.sweep_output}")
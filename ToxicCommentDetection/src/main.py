@@ -1,32 +1,71 @@
 import sys
-import os
-import pandas as pd
-import joblib
 from pathlib import Path
-from config import DATA_PROCESSED, MODELS_DIR
+from config import (
+    DATA_RAW, MODELS_DIR, EMBEDDING_STORE_DIR, SUBMISSION_PATH, SUBMISSION_CHUNK_SIZE,
+    TRAIN_OUT_OF_CORE, TRAIN_WORK_DIR, TRAIN_EMBED_DTYPE, TRAIN_CHUNK_SIZE, TRAIN_MEMORY_BUDGET_MB,
+    METRICS_ENABLED, METRICS_JSONL_PATH, METRICS_PROM_PATH,
+    DEDUP_ENABLED, DEDUP_THRESHOLD, DEDUP_NUM_PERM, DEDUP_NEAR_DUPLICATES,
+    CASCADE_ENABLED, CASCADE_LOW, CASCADE_HIGH, TEST_SIZE, RANDOM_STATE,
+    REDUCTION_DIM, REDUCTION_METHOD, REDUCTION_REPORT, REDUCTION_REPORT_DIMS,
+    IDENTITY_TERMS, CONTEXT_ADJUST_ENABLED, CONTEXT_SARCASM_BOOST, CONTEXT_POSITIVE_IDENTITY_SHIFT,
+    CONTEXT_NEGATIVE_IDENTITY_BOOST, CONTEXT_SENTIMENT_THRESHOLD
+)
 from modules.models import ToxicityModel
+from modules.deduplication import Deduplicator
+from modules.cascade import CascadeModel
+from modules.contextual_adjustment import ContextualAdjuster
+from modules.reduction import compare_reductions
+from sklearn.model_selection import train_test_split
+from modules.metrics import enable_metrics, JsonLinesSink, PrometheusSink
 from preprocessing import load_and_preprocess
+from submission import write_submission
 import logging
-import numpy as np
+import time
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-# Descargar recursos primero (desde la raíz)
-try:
-    # Añadir raíz al path para importar setup_resources
-    sys.path.append(str(Path(__file__).parent.parent))
-    from setup_resources import download_essential_resources
-    logger.info("Descargando recursos esenciales...")
-    download_essential_resources()
-    logger.info("Recursos descargados exitosamente")
-except ImportError as e:
-    logger.error(f"No se pudo importar setup_resources: {str(e)}")
-    sys.exit(1)
-except Exception as e:
-    logger.error(f"Error crítico al descargar recursos: {str(e)}")
-    sys.exit(1)
+# Añadir raíz al path para importar setup_resources
+sys.path.append(str(Path(__file__).parent.parent))
+
+def prepare_resources(model):
+    """Verifica los recursos locales (sin descargar) y entrega el LLM ya cargado al embedder"""
+    from setup_resources import ensure_resources
+    result = ensure_resources(
+        download=False,
+        model_name=model.embedder.model_name,
+        load_model=True
+    )
+    timings = result['timings']
+    if result['missing']:
+        logger.warning(f"⚠️ Recursos faltantes: {', '.join(result['missing'])} "
+                       f"(ejecute 'python setup_resources.py' para descargarlos)")
+    if 'model' in result:
+        model.embedder.attach(result['tokenizer'], result['model'])
+    logger.info(f"⏱️ Recursos verificados en {timings['check']:.2f}s "
+                f"({'sello válido' if result['stamp_hit'] else 'comprobación completa'}), "
+                f"carga del LLM {timings.get('model_load', 0):.2f}s, total {timings['total']:.2f}s")
+
+def held_out_split(train):
+    """Conjunto separado sin textos repetidos del entrenamiento (el sobremuestreo puede duplicarlos)"""
+    train_part, held_out = train_test_split(
+        train, test_size=TEST_SIZE, random_state=RANDOM_STATE, stratify=train['target_binary']
+    )
+    return train_part, held_out[~held_out['comment_text'].isin(train_part['comment_text'])]
+
+def report_reductions(model, train):
+    """Compara AUC, memoria y tiempos del bosque con embeddings completos y reducidos"""
+    train_part, held_out = held_out_split(train)
+    X_train = model.embedder.embed(train_part['comment_text'].tolist())
+    X_test = model.embedder.embed(held_out['comment_text'].tolist())
+    report = compare_reductions(
+        X_train, train_part['target_binary'].values, X_test, held_out['target_binary'].values,
+        model.clf, n_components=REDUCTION_REPORT_DIMS, method=REDUCTION_METHOD
+    )
+    logger.info(f"📉 Reducción de embeddings (pooling '{model.embedder.pooling}', {len(held_out)} textos separados):\n"
+                f"{report.to_string(index=False, float_format=lambda v: f'{v:.4f}')}")
+    return report
 
 def run_test_cases(model):
     """Ejecuta casos de prueba críticos y devuelve resultados"""
@@ -48,9 +87,16 @@ def run_test_cases(model):
     logger.info("\nEvaluando casos de prueba críticos:")
     results = []
     
-    for name, text, expected in test_cases:
+    # Un único lote para todos los casos (embedder y bosque ven todo junto)
+    try:
+        probas = model.predict_batch([text for _, text, _ in test_cases])
+    except Exception as e:
+        logger.error(f"Error procesando casos de prueba: {str(e)}")
+        return [(name, text, -1, -1, expected, False) for name, text, expected in test_cases]
+    
+    for (name, text, expected), proba in zip(test_cases, probas):
         try:
-            proba = model.predict(text)
+            proba = float(proba)
             prediction = 1 if proba >= 0.5 else 0
             correct = prediction == expected
             results.append((name, text, proba, prediction, expected, correct))
@@ -102,14 +148,20 @@ def generate_performance_report(results, model):
     return "\n".join(report)
 
 def main():
+    start_time = time.perf_counter()
     print("\n" + "="*60)
     print("SISTEMA DE DETECCIÓN DE TOXICIDAD CON LLMs")
     print("="*60)
     
+    if METRICS_ENABLED:
+        MODELS_DIR.mkdir(parents=True, exist_ok=True)
+        enable_metrics([JsonLinesSink(METRICS_JSONL_PATH), PrometheusSink(METRICS_PROM_PATH)])
+        logger.info(f"📈 Instrumentación activa: {METRICS_JSONL_PATH}, {METRICS_PROM_PATH}")
+    
     try:
         # 1. Cargar datos
         logger.info("\nCargando y preprocesando datos...")
-        train, test = load_and_preprocess()
+        train, test = load_and_preprocess(balance=not TRAIN_OUT_OF_CORE)
         
         # Estadísticas de datos
         logger.info(f"\nDatos cargados: {len(train)} ejemplos de entrenamiento")
@@ -120,10 +172,52 @@ def main():
         
         # 2. Entrenar modelo con LLM
         logger.info("\nInicializando modelo con embeddings de LLM...")
-        model = ToxicityModel(use_llm=True)
+        adjuster = None
+        if CONTEXT_ADJUST_ENABLED:
+            adjuster = ContextualAdjuster(
+                IDENTITY_TERMS,
+                sarcasm_boost=CONTEXT_SARCASM_BOOST,
+                positive_identity_shift=CONTEXT_POSITIVE_IDENTITY_SHIFT,
+                negative_identity_boost=CONTEXT_NEGATIVE_IDENTITY_BOOST,
+                sentiment_threshold=CONTEXT_SENTIMENT_THRESHOLD
+            )
+        if CASCADE_ENABLED:
+            # TF-IDF para todo y LLM solo para la banda de incertidumbre
+            model = CascadeModel(low=CASCADE_LOW, high=CASCADE_HIGH, adjuster=adjuster,
+                                 reduce_dim=REDUCTION_DIM, reduce_method=REDUCTION_METHOD)
+        else:
+            model = ToxicityModel(use_llm=True, reduce_dim=REDUCTION_DIM, reduce_method=REDUCTION_METHOD,
+                                  adjuster=adjuster)
+        prepare_resources(model)
+        
+        # Backends cuantizados/ONNX: verificar la deriva frente a fp32
+        if model.embedder.backend_name != 'torch':
+            parity = model.embedder.parity_check(train['comment_text'].head(200).tolist())
+            logger.info(f"🔬 Paridad backend '{parity['backend']}' vs fp32: coseno medio {parity['mean_cosine']:.6f}, mínimo {parity['min_cosine']:.6f}")
+        
+        logger.info(f"⏱️ Arranque completado en {time.perf_counter() - start_time:.2f}s")
+        
+        if REDUCTION_REPORT:
+            logger.info("\nComparando embeddings completos y reducidos...")
+            report_reductions(model, train)
         
         logger.info("\nEntrenando modelo...")
-        model.train(train['comment_text'], train['target_binary'])
+        if CASCADE_ENABLED:
+            # Conjunto separado para comparar la cascada con solo LLM
+            train_part, held_out = held_out_split(train)
+            model.train(train_part['comment_text'], train_part['target_binary'])
+            evaluation = model.evaluate(held_out['comment_text'], held_out['target_binary'])
+            logger.info(f"🪜 Cascada ({CASCADE_LOW}, {CASCADE_HIGH}) sobre {evaluation['texts']} textos separados: "
+                        f"escalado {evaluation['escalation_rate']:.1%} | AUC cascada {evaluation['auc_cascade']:.4f} "
+                        f"vs LLM {evaluation['auc_llm']:.4f} (Δ {evaluation['auc_delta']:+.4f}) | "
+                        f"{evaluation['throughput_cascade']:.0f} vs {evaluation['throughput_llm']:.0f} textos/s")
+        elif TRAIN_OUT_OF_CORE:
+            model.train_out_of_core(
+                train['comment_text'], train['target_binary'], TRAIN_WORK_DIR,
+                dtype=TRAIN_EMBED_DTYPE, chunk_size=TRAIN_CHUNK_SIZE, memory_budget_mb=TRAIN_MEMORY_BUDGET_MB
+            )
+        else:
+            model.train(train['comment_text'], train['target_binary'], store_path=EMBEDDING_STORE_DIR)
         
         # 3. Evaluar con casos de prueba
         logger.info("\nEvaluando modelo con casos críticos...")
@@ -135,32 +229,24 @@ def main():
         
         # 5. Guardar modelo
         MODELS_DIR.mkdir(parents=True, exist_ok=True)
-        model_path = MODELS_DIR / 'llm_toxicity_model.joblib'
-        joblib.dump(model, model_path)
+        model_path = model.save(MODELS_DIR / ('cascade_toxicity_model' if CASCADE_ENABLED else 'llm_toxicity_model'))
         logger.info(f"\nModelo guardado en: {model_path}")
         
-        # 6. Preparar submission para Kaggle (con procesamiento en chunks)
+        # 6. Preparar submission para Kaggle (por bloques, reanudable con submission.py)
         if not test.empty:
             logger.info(f"\nGenerando predicciones para {len(test)} textos...")
             
-            # Procesar en chunks para evitar sobrecarga de memoria
-            chunk_size = 100
-            test_predictions = []
-            
-            for i in range(0, len(test), chunk_size):
-                chunk = test.iloc[i:i+chunk_size]
-                chunk_texts = chunk['comment_text'].tolist()
-                test_predictions.extend([model.predict(text) for text in chunk_texts])
-                processed = min(i+chunk_size, len(test))
-                logger.info(f"📦 Procesados {processed}/{len(test)} textos ({processed/len(test):.1%})")
-            
-            submission = pd.DataFrame({
-                'id': test['id'],
-                'prediction': test_predictions
-            })
-            submission_path = MODELS_DIR / 'kaggle_submission.csv'
-            submission.to_csv(submission_path, index=False)
-            logger.info(f"✅ Submission generada: {submission_path}")
+            # Puntuar un solo representante por grupo de duplicados dentro de cada bloque
+            dedup = None
+            if DEDUP_ENABLED:
+                dedup = Deduplicator(threshold=DEDUP_THRESHOLD, num_perm=DEDUP_NUM_PERM,
+                                     near_duplicates=DEDUP_NEAR_DUPLICATES)
+            write_submission(model, DATA_RAW / 'test.csv', SUBMISSION_PATH, chunk_size=SUBMISSION_CHUNK_SIZE,
+                             dedup=dedup, model_path=model_path)
+            if model.embedder.cache is not None:
+                stats = model.embedder.cache.stats()
+                logger.info(f"🗃️ Caché de embeddings: {stats['hits']} aciertos, {stats['misses']} fallos ({stats['hit_rate']:.1%})")
+        model.embedder.close()
         
         logger.info("\n¡Proceso completado exitosamente!")
         
@@ -1,6 +1,7 @@
 from .text_processing import TextCleaner
 from .identity_detection import IdentityDetector
 from .context_analysis import ContextAnalyzer
+from .contextual_adjustment import ContextualAdjuster
 from .models import ToxicityModel
 
-__all__ = ['TextCleaner', 'IdentityDetector', 'ContextAnalyzer', 'ToxicityModel']
\ No newline at end of file
+__all__ = ['TextCleaner', 'IdentityDetector', 'ContextAnalyzer', 'ContextualAdjuster', 'ToxicityModel']
\ No newline at end of file
@@ -0,0 +1,166 @@
+from pathlib import Path
+import json
+import time
+import numpy as np
+import pandas as pd
+from sklearn.metrics import roc_auc_score
+from .metrics import get_metrics
+from .models import ToxicityModel
+from .contextual_adjustment import ContextualAdjuster
+
+
+class CascadeModel:
+    """Cascada de dos cabezas: TF-IDF para todo, LLM solo para los casos dudosos
+
+    Cada comentario se puntúa primero con TF-IDF + RandomForest (barato). Solo
+    los que quedan dentro de la banda de incertidumbre (`low` < p < `high`) se
+    reenvían al modelo de embeddings LLM, cuya probabilidad reemplaza a la
+    de TF-IDF. El ajuste contextual opcional (`adjuster`) se aplica una sola vez
+    sobre la probabilidad final.
+    """
+
+    def __init__(self, low=0.2, high=0.8, use_cache=None, adjuster=None, **embedder_options):
+        if not 0 <= low <= high <= 1:
+            raise ValueError(f"Banda de incertidumbre inválida: ({low}, {high})")
+        self.low = low
+        self.high = high
+        self.threshold = 0.5
+        self.adjuster = adjuster
+        self.fast = ToxicityModel(use_llm=False)
+        self.slow = ToxicityModel(use_llm=True, use_cache=use_cache, **embedder_options)
+        self.texts_seen = 0
+        self.texts_escalated = 0
+
+    # El embedder y el clasificador de referencia son los del modelo LLM
+    @property
+    def embedder(self):
+        return self.slow.embedder
+
+    @property
+    def clf(self):
+        return self.slow.clf
+
+    def train(self, texts, labels):
+        print("⚡ Entrenando cabeza rápida (TF-IDF)...")
+        self.fast.train(texts, labels)
+        print("🧠 Entrenando cabeza LLM...")
+        self.slow.train(texts, labels)
+
+    def uncertain(self, probas):
+        """Máscara de probabilidades dentro de la banda de incertidumbre"""
+        return (probas > self.low) & (probas < self.high)
+
+    def predict_batch(self, texts):
+        """Probabilidades de toxicidad; el LLM solo se ejecuta para los textos dudosos"""
+        if isinstance(texts, str):
+            texts = [texts]
+        elif isinstance(texts, pd.Series):
+            texts = texts.tolist()
+        else:
+            texts = list(texts)
+
+        context = self.adjuster.submit(texts) if self.adjuster is not None and texts else None
+        probas = self.fast.predict_batch(texts)
+        escalate = np.flatnonzero(self.uncertain(probas))
+        if len(escalate):
+            probas[escalate] = self.slow.predict_batch([texts[i] for i in escalate])
+        if context is not None:
+            probas = self.adjuster.adjust(probas, context.result())
+
+        self.texts_seen += len(texts)
+        self.texts_escalated += len(escalate)
+        metrics = get_metrics()
+        metrics.incr('cascade.texts', len(texts))
+        metrics.incr('cascade.escalated', len(escalate))
+        return probas
+
+    def predict(self, text):
+        probas = self.predict_batch(text)
+        if isinstance(text, str):
+            return float(probas[0])
+        return probas
+
+    @property
+    def escalation_rate(self):
+        return self.texts_escalated / self.texts_seen if self.texts_seen else 0.0
+
+    def evaluate(self, texts, labels):
+        """Compara cascada, solo LLM y solo TF-IDF sobre un conjunto separado
+
+        Los tiempos se miden con la caché de embeddings desactivada: si no, la
+        pasada de solo LLM leería de caché los textos que la cascada acaba de
+        embeber y la comparación de throughput no sería real.
+
+        Returns:
+            Diccionario con AUC, throughput (textos/s) de cada variante, tasa de
+            escalado y delta de AUC de la cascada frente a solo LLM
+        """
+        texts = list(texts)
+        labels = np.asarray(labels)
+
+        start = time.perf_counter()
+        fast = self.fast.predict_batch(texts)
+        fast_seconds = time.perf_counter() - start
+
+        with self.embedder.cache_disabled():
+            # Cascada: misma puntuación rápida + LLM sobre los dudosos
+            escalate = np.flatnonzero(self.uncertain(fast))
+            cascade = fast.copy()
+            start = time.perf_counter()
+            if len(escalate):
+                cascade[escalate] = self.slow.predict_batch([texts[i] for i in escalate])
+            cascade_seconds = fast_seconds + time.perf_counter() - start
+
+            # Solo LLM: todos los textos pasan por el transformer
+            start = time.perf_counter()
+            llm = self.slow.predict_batch(texts)
+            llm_seconds = time.perf_counter() - start
+
+        def auc(scores):
+            return float(roc_auc_score(labels, scores)) if len(np.unique(labels)) > 1 else float('nan')
+
+        report = {
+            'texts': len(texts),
+            'band': [self.low, self.high],
+            'escalation_rate': len(escalate) / len(texts) if texts else 0.0,
+            'auc_cascade': auc(cascade),
+            'auc_llm': auc(llm),
+            'auc_tfidf': auc(fast),
+            'throughput_cascade': len(texts) / cascade_seconds if cascade_seconds else 0.0,
+            'throughput_llm': len(texts) / llm_seconds if llm_seconds else 0.0,
+            'throughput_tfidf': len(texts) / fast_seconds if fast_seconds else 0.0
+        }
+        report['auc_delta'] = report['auc_cascade'] - report['auc_llm']
+        return report
+
+    def save(self, path):
+        """Directorio con manifest.json y un artefacto ToxicityModel por cabeza"""
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        manifest = {
+            'type': 'cascade',
+            'low': self.low,
+            'high': self.high,
+            'threshold': self.threshold,
+            'fast': 'fast',
+            'slow': 'slow'
+        }
+        if self.adjuster is not None:
+            manifest['adjuster'] = self.adjuster.config()
+        self.fast.save(path / manifest['fast'])
+        self.slow.save(path / manifest['slow'])
+        (path / 'manifest.json').write_text(json.dumps(manifest, indent=2), encoding='utf-8')
+        return path
+
+    @classmethod
+    def load(cls, path, mmap_mode='r', use_cache=None):
+        path = Path(path)
+        manifest = json.loads((path / 'manifest.json').read_text(encoding='utf-8'))
+        # Construir es barato (el embedder es perezoso); luego se sustituyen las cabezas
+        model = cls(low=manifest['low'], high=manifest['high'])
+        model.threshold = manifest.get('threshold', 0.5)
+        if 'adjuster' in manifest:
+            model.adjuster = ContextualAdjuster(**manifest['adjuster'])
+        model.fast = ToxicityModel.load(path / manifest['fast'], mmap_mode=mmap_mode)
+        model.slow = ToxicityModel.load(path / manifest['slow'], mmap_mode=mmap_mode, use_cache=use_cache)
+        return model
@@ -1,28 +1,166 @@
-from textblob import TextBlob
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+import os
+from textblob.en import sentiment as pattern_sentiment
+from textblob._text import EMOTICONS, PUNCTUATION
+import numpy as np
+import pandas as pd
 import re
 
+# Columnas de la matriz de características (mismo orden que analyze)
+FEATURES = [
+    'sentiment', 'sarcasm_score', 'negation_score',
+    'exclamation_score', 'question_score', 'positive_word_count'
+]
+
+# A partir de este tamaño analyze_batch reparte el trabajo entre procesos
+PARALLEL_MIN_TEXTS = 20000
+
+
+class _PolarityLexicon:
+    """Léxico de polaridad de TextBlob precompilado en diccionarios planos
+
+    Reproduce exactamente `TextBlob(text).sentiment.polarity` (mismo
+    tokenizador, misma lógica de modificadores, negaciones, exclamaciones y
+    emoticonos) pero sin construir el TextBlob ni pasar por el lazydict de
+    pattern, y calculando solo la polaridad.
+    """
+
+    def __init__(self):
+        if dict.__len__(pattern_sentiment) == 0:
+            pattern_sentiment.load()
+        # Sin etiqueta POS (texto plano) TextBlob usa las puntuaciones promediadas (clave None)
+        self.scores = {
+            word: tuple(tags[None])
+            for word, tags in dict.items(pattern_sentiment) if None in tags
+        }
+        self.modifiers = {
+            word for word, tags in dict.items(pattern_sentiment)
+            if any(tag in tags for tag in pattern_sentiment.modifiers)
+        }
+        self.negations = set(pattern_sentiment.negations)
+        self.is_modifier = pattern_sentiment.modifier
+        self.tokenizer = pattern_sentiment.tokenizer
+        self.emoticons = {}
+        for (_, polarity), forms in EMOTICONS.items():
+            for form in forms:
+                self.emoticons.setdefault(form.lower(), polarity)
+
+    def __call__(self, text):
+        words = [w.lower() for w in " ".join(self.tokenizer(text)).split()]
+        assessments = []  # [polaridad, intensidad, negada(-1)/no(1)]
+        m = None  # Modificador precedente ("very good")
+        n = None  # Negación precedente ("not good")
+        for w in words:
+            score = self.scores.get(w)
+            if score is not None:
+                p, _, i = score
+                if m is None:
+                    assessments.append([p, i, 1])
+                else:
+                    last = assessments[-1]
+                    last[0] = max(-1.0, min(p * last[1], +1.0))
+                    last[1] = i
+                if n is not None:
+                    assessments[-1][1] = 1.0 / assessments[-1][1]
+                    assessments[-1][2] = -1
+                m = w if w in self.modifiers else None
+                n = w if w in self.negations else None
+            else:
+                if w in self.negations:
+                    n = w
+                elif n and len(w.strip("'")) > 1:
+                    n = None
+                if n is not None and m is not None and self.is_modifier(m):
+                    assessments[-1][2] = -1
+                    n = None
+                elif m and len(w) > 2:
+                    m = None
+                if w == "!" and assessments:
+                    assessments[-1][0] = max(-1.0, min(assessments[-1][0] * 1.25, +1.0))
+                if w == "(!)":
+                    assessments.append([0.0, 1.0, 1])
+                if w.isalpha() is False and len(w) <= 5 and w not in PUNCTUATION:
+                    polarity = self.emoticons.get(w)
+                    if polarity is not None:
+                        assessments.append([polarity, 1.0, 1])
+
+        # Promedio acumulado en el mismo orden que pattern (resultado idéntico bit a bit)
+        total = 0
+        for p, _, negated in assessments:
+            total += p * -0.5 if negated < 0 else p
+        return total / float(len(assessments) or 1)
+
+
+_lexicon = None
+
+
+@lru_cache(maxsize=65536)
+def _polarity(text):
+    # Mismo resultado que TextBlob(text).sentiment.polarity, sin construir el TextBlob
+    global _lexicon
+    if _lexicon is None:
+        _lexicon = _PolarityLexicon()
+    return float(_lexicon(text))
+
+
 class ContextAnalyzer:
     def __init__(self):
-        # Patrones para sarcasmo e irnoia
-        self.sarcasm_patterns = [
-            re.compile(r"\b(qué|vaya)\s+(solución|idea|trabajo)\s+(tan|más)\s+(brillante|genial|fantástica)\b", re.IGNORECASE),
-            re.compile(r"\b(claro\s+que\s+sí|como\s+no)\b", re.IGNORECASE),
-            re.compile(r"\b(genial|fantástico|maravilloso)\s+(como\s+siempre)\b", re.IGNORECASE)
-        ]
-        
-        # Patrones de negación
-        self.negation_pattern = re.compile(r"\b(no|nunca|jamás|tampoco)\s+(\w+)", re.IGNORECASE)
-        
-        # Patrones de exclamación e interrogación
-        self.exclamation_pattern = re.compile(r"!+")
-        self.question_pattern = re.compile(r"\?+")
-        
+        # Patrones para sarcasmo e irnoia (fusionados en una sola expresión)
+        self.sarcasm_pattern = re.compile(
+            r"\b(qué|vaya)\s+(solución|idea|trabajo)\s+(tan|más)\s+(brillante|genial|fantástica)\b"
+            r"|\b(claro\s+que\s+sí|como\s+no)\b"
+            r"|\b(genial|fantástico|maravilloso)\s+(como\s+siempre)\b",
+            re.IGNORECASE
+        )
+
+        # Negaciones, exclamaciones e interrogaciones en una única pasada
+        # (no se solapan: las negaciones solo contienen letras y espacios)
+        self.counts_pattern = re.compile(
+            r"(?P<negation>\b(?:no|nunca|jamás|tampoco)\s+\w+)|(?P<exclamation>!+)|(?P<question>\?+)",
+            re.IGNORECASE
+        )
+
         # Lista de palabras de contexto positivo
         self.positive_words = {
             'bueno', 'excelente', 'gracias', 'aprecio', 'respeto',
             'orgulloso', 'amor', 'apoyo', 'feliz', 'positivo'
         }
-    
+        # Lookahead: encuentra cada palabra aunque aparezca solapada con otra
+        self.positive_pattern = re.compile(
+            '(?=(' + '|'.join(re.escape(word) for word in sorted(self.positive_words)) + '))'
+        )
+
+    def _analyze_row(self, text):
+        """Características de un texto como tupla en el orden de FEATURES"""
+        if not isinstance(text, str):
+            return (0.0, 0, 0, 0, 0, 0)
+
+        # Análisis de sentimiento
+        sentiment = _polarity(text)
+
+        # Detección de sarcasmo
+        sarcasm_score = int(self.sarcasm_pattern.search(text) is not None)
+
+        # Negaciones y puntuación de exclamación e interrogación
+        negation_score = exclamation_score = question_score = 0
+        for match in self.counts_pattern.finditer(text):
+            kind = match.lastgroup
+            if kind == 'negation':
+                negation_score += 1
+            elif kind == 'exclamation':
+                exclamation_score += 1
+            else:
+                question_score += 1
+
+        # Conteo de palabras positivas (distintas)
+        positive_word_count = len(set(self.positive_pattern.findall(text.lower())))
+
+        return (sentiment, sarcasm_score, negation_score, exclamation_score, question_score, positive_word_count)
+
+    def _analyze_rows(self, texts):
+        return [self._analyze_row(text) for text in texts]
+
     def analyze(self, text):
         if not isinstance(text, str):
             return {
@@ -33,29 +171,34 @@ class ContextAnalyzer:
                 'question_score': 0,
                 'positive_word_count': 0
             }
-        
-        # Análisis de sentimiento
-        sentiment = TextBlob(text).sentiment.polarity
-        
-        # Detección de sarcasmo
-        sarcasm_score = any(pattern.search(text) for pattern in self.sarcasm_patterns)
-        
-        # Detección de negaciones
-        negation_score = len(self.negation_pattern.findall(text))
-        
-        # Puntuación de exclamación e interrogación
-        exclamation_score = len(self.exclamation_pattern.findall(text))
-        question_score = len(self.question_pattern.findall(text))
-        
-        # Conteo de palabras positivas
-        text_lower = text.lower()
-        positive_word_count = sum(1 for word in self.positive_words if word in text_lower)
-        
-        return {
-            'sentiment': float(sentiment),
-            'sarcasm_score': int(sarcasm_score),
-            'negation_score': negation_score,
-            'exclamation_score': exclamation_score,
-            'question_score': question_score,
-            'positive_word_count': positive_word_count
-        }
\ No newline at end of file
+
+        return dict(zip(FEATURES, self._analyze_row(text)))
+
+    def analyze_batch(self, texts, n_jobs=None):
+        """Analiza muchos textos y devuelve un DataFrame (texto x característica)
+
+        Args:
+            texts: Lista o Series de textos
+            n_jobs: Procesos a usar; None = automático (solo para entradas grandes)
+        Returns:
+            DataFrame con las columnas de FEATURES
+        """
+        index = texts.index if isinstance(texts, pd.Series) else None
+        texts = list(texts)
+
+        if n_jobs is None:
+            n_jobs = 1 if len(texts) < PARALLEL_MIN_TEXTS else None
+
+        if n_jobs == 1:
+            rows = self._analyze_rows(texts)
+        else:
+            n_jobs = n_jobs or os.cpu_count() or 1
+            with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+                n_chunks = n_jobs * 4
+                chunk_size = max(1, -(-len(texts) // n_chunks))
+                chunks = [texts[i:i + chunk_size] for i in range(0, len(texts), chunk_size)]
+                rows = [row for chunk in executor.map(self._analyze_rows, chunks) for row in chunk]
+
+        features = pd.DataFrame(rows, columns=FEATURES, index=index)
+        features['sentiment'] = features['sentiment'].astype(np.float64)
+        return features
@@ -0,0 +1,77 @@
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from .context_analysis import ContextAnalyzer
+from .identity_detection import IdentityDetector
+from .text_processing import TextCleaner
+
+
+class ContextualAdjuster:
+    """Ajuste contextual de las probabilidades (reglas de test_cases.py) sobre lotes
+
+    - Sarcasmo detectado: +`sarcasm_boost`
+    - Si no, con mención de identidad: `positive_identity_shift` si el
+      sentimiento es > `sentiment_threshold` y +`negative_identity_boost` si
+      es < -`sentiment_threshold`
+
+    Las características se calculan sobre `TextCleaner.normalize` (sin stemming,
+    para que los patrones de sarcasmo y los términos de identidad sigan
+    coincidiendo) y las reglas se aplican con operaciones de NumPy sobre todo el
+    arreglo de probabilidades, recortado a [0, 1].
+    """
+
+    def __init__(self, identity_terms, sarcasm_boost=0.25, positive_identity_shift=-0.2,
+                 negative_identity_boost=0.1, sentiment_threshold=0.3):
+        self.identity_terms = identity_terms
+        self.sarcasm_boost = sarcasm_boost
+        self.positive_identity_shift = positive_identity_shift
+        self.negative_identity_boost = negative_identity_boost
+        self.sentiment_threshold = sentiment_threshold
+        self.cleaner = TextCleaner()
+        self.analyzer = ContextAnalyzer()
+        self.detector = IdentityDetector(identity_terms)
+        self._executor = None
+
+    def config(self):
+        """Parámetros del ajuste (se guardan en el manifest del modelo)"""
+        return {
+            'identity_terms': self.identity_terms,
+            'sarcasm_boost': self.sarcasm_boost,
+            'positive_identity_shift': self.positive_identity_shift,
+            'negative_identity_boost': self.negative_identity_boost,
+            'sentiment_threshold': self.sentiment_threshold
+        }
+
+    def features(self, texts):
+        """Sarcasmo, mención de identidad y sentimiento de cada texto (arreglos alineados)"""
+        normalized = [self.cleaner.normalize(text) for text in texts]
+        context = self.analyzer.analyze_batch(normalized, n_jobs=1)
+        identities = self.detector.detect_batch(normalized)
+        return {
+            'sarcasm': context['sarcasm_score'].to_numpy() > 0,
+            'identity': identities.to_numpy().any(axis=1),
+            'sentiment': context['sentiment'].to_numpy()
+        }
+
+    def adjust(self, probas, features):
+        """Aplica las reglas a `probas` (no se modifica el arreglo de entrada)"""
+        probas = np.asarray(probas, dtype=np.float64)
+        sarcasm = features['sarcasm']
+        identity = features['identity'] & ~sarcasm
+        sentiment = features['sentiment']
+
+        shift = np.zeros_like(probas)
+        shift[sarcasm] = self.sarcasm_boost
+        shift[identity & (sentiment > self.sentiment_threshold)] = self.positive_identity_shift
+        shift[identity & (sentiment < -self.sentiment_threshold)] = self.negative_identity_boost
+        return np.clip(probas + shift, 0.0, 1.0)
+
+    def submit(self, texts):
+        """Calcula las características en un hilo aparte (en paralelo con el embedding)"""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='context-adjust')
+        return self._executor.submit(self.features, texts)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_executor'] = None
+        return state
@@ -0,0 +1,175 @@
+import time
+import zlib
+import numpy as np
+from .text_processing import TextCleaner
+
+# Shingles procesados por bloque al calcular firmas (acota la memoria)
+_SHINGLE_CHUNK = 200_000
+
+
+def lsh_params(threshold, num_perm):
+    """Elige (bandas, filas) con bandas * filas = num_perm y umbral (1/b)^(1/r) más cercano a `threshold`"""
+    best = None
+    for rows in range(1, num_perm + 1):
+        if num_perm % rows:
+            continue
+        bands = num_perm // rows
+        error = abs((1 / bands) ** (1 / rows) - threshold)
+        if best is None or error < best[0]:
+            best = (error, bands, rows)
+    return best[1], best[2]
+
+
+class _UnionFind:
+    def __init__(self, n):
+        self.parent = np.arange(n)
+
+    def find(self, i):
+        root = i
+        while self.parent[root] != root:
+            root = self.parent[root]
+        while self.parent[i] != root:
+            self.parent[i], i = root, self.parent[i]
+        return root
+
+    def union(self, i, j):
+        ri, rj = self.find(i), self.find(j)
+        if ri != rj:
+            # La raíz es siempre el índice menor (primera aparición)
+            self.parent[max(ri, rj)] = min(ri, rj)
+
+
+class Deduplicator:
+    """Agrupa comentarios duplicados para puntuar un solo representante por grupo
+
+    1. Duplicados exactos: mismo texto tras `TextCleaner.normalize`.
+    2. Casi duplicados (opcional, `near_duplicates=True`): MinHash sobre shingles de palabras y LSH por
+       bandas; los candidatos se confirman con la similitud de Jaccard estimada
+       por la firma (>= `threshold`) y se unen con union-find.
+
+    El representante de cada grupo es su primera aparición. Los textos que
+    quedan vacíos tras normalizar ("", "!!!", solo emojis) no se agrupan: cada
+    uno forma su propio grupo y se puntúa por separado.
+    """
+
+    def __init__(self, threshold=0.9, num_perm=64, shingle_size=3, near_duplicates=False, seed=42, cleaner=None):
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self.near_duplicates = near_duplicates
+        self.seed = seed
+        self.cleaner = cleaner or TextCleaner()
+        self.bands, self.rows = lsh_params(threshold, num_perm)
+
+        rng = np.random.default_rng(seed)
+        # Permutaciones por multiply-shift: ((a * x + b) mod 2^64) >> 32, con `a` impar
+        self._a = rng.integers(1, 1 << 63, num_perm, dtype=np.uint64) | np.uint64(1)
+        self._b = rng.integers(0, 1 << 63, num_perm, dtype=np.uint64)
+        self._band_mix = rng.integers(1, 1 << 63, self.rows, dtype=np.uint64) | np.uint64(1)
+        self.report = {}
+
+    def _shingles(self, text):
+        tokens = text.split()
+        k = self.shingle_size
+        if len(tokens) <= k:
+            return [zlib.crc32(text.encode('utf-8'))]
+        return [zlib.crc32(' '.join(tokens[i:i + k]).encode('utf-8')) for i in range(len(tokens) - k + 1)]
+
+    def signatures(self, texts):
+        """Firmas MinHash (len(texts), num_perm) de textos ya normalizados y no vacíos"""
+        hashes, counts = [], []
+        for text in texts:
+            shingles = self._shingles(text)
+            hashes.extend(shingles)
+            counts.append(len(shingles))
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]]).astype(np.int64)
+
+        signatures = np.empty((len(texts), self.num_perm), dtype=np.uint64)
+        # Bloques que respetan los límites entre textos
+        first = 0
+        while first < len(texts):
+            last = int(np.searchsorted(starts, starts[first] + _SHINGLE_CHUNK, side='right'))
+            last = max(last, first + 1)
+            lo = starts[first]
+            hi = starts[last] if last < len(texts) else len(hashes)
+            permuted = (hashes[lo:hi, np.newaxis] * self._a + self._b) >> np.uint64(32)
+            signatures[first:last] = np.minimum.reduceat(permuted, starts[first:last] - lo, axis=0)
+            first = last
+        return signatures
+
+    def _near_duplicate_roots(self, texts):
+        """Raíz (índice del primer miembro) de cada texto según LSH + verificación"""
+        n = len(texts)
+        union = _UnionFind(n)
+        if n < 2:
+            return union.parent
+        signatures = self.signatures(texts)
+        min_equal = self.threshold * self.num_perm
+
+        for band in range(self.bands):
+            cols = signatures[:, band * self.rows:(band + 1) * self.rows]
+            keys = (cols * self._band_mix).sum(axis=1)   # Desborde uint64 intencional (hash)
+            order = np.argsort(keys, kind='stable')
+            sorted_keys = keys[order]
+            # Tramos con la misma clave de banda = candidatos
+            breaks = np.flatnonzero(sorted_keys[1:] != sorted_keys[:-1]) + 1
+            run_starts = np.concatenate([[0], breaks])
+            run_ends = np.concatenate([breaks, [n]])
+            shared = run_ends - run_starts > 1
+            for lo, hi in zip(run_starts[shared], run_ends[shared]):
+                bucket = order[lo:hi]
+                head = bucket[0]
+                equal = (signatures[bucket[1:]] == signatures[head]).sum(axis=1)
+                for member in bucket[1:][equal >= min_equal]:
+                    union.union(head, member)
+        return np.fromiter((union.find(i) for i in range(n)), dtype=np.int64, count=n)
+
+    def group(self, texts):
+        """Agrupa `texts`
+
+        Returns:
+            (labels, representatives): grupo de cada texto (0..n_grupos-1) e
+            índice en `texts` del representante de cada grupo
+        """
+        start = time.perf_counter()
+        texts = list(texts)
+        normalized = [self.cleaner.normalize(text) for text in texts]
+
+        # 1. Duplicados exactos (un texto vacío tras normalizar solo coincide consigo mismo)
+        first_seen = {}
+        exact = np.fromiter((first_seen.setdefault(text or i, i) for i, text in enumerate(normalized)),
+                            dtype=np.int64, count=len(texts))
+        unique = np.fromiter(first_seen.values(), dtype=np.int64, count=len(first_seen))
+
+        # 2. Casi duplicados entre los textos únicos no vacíos
+        roots = exact
+        if self.near_duplicates:
+            candidates = unique[[bool(normalized[i]) for i in unique]]
+            unique_roots = self._near_duplicate_roots([normalized[i] for i in candidates])
+            mapping = np.arange(len(texts))
+            mapping[candidates] = candidates[unique_roots]
+            roots = mapping[exact]
+
+        representatives, labels = np.unique(roots, return_inverse=True)
+        self.report = {
+            'texts': len(texts),
+            'exact_unique': len(unique),
+            'groups': len(representatives),
+            'dedup_ratio': 1 - len(representatives) / len(texts) if texts else 0.0,
+            'seconds': time.perf_counter() - start
+        }
+        return labels, representatives
+
+    def score(self, texts, score_fn):
+        """Puntúa un representante por grupo y replica su puntuación en todo el grupo"""
+        texts = list(texts)
+        labels, representatives = self.group(texts)
+        start = time.perf_counter()
+        scores = np.asarray(score_fn([texts[i] for i in representatives]))
+        seconds = time.perf_counter() - start
+        if len(representatives):
+            # Estimación del coste de puntuar todos los textos sin deduplicar
+            self.report['score_seconds'] = seconds
+            self.report['estimated_saved_seconds'] = seconds / len(representatives) * (len(texts) - len(representatives))
+        return scores[labels]
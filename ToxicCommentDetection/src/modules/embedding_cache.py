@@ -0,0 +1,241 @@
+import hashlib
+import json
+import unicodedata
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+import numpy as np
+
+try:
+    import fcntl  # Solo en sistemas tipo Unix
+except ImportError:
+    fcntl = None
+
+# Tamaño del digest usado como clave (16 bytes = 128 bits)
+KEY_SIZE = 16
+
+
+def normalize_text(text):
+    """Normaliza el texto antes de calcular su clave (Unicode NFC y sin espacios extremos)"""
+    return unicodedata.normalize('NFC', text).strip()
+
+
+class EmbeddingCache:
+    """Caché persistente de embeddings direccionada por contenido
+
+    Los vectores se guardan en un arreglo float32 mapeado en memoria
+    (`vectors.f32`) y el índice compacto en dos arreglos también mapeados: los
+    digests de cada slot (`keys.npy`) y su último uso (`ticks.npy`). Delante
+    del disco hay un LRU en memoria. Cuando se llena, se desalojan los slots
+    menos usados.
+
+    Como los tres arreglos son memmaps, `flush` solo escribe las páginas de
+    los slots modificados. Un acierto solo actualiza su tick y no marca la
+    caché como sucia: el sistema operativo lo persiste cuando vuelca la página
+    (o `flush`/`close` tras la siguiente escritura).
+
+    Varios procesos pueden compartir la caché (p. ej. service.py y
+    submission.py). Las escrituras (elegir slots libres o víctimas, escribir y
+    volcar) se hacen bajo un `flock` exclusivo sobre `lock` y leyendo los
+    arreglos compartidos, no el índice en memoria de cada proceso. Un slot se
+    invalida antes de reescribir su vector, y al leer se comprueba la clave del
+    slot antes y después de copiar el vector: si otro proceso lo reutilizó, el
+    texto cuenta como fallo. En sistemas sin `fcntl` (Windows) no hay bloqueo y
+    solo un proceso debe escribir en la caché.
+    """
+
+    def __init__(self, cache_dir, namespace, dim, max_entries=500_000, memory_entries=10_000):
+        self.namespace = namespace
+        self.dim = int(dim)
+        self.max_entries = int(max_entries)
+        self.memory_entries = int(memory_entries)
+
+        # Cada namespace (modelo + parámetros) vive en su propio subdirectorio
+        ns_hash = hashlib.blake2b(namespace.encode('utf-8'), digest_size=8).hexdigest()
+        self.path = Path(cache_dir) / ns_hash
+
+        self.hits = 0
+        self.memory_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._open()
+
+    @contextmanager
+    def _locked(self):
+        """Bloqueo exclusivo entre procesos (y entre hilos: cada llamada abre su propio descriptor)"""
+        if fcntl is None:
+            yield
+            return
+        with open(self.path / 'lock', 'a+b') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _open(self):
+        self.path.mkdir(parents=True, exist_ok=True)
+        with self._locked():
+            self._open_arrays()
+
+    def _open_arrays(self):
+        meta_path = self.path / 'meta.json'
+        meta = {'namespace': self.namespace, 'dim': self.dim, 'max_entries': self.max_entries}
+
+        # Si la configuración cambió se descarta la caché anterior
+        reset = True
+        if meta_path.exists():
+            try:
+                reset = json.loads(meta_path.read_text(encoding='utf-8')) != meta
+            except ValueError:
+                reset = True
+
+        vectors_path = self.path / 'vectors.f32'
+        if reset or not (self.path / 'keys.npy').exists():
+            mode = 'w+'
+            self.keys = np.lib.format.open_memmap(self.path / 'keys.npy', mode=mode, dtype=np.uint8,
+                                                  shape=(self.max_entries, KEY_SIZE))
+            self.ticks = np.lib.format.open_memmap(self.path / 'ticks.npy', mode=mode, dtype=np.int64,
+                                                   shape=(self.max_entries,))
+        else:
+            mode = 'r+'
+            self.keys = np.load(self.path / 'keys.npy', mmap_mode=mode)
+            self.ticks = np.load(self.path / 'ticks.npy', mmap_mode=mode)
+
+        self.vectors = np.memmap(vectors_path, dtype=np.float32, mode=mode,
+                                 shape=(self.max_entries, self.dim))
+        if reset:
+            meta_path.write_text(json.dumps(meta), encoding='utf-8')
+
+        # Un slot está ocupado si tiene tick > 0
+        self.slots = {self.keys[slot].tobytes(): int(slot) for slot in np.flatnonzero(self.ticks)}
+        self.tick = int(self.ticks.max()) if len(self.ticks) else 0
+        self.memory = OrderedDict()
+        self._dirty = reset
+
+    def key(self, text):
+        """Clave de contenido: hash de namespace (modelo, max_length...) + texto normalizado"""
+        payload = f"{self.namespace}\x00{normalize_text(text)}".encode('utf-8')
+        return hashlib.blake2b(payload, digest_size=KEY_SIZE).digest()
+
+    def _remember(self, key, vector):
+        self.memory[key] = vector
+        self.memory.move_to_end(key)
+        if len(self.memory) > self.memory_entries:
+            self.memory.popitem(last=False)
+
+    def get_many(self, texts):
+        """Busca los embeddings de `texts`
+
+        Returns:
+            Tupla (embeddings, faltantes, claves): arreglo (n, dim) con los
+            aciertos ya rellenados, índices de los textos no encontrados y las
+            claves de todos los textos.
+        """
+        keys = [self.key(text) for text in texts]
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        missing = []
+
+        for i, key in enumerate(keys):
+            slot = self.slots.get(key)
+            if slot is None:
+                missing.append(i)
+                continue
+            vector = self.memory.get(key)
+            if vector is not None:
+                self.memory.move_to_end(key)
+                self.memory_hits += 1
+            else:
+                # Otro proceso pudo reutilizar el slot: la clave debe coincidir antes y después de copiar
+                vector = np.array(self.vectors[slot]) if self.keys[slot].tobytes() == key else None
+                if vector is None or self.keys[slot].tobytes() != key:
+                    del self.slots[key]
+                    missing.append(i)
+                    continue
+                self._remember(key, vector)
+            # Actualizar el último uso para la política de desalojo (sin marcar como sucia)
+            self.tick += 1
+            self.ticks[slot] = self.tick
+            out[i] = vector
+            self.hits += 1
+
+        self.misses += len(missing)
+        return out, missing, keys
+
+    def put_many(self, keys, vectors):
+        """Guarda vectores ya calculados, desalojando los slots menos usados si hace falta"""
+        new = [(key, vector) for key, vector in zip(keys, vectors) if key not in self.slots]
+        if not new:
+            return
+        # Si el lote supera la capacidad solo se conservan los últimos
+        new = new[-self.max_entries:]
+
+        with self._locked():
+            # Slots libres y víctimas según los arreglos compartidos (otros procesos también escriben)
+            self.tick = max(self.tick, int(self.ticks.max()))
+            free = np.flatnonzero(self.ticks == 0)[:len(new)]
+            needed = len(new) - len(free)
+            if needed > 0:
+                used = np.flatnonzero(self.ticks)
+                victims = used[np.argpartition(self.ticks[used], needed - 1)[:needed]]
+                for slot in victims:
+                    old_key = self.keys[slot].tobytes()
+                    self.slots.pop(old_key, None)
+                    self.memory.pop(old_key, None)
+                self.evictions += needed
+                free = np.concatenate([free, victims])
+
+            for slot, (key, vector) in zip(free, new):
+                self.keys[slot] = 0   # Invalidar antes de reescribir el vector
+                self.vectors[slot] = vector
+                self.keys[slot] = np.frombuffer(key, dtype=np.uint8)
+                self.tick += 1
+                self.ticks[slot] = self.tick
+                self.slots[key] = int(slot)
+                self._remember(key, np.asarray(vector, dtype=np.float32))
+            self._dirty = True
+            self._flush()
+
+    def _flush(self):
+        self.vectors.flush()
+        self.keys.flush()
+        self.ticks.flush()
+        self._dirty = False
+
+    def flush(self):
+        """Persiste en disco los slots escritos desde el último flush (solo sus páginas)"""
+        if not self._dirty:
+            return
+        with self._locked():
+            self._flush()
+
+    def close(self):
+        """Persiste también los ticks de los aciertos y libera los memmaps"""
+        self._dirty = True
+        self.flush()
+        for attr in ('vectors', 'keys', 'ticks'):
+            setattr(self, attr, None)
+
+    def stats(self):
+        """Contadores de aciertos/fallos de la caché"""
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'memory_hits': self.memory_hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+            'entries': len(self.slots),
+            'evictions': self.evictions
+        }
+
+    def __getstate__(self):
+        # No serializar el memmap ni el LRU: se reabren desde disco al cargar
+        self.flush()
+        state = self.__dict__.copy()
+        for attr in ('vectors', 'keys', 'ticks', 'slots', 'memory'):
+            state.pop(attr, None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._open()
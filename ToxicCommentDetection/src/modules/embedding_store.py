@@ -0,0 +1,100 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+import numpy as np
+from .embedding_cache import KEY_SIZE, normalize_text
+
+
+class EmbeddingStore:
+    """Almacén persistente y append-only de embeddings de entrenamiento con su etiqueta
+
+    Permite reentrenar sin volver a pasar por el transformer los textos ya vistos:
+    - vectors.f32: embeddings float32, se añaden al final y se leen mapeados en memoria
+    - keys.u8: digest del texto normalizado de cada fila (deduplica entre lotes)
+    - labels.i1: etiqueta actual de cada fila (se puede corregir)
+    - meta.json: namespace del embedder, dimensión y número de filas confirmadas
+
+    meta.json se escribe al final de cada `append`; al abrir se descartan las
+    filas de una escritura interrumpida.
+    """
+
+    def __init__(self, path, namespace, dim):
+        self.path = Path(path)
+        self.namespace = namespace
+        self.dim = int(dim)
+        self._open()
+
+    def _open(self):
+        self.path.mkdir(parents=True, exist_ok=True)
+        meta_path = self.path / 'meta.json'
+        self.count = 0
+        if meta_path.exists():
+            meta = json.loads(meta_path.read_text(encoding='utf-8'))
+            if meta['namespace'] != self.namespace or meta['dim'] != self.dim:
+                raise ValueError(
+                    f"El almacén {self.path} se creó con otro embedder ({meta['namespace']}, dim={meta['dim']}); "
+                    f"use otro directorio"
+                )
+            self.count = int(meta['count'])
+
+        # Recortar lo que no llegó a confirmarse en meta.json
+        for name, row_bytes in (('vectors.f32', 4 * self.dim), ('keys.u8', KEY_SIZE), ('labels.i1', 1)):
+            file_path = self.path / name
+            file_path.touch()
+            if file_path.stat().st_size > self.count * row_bytes:
+                os.truncate(file_path, self.count * row_bytes)
+
+        keys = np.fromfile(self.path / 'keys.u8', dtype=np.uint8).reshape(-1, KEY_SIZE)
+        self.index = {key.tobytes(): row for row, key in enumerate(keys)}
+        self.labels = np.fromfile(self.path / 'labels.i1', dtype=np.int8)
+
+    def __len__(self):
+        return self.count
+
+    @staticmethod
+    def key(text):
+        return hashlib.blake2b(normalize_text(text).encode('utf-8'), digest_size=KEY_SIZE).digest()
+
+    def lookup(self, keys):
+        """Fila de cada clave en el almacén (-1 si no está)"""
+        return np.fromiter((self.index.get(key, -1) for key in keys), dtype=np.int64, count=len(keys))
+
+    def set_labels(self, rows, labels):
+        """Corrige etiquetas de filas existentes; devuelve cuántas cambiaron"""
+        rows = np.asarray(rows, dtype=np.int64)
+        labels = np.asarray(labels, dtype=np.int8)
+        changed = int((self.labels[rows] != labels).sum())
+        if changed:
+            self.labels[rows] = labels
+            self._write_labels()
+        return changed
+
+    def _write_labels(self):
+        tmp_path = self.path / 'labels.i1.tmp'
+        self.labels.tofile(tmp_path)
+        os.replace(tmp_path, self.path / 'labels.i1')
+
+    def append(self, keys, vectors, labels):
+        """Añade filas nuevas (las claves deben ser distintas y no estar ya guardadas)"""
+        if not len(keys):
+            return
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        with open(self.path / 'vectors.f32', 'ab') as f:
+            f.write(vectors.tobytes())
+        with open(self.path / 'keys.u8', 'ab') as f:
+            f.write(b''.join(keys))
+        self.labels = np.concatenate([self.labels, np.asarray(labels, dtype=np.int8)])
+        self._write_labels()
+
+        for offset, key in enumerate(keys):
+            self.index[key] = self.count + offset
+        self.count += len(keys)
+        meta = {'namespace': self.namespace, 'dim': self.dim, 'count': self.count}
+        (self.path / 'meta.json').write_text(json.dumps(meta), encoding='utf-8')
+
+    def vectors(self):
+        """Todos los embeddings guardados, mapeados en memoria (solo lectura)"""
+        if not self.count:
+            return np.empty((0, self.dim), dtype=np.float32)
+        return np.memmap(self.path / 'vectors.f32', dtype=np.float32, mode='r', shape=(self.count, self.dim))
@@ -0,0 +1,134 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import numpy as np
+
+# Filas evaluadas a la vez (acota la memoria de los arreglos filas x árboles)
+ROW_CHUNK = 4096
+
+# Arreglos contiguos que forman el bosque aplanado (un .npy por arreglo)
+ARRAYS = ('left', 'right', 'feature', 'threshold', 'value', 'roots')
+
+
+class FlatForest:
+    """RandomForest aplanado en arreglos contiguos con evaluación vectorizada en NumPy
+
+    Los nodos de todos los árboles se concatenan; las hojas apuntan a sí mismas,
+    así que basta con avanzar `max_depth` pasos para que cada (fila, árbol) llegue
+    a su hoja. Las probabilidades se suman árbol a árbol en el mismo orden que
+    sklearn con un solo hilo, por lo que coinciden bit a bit con `predict_proba`.
+    """
+
+    def __init__(self, left, right, feature, threshold, value, roots, classes, max_depth, n_features):
+        self.left = left
+        self.right = right
+        self.feature = feature
+        self.threshold = threshold
+        self.value = value
+        self.roots = roots
+        self.classes_ = np.asarray(classes)
+        self.max_depth = int(max_depth)
+        self.n_features_in_ = int(n_features)
+
+    @classmethod
+    def from_sklearn(cls, forest):
+        """Exporta un RandomForestClassifier ya entrenado"""
+        left, right, feature, threshold, value, roots = [], [], [], [], [], []
+        offset = 0
+        n_classes = len(forest.classes_)
+        for estimator in forest.estimators_:
+            tree = estimator.tree_
+            n_nodes = tree.node_count
+            is_leaf = tree.children_left == -1
+            own = np.arange(offset, offset + n_nodes, dtype=np.int32)
+            left.append(np.where(is_leaf, own, tree.children_left + offset).astype(np.int32))
+            right.append(np.where(is_leaf, own, tree.children_right + offset).astype(np.int32))
+            feature.append(np.where(is_leaf, 0, tree.feature).astype(np.int32))
+            threshold.append(tree.threshold.astype(np.float64))
+
+            # Misma normalización que DecisionTreeClassifier.predict_proba
+            proba = tree.value[:, 0, :n_classes].astype(np.float64)
+            normalizer = proba.sum(axis=1)[:, np.newaxis]
+            normalizer[normalizer == 0.0] = 1.0
+            value.append(proba / normalizer)
+
+            roots.append(offset)
+            offset += n_nodes
+
+        return cls(
+            np.concatenate(left),
+            np.concatenate(right),
+            np.concatenate(feature),
+            np.concatenate(threshold),
+            np.concatenate(value),
+            np.asarray(roots, dtype=np.int32),
+            forest.classes_,
+            max(estimator.tree_.max_depth for estimator in forest.estimators_),
+            forest.n_features_in_
+        )
+
+    @property
+    def n_trees(self):
+        return len(self.roots)
+
+    def _predict_chunk(self, X):
+        n_rows = X.shape[0]
+        flat_X = X.ravel()
+        row_offsets = (np.arange(n_rows, dtype=np.int64) * X.shape[1])[:, np.newaxis]
+        node = np.broadcast_to(self.roots, (n_rows, self.n_trees))
+        for _ in range(self.max_depth):
+            go_left = flat_X[row_offsets + self.feature[node]] <= self.threshold[node]
+            node = np.where(go_left, self.left[node], self.right[node])
+
+        # Acumular en orden de árbol (como sklearn) para obtener los mismos bits
+        leaf_values = self.value[node]
+        proba = np.zeros((n_rows, leaf_values.shape[2]), dtype=np.float64)
+        for t in range(self.n_trees):
+            proba += leaf_values[:, t]
+        proba /= self.n_trees
+        return proba
+
+    def predict_proba(self, X, n_jobs=1):
+        """Probabilidades por clase; `n_jobs=1` evalúa en el hilo actual (latencia predecible)
+
+        Con n_jobs > 1 los bloques de filas se reparten entre hilos (útil solo
+        para lotes grandes).
+        """
+        # Igual que sklearn: las características se comparan en float32
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        if X.ndim == 1:
+            X = X[np.newaxis, :]
+        if X.shape[1] != self.n_features_in_:
+            raise ValueError(f"X tiene {X.shape[1]} características; el bosque espera {self.n_features_in_}")
+
+        chunks = [X[start:start + ROW_CHUNK] for start in range(0, X.shape[0], ROW_CHUNK)]
+        if n_jobs == 1 or len(chunks) <= 1:
+            results = [self._predict_chunk(chunk) for chunk in chunks]
+        else:
+            with ThreadPoolExecutor(max_workers=n_jobs) as executor:
+                results = list(executor.map(self._predict_chunk, chunks))
+        if not results:
+            return np.empty((0, len(self.classes_)), dtype=np.float64)
+        return np.concatenate(results)
+
+    def save(self, path):
+        """Guarda cada arreglo como .npy (mapeables en memoria) y los metadatos en forest.json"""
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        for name in ARRAYS:
+            np.save(path / f'{name}.npy', getattr(self, name))
+        meta = {
+            'classes': self.classes_.tolist(),
+            'max_depth': self.max_depth,
+            'n_features': self.n_features_in_,
+            'n_trees': self.n_trees
+        }
+        (path / 'forest.json').write_text(json.dumps(meta), encoding='utf-8')
+        return path
+
+    @classmethod
+    def load(cls, path, mmap_mode='r'):
+        path = Path(path)
+        meta = json.loads((path / 'forest.json').read_text(encoding='utf-8'))
+        arrays = {name: np.load(path / f'{name}.npy', mmap_mode=mmap_mode) for name in ARRAYS}
+        return cls(classes=meta['classes'], max_depth=meta['max_depth'], n_features=meta['n_features'], **arrays)
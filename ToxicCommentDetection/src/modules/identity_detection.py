@@ -1,14 +1,24 @@
+import pandas as pd
+from .term_matcher import TermMatcher
+
 class IdentityDetector:
-    def __init__(self, identity_terms):
+    def __init__(self, identity_terms, whole_words=True, accent_insensitive=True):
         self.identity_terms = identity_terms
-    
+        # Un único patrón compilado para todas las categorías
+        self.matcher = TermMatcher(identity_terms, whole_words=whole_words, accent_insensitive=accent_insensitive)
+
     # Detecta la presencia de términos de identidad en el texto
     def detect(self, text):
         if not isinstance(text, str):
             return {category: False for category in self.identity_terms}
-        
-        text_lower = text.lower()
-        return {
-            category: any(term.lower() in text_lower for term in terms)
-            for category, terms in self.identity_terms.items()
-        }
\ No newline at end of file
+
+        return self.matcher.detect(text)
+
+    # Detecta identidades en muchos textos: DataFrame booleano (texto x categoría)
+    def detect_batch(self, texts):
+        index = texts.index if isinstance(texts, pd.Series) else None
+        return pd.DataFrame(
+            self.matcher.match_matrix(list(texts)),
+            columns=self.matcher.categories,
+            index=index
+        )
@@ -0,0 +1,192 @@
+import hashlib
+import inspect
+import json
+from pathlib import Path
+import numpy as np
+import torch
+
+# Backends de inferencia disponibles para el embedder
+BACKENDS = ('torch', 'torch_int8', 'onnx')
+
+
+def _artifact_dir(base_dir, model_name):
+    """Directorio de artefactos exportados para un modelo (nombre apto para disco)"""
+    safe_name = str(model_name).replace('/', '__').replace('\\', '__').strip('._') or 'model'
+    path = Path(base_dir) / safe_name
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def artifact_key(model):
+    """Huella del modelo fp32 del que se derivan los artefactos
+
+    Incluye un hash de la configuración y de los pesos y las versiones de
+    torch/transformers: si cualquiera cambia, el artefacto guardado ya no
+    corresponde al modelo y hay que volver a generarlo.
+    """
+    import transformers
+    digest = hashlib.sha256()
+    config = getattr(model, 'config', None)
+    if config is not None:
+        digest.update(config.to_json_string().encode('utf-8'))
+    for name, tensor in model.state_dict().items():
+        tensor = tensor.detach().cpu().contiguous()
+        digest.update(f'{name}:{tensor.dtype}:{tuple(tensor.shape)}'.encode('utf-8'))
+        digest.update(tensor.reshape(-1).view(torch.uint8).numpy())
+    return {'model_sha256': digest.hexdigest(), 'torch': torch.__version__, 'transformers': transformers.__version__}
+
+
+def _manifest_path(path):
+    return path.with_name(path.name + '.json')
+
+
+def _artifact_current(path, key):
+    """True si el artefacto existe y su manifiesto coincide con `key`"""
+    manifest = _manifest_path(path)
+    if not path.exists():
+        return False
+    if manifest.exists():
+        try:
+            if json.loads(manifest.read_text(encoding='utf-8')) == key:
+                return True
+        except ValueError:
+            pass
+    print(f"♻️ {path.name} se generó con otro modelo o versión de torch/transformers: se vuelve a generar")
+    return False
+
+
+def _write_manifest(path, key):
+    _manifest_path(path).write_text(json.dumps(key, indent=2), encoding='utf-8')
+
+
+class TorchBackend:
+    """PyTorch eager en fp32 (comportamiento original)"""
+    name = 'torch'
+
+    def __init__(self, model):
+        self.model = model
+
+    def forward(self, input_ids, attention_mask):
+        with torch.no_grad():
+            return self.model(input_ids=input_ids, attention_mask=attention_mask).last_hidden_state
+
+
+class TorchInt8Backend(TorchBackend):
+    """Cuantización dinámica int8 de las capas Linear (solo CPU)"""
+    name = 'torch_int8'
+
+    def __init__(self, model, artifact_dir):
+        path = Path(artifact_dir) / 'model_int8.pt'
+        key = artifact_key(model)
+        quantized = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        if _artifact_current(path, key):
+            # Reutilizar los pesos cuantizados guardados para que los embeddings sean estables
+            quantized.load_state_dict(torch.load(path))
+        else:
+            print(f"⚙️ Cuantizando modelo a int8 ({path})...")
+            tmp_path = path.with_suffix('.tmp')
+            torch.save(quantized.state_dict(), tmp_path)
+            tmp_path.replace(path)
+            _write_manifest(path, key)
+        quantized.eval()
+        super().__init__(quantized)
+
+
+class _LastHiddenState(torch.nn.Module):
+    """Envoltorio para exportar solo last_hidden_state a ONNX"""
+
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, input_ids, attention_mask):
+        return self.model(input_ids=input_ids, attention_mask=attention_mask).last_hidden_state
+
+
+class OnnxBackend:
+    """Grafo ONNX exportado ejecutado con ONNX Runtime (solo CPU)"""
+    name = 'onnx'
+
+    def __init__(self, model, artifact_dir, num_threads=None):
+        try:
+            import onnxruntime as ort
+        except ImportError as e:
+            raise ImportError("El backend 'onnx' requiere onnxruntime (pip install onnxruntime)") from e
+
+        path = Path(artifact_dir) / 'model.onnx'
+        key = artifact_key(model)
+        if not _artifact_current(path, key):
+            print(f"⚙️ Exportando modelo a ONNX ({path})...")
+            self.export(model, path)
+            _write_manifest(path, key)
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.intra_op_num_threads = num_threads or torch.get_num_threads()
+        self.session = ort.InferenceSession(str(path), options, providers=['CPUExecutionProvider'])
+
+    @staticmethod
+    def export(model, path):
+        """Exporta el modelo con ejes dinámicos de lote y secuencia"""
+        dummy = torch.ones((2, 8), dtype=torch.long)
+        kwargs = {}
+        if 'dynamo' in inspect.signature(torch.onnx.export).parameters:
+            kwargs['dynamo'] = False  # Exportador TorchScript, compatible con dynamic_axes
+        tmp_path = Path(path).with_suffix('.tmp')
+        torch.onnx.export(
+            _LastHiddenState(model).eval(),
+            (dummy, dummy),
+            str(tmp_path),
+            input_names=['input_ids', 'attention_mask'],
+            output_names=['last_hidden_state'],
+            dynamic_axes={
+                'input_ids': {0: 'batch', 1: 'sequence'},
+                'attention_mask': {0: 'batch', 1: 'sequence'},
+                'last_hidden_state': {0: 'batch', 1: 'sequence'}
+            },
+            opset_version=14,
+            **kwargs
+        )
+        tmp_path.replace(path)
+
+    def forward(self, input_ids, attention_mask):
+        outputs = self.session.run(
+            ['last_hidden_state'],
+            {'input_ids': input_ids.cpu().numpy(), 'attention_mask': attention_mask.cpu().numpy()}
+        )
+        return torch.from_numpy(outputs[0])
+
+
+def load_backend(name, model, model_name, artifact_dir):
+    """Construye el backend `name` sobre el modelo fp32 ya cargado
+
+    Los artefactos derivados (pesos int8, grafo ONNX) se guardan en
+    `artifact_dir/<modelo>/` junto a un manifiesto `<artefacto>.json` con
+    `artifact_key(model)`, y se reutilizan solo mientras este coincida.
+    """
+    if name not in BACKENDS:
+        raise ValueError(f"Backend desconocido '{name}'. Opciones: {', '.join(BACKENDS)}")
+    if name == 'torch':
+        return TorchBackend(model)
+    path = _artifact_dir(artifact_dir, model_name)
+    if name == 'torch_int8':
+        return TorchInt8Backend(model, path)
+    return OnnxBackend(model, path)
+
+
+def cosine_drift(reference, candidate):
+    """Compara embeddings fila a fila mediante similitud coseno
+
+    Returns:
+        Diccionario con la similitud media/mínima y la deriva máxima (1 - mínima)
+    """
+    reference = np.asarray(reference, dtype=np.float64)
+    candidate = np.asarray(candidate, dtype=np.float64)
+    norms = np.linalg.norm(reference, axis=1) * np.linalg.norm(candidate, axis=1)
+    cosine = (reference * candidate).sum(axis=1) / np.maximum(norms, 1e-12)
+    return {
+        'mean_cosine': float(cosine.mean()),
+        'min_cosine': float(cosine.min()),
+        'max_drift': float(1.0 - cosine.min()),
+        'n_texts': int(len(cosine))
+    }
@@ -1,20 +1,60 @@
-# src/modules/llm_config.py
-import torch
-
-# Configuración automática de dispositivo
-LLM_DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
-
-# Modelo eficiente
-LLM_MODEL_NAME = "distilroberta-base"
-
-# Parámetros de rendimiento
-LLM_BATCH_SIZE = 16 if LLM_DEVICE == "cuda" else 8
-LLM_MAX_LENGTH = 128
-
-# Información para el reporte
-LLM_TECH_STACK = {
-    "framework": "PyTorch",
-    "model": LLM_MODEL_NAME,
-    "device": LLM_DEVICE,
-    "max_length": LLM_MAX_LENGTH
+# src/modules/llm_config.py
+from pathlib import Path
+import torch
+
+# Configuración automática de dispositivo
+LLM_DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
+
+# Modelo eficiente
+LLM_MODEL_NAME = "distilroberta-base"
+
+# Parámetros de rendimiento
+LLM_BATCH_SIZE = 64 if LLM_DEVICE == "cuda" else 32     # Máximo de textos por lote
+LLM_TOKEN_BUDGET = 8192 if LLM_DEVICE == "cuda" else 2048  # Máximo de tokens (con padding) por lote
+LLM_MAX_LENGTH = 128
+
+# Pooling de la última capa: 'cls' (primer token), 'mean' o 'max' (ambos con máscara de atención)
+LLM_POOLING = "cls"
+
+# Cargar el modelo solo desde la caché local: las descargas se hacen
+# únicamente con `python setup_resources.py` (False permite descargar al cargar)
+LLM_LOCAL_FILES_ONLY = True
+
+# Backend de inferencia: 'torch' (fp32 eager), 'torch_int8' (cuantización
+# dinámica de capas Linear) u 'onnx' (ONNX Runtime). Los dos últimos solo en CPU.
+LLM_BACKEND = "torch"
+LLM_BACKEND_DIR = Path(__file__).resolve().parent.parent.parent / 'models' / 'llm_backends'
+
+# Paralelismo en CPU (None = automático según las CPUs disponibles)
+LLM_NUM_THREADS = None         # Hilos de torch del proceso principal
+LLM_PARALLEL = False           # Embedding multiproceso por shards
+LLM_NUM_WORKERS = None         # Procesos worker
+LLM_THREADS_PER_WORKER = None  # Hilos de torch por worker
+LLM_SHARD_SIZE = 512           # Textos por shard enviado a un worker
+
+# Embedding en pipeline: tokenización, forward y copia de salida en hilos solapados
+LLM_PIPELINE = False
+LLM_PIPELINE_DEPTH = 4         # Lotes en cola entre etapas (contrapresión)
+LLM_PIPELINE_WINDOW = 8192     # Textos tokenizados y ordenados por longitud a la vez
+
+# Textos largos: en lugar de truncar a LLM_MAX_LENGTH, ventanas solapadas agregadas por comentario
+LLM_LONG_TEXT = False
+LLM_WINDOW_STRIDE = 96            # Tokens entre el inicio de ventanas consecutivas
+LLM_MAX_WINDOWS = 8               # Ventanas máximas por comentario (acota el coste de los más largos)
+LLM_WINDOW_AGGREGATION = "max"    # 'max', 'mean' o 'attention'
+
+# Caché persistente de embeddings (opcional, junto a models/)
+LLM_CACHE_ENABLED = False
+LLM_CACHE_DIR = Path(__file__).resolve().parent.parent.parent / 'models' / 'embedding_cache'
+LLM_CACHE_MAX_ENTRIES = 500_000    # Slots en disco (float32 x hidden_size cada uno)
+LLM_CACHE_MEMORY_ENTRIES = 10_000  # Entradas del LRU en memoria
+
+# Información para el reporte
+LLM_TECH_STACK = {
+    "framework": "PyTorch",
+    "model": LLM_MODEL_NAME,
+    "device": LLM_DEVICE,
+    "backend": LLM_BACKEND,
+    "max_length": LLM_MAX_LENGTH,
+    "pooling": LLM_POOLING
 }
\ No newline at end of file
@@ -1,48 +1,508 @@
-from .llm_config import LLM_MODEL_NAME, LLM_DEVICE, LLM_BATCH_SIZE, LLM_MAX_LENGTH
-from transformers import AutoTokenizer, AutoModel
-import torch
-
-class LLMEmbedder:
-    def __init__(self):
-        self.device = torch.device(LLM_DEVICE)
-        print(f"⚙️ Cargando modelo {LLM_MODEL_NAME} en {self.device}...")
-        
-        # Optimización para CPU
-        if self.device.type == "cpu":
-            torch.set_num_threads(4)  # Limitar hilos para evitar sobrecarga
-        
-        self.tokenizer = AutoTokenizer.from_pretrained(LLM_MODEL_NAME)
-        self.model = AutoModel.from_pretrained(LLM_MODEL_NAME).to(self.device)
-        self.model.eval()
-        print("✅ Modelo LLM cargado exitosamente")
-    
-    def embed(self, texts):
-        """Genera embeddings optimizados para CPU"""
-        if not texts:
-            return []
-            
-        if isinstance(texts, str):
-            texts = [texts]
-        
-        # Procesamiento por lotes reducido para CPU
-        batch_size = 4 if self.device.type == "cpu" else LLM_BATCH_SIZE
-        embeddings = []
-        
-        for i in range(0, len(texts), batch_size):
-            batch = texts[i:i+batch_size]
-            
-            inputs = self.tokenizer(
-                batch,
-                padding=True,
-                truncation=True,
-                max_length=LLM_MAX_LENGTH,
-                return_tensors="pt"
-            ).to(self.device)
-            
-            with torch.no_grad():
-                outputs = self.model(**inputs)
-                # Pooling eficiente para CPU
-                batch_embeds = outputs.last_hidden_state[:, 0, :].cpu()
-                embeddings.append(batch_embeds)
-        
-        return torch.cat(embeddings, dim=0).numpy()
\ No newline at end of file
+from .llm_config import (
+    LLM_MODEL_NAME, LLM_DEVICE, LLM_BATCH_SIZE, LLM_TOKEN_BUDGET, LLM_MAX_LENGTH, LLM_POOLING,
+    LLM_BACKEND, LLM_BACKEND_DIR, LLM_LOCAL_FILES_ONLY,
+    LLM_NUM_THREADS, LLM_PARALLEL, LLM_NUM_WORKERS, LLM_THREADS_PER_WORKER, LLM_SHARD_SIZE,
+    LLM_PIPELINE, LLM_PIPELINE_DEPTH, LLM_PIPELINE_WINDOW,
+    LLM_LONG_TEXT, LLM_WINDOW_STRIDE, LLM_MAX_WINDOWS, LLM_WINDOW_AGGREGATION,
+    LLM_CACHE_ENABLED, LLM_CACHE_DIR, LLM_CACHE_MAX_ENTRIES, LLM_CACHE_MEMORY_ENTRIES
+)
+from .embedding_cache import EmbeddingCache
+from .metrics import get_metrics
+from .llm_backends import TorchBackend, load_backend, cosine_drift
+from .parallel_embedding import ParallelEmbedder, available_cpus
+from transformers import AutoConfig, AutoTokenizer, AutoModel
+from contextlib import contextmanager
+import math
+import queue
+import threading
+import numpy as np
+import torch
+
+# Marca de fin de flujo entre las etapas del pipeline
+_DONE = object()
+
+POOLING_MODES = ('cls', 'mean', 'max')
+
+
+def pool_hidden(hidden, attention_mask, mode='cls'):
+    """Reduce la última capa (lote, tokens, dim) a un vector por texto
+
+    'mean' y 'max' ignoran las posiciones de padding según `attention_mask`.
+    """
+    if mode == 'cls':
+        return hidden[:, 0, :]
+    mask = attention_mask.to(hidden.device).unsqueeze(-1).bool()
+    if mode == 'mean':
+        summed = hidden.masked_fill(~mask, 0.0).sum(dim=1)
+        return summed / mask.sum(dim=1).clamp(min=1)
+    return hidden.masked_fill(~mask, float('-inf')).max(dim=1).values
+
+
+WINDOW_AGGREGATIONS = ('max', 'mean', 'attention')
+
+
+def aggregate_windows(embeddings, owners, method='max'):
+    """Agrega los embeddings por ventana (ventanas, dim) en uno por texto
+
+    `owners` es el texto de cada ventana: ordenado, con todas las ventanas de un
+    texto contiguas y al menos una ventana por texto.
+
+    - 'max' / 'mean': máximo o media por componente
+    - 'attention': media ponderada con softmax del producto escalar de cada
+      ventana con la media del texto (escalado por sqrt(dim))
+    """
+    embeddings = np.asarray(embeddings)
+    starts = np.flatnonzero(np.r_[True, owners[1:] != owners[:-1]])
+    counts = np.diff(np.r_[starts, len(owners)])
+    if method == 'max':
+        return np.maximum.reduceat(embeddings, starts, axis=0)
+    means = np.add.reduceat(embeddings, starts, axis=0) / counts[:, np.newaxis]
+    if method == 'mean':
+        return means.astype(embeddings.dtype)
+    if method != 'attention':
+        raise ValueError(f"Agregación desconocida: {method} (opciones: {', '.join(WINDOW_AGGREGATIONS)})")
+
+    group = np.repeat(np.arange(len(starts)), counts)
+    logits = (embeddings * means[group]).sum(axis=1) / math.sqrt(embeddings.shape[1])
+    weights = np.exp(logits - np.maximum.reduceat(logits, starts)[group])
+    weights /= np.add.reduceat(weights, starts)[group]
+    return np.add.reduceat(embeddings * weights[:, np.newaxis], starts, axis=0).astype(embeddings.dtype)
+
+
+def _put(q, item, stop):
+    """Encola respetando la contrapresión; abandona si el pipeline se detuvo"""
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+class LLMEmbedder:
+    def __init__(self, model_name=None, use_cache=None, backend=None, num_threads=None, parallel=None, max_length=None, pipeline=None, pooling=None,
+                 long_text=None, window_stride=None, max_windows=None, window_aggregation=None):
+        self.model_name = model_name or LLM_MODEL_NAME
+        self.max_length = max_length or LLM_MAX_LENGTH
+        self.pooling = pooling or LLM_POOLING
+        if self.pooling not in POOLING_MODES:
+            raise ValueError(f"Pooling desconocido: {self.pooling} (opciones: {', '.join(POOLING_MODES)})")
+        self.device = torch.device(LLM_DEVICE)
+        self.num_threads = num_threads
+        
+        # Backend de inferencia (fp32, int8 u ONNX); los cuantizados solo en CPU
+        backend = backend or LLM_BACKEND
+        if backend != 'torch' and self.device.type != 'cpu':
+            print(f"⚠️ Backend '{backend}' solo disponible en CPU, se usa 'torch'")
+            backend = 'torch'
+        self.backend_name = backend
+        
+        # Caché de embeddings en disco (clave: modelo + max_length + pooling + texto)
+        self.use_cache = LLM_CACHE_ENABLED if use_cache is None else use_cache
+        
+        # Embedding multiproceso (solo CPU); los workers se inician en el primer uso
+        if parallel is None:
+            parallel = LLM_PARALLEL
+        self.parallel = parallel and self.device.type == "cpu"
+        
+        # Tokenización y copia de salida solapadas con el forward
+        self.pipeline = LLM_PIPELINE if pipeline is None else pipeline
+        
+        # Textos largos: ventanas solapadas de max_length tokens en lugar de truncar
+        self.long_text = LLM_LONG_TEXT if long_text is None else long_text
+        self.window_stride = window_stride or LLM_WINDOW_STRIDE
+        self.max_windows = max_windows or LLM_MAX_WINDOWS
+        self.window_aggregation = window_aggregation or LLM_WINDOW_AGGREGATION
+        if self.window_aggregation not in WINDOW_AGGREGATIONS:
+            raise ValueError(f"Agregación desconocida: {self.window_aggregation} (opciones: {', '.join(WINDOW_AGGREGATIONS)})")
+        
+        # El transformer se carga de forma perezosa en el primer embed
+        self.tokenizer = None
+        self.model = None
+        self.backend = None
+        self._cache = None
+        self._pool = None
+    
+    def load(self):
+        """Carga tokenizer, modelo y backend (se llama automáticamente al primer uso)"""
+        if self.model is not None:
+            if self.backend is None:
+                # Pickle del formato original: trae el transformer cargado, solo falta el backend
+                self.attach(self.tokenizer, self.model)
+            return
+        print(f"⚙️ Cargando modelo {self.model_name} en {self.device}...")
+        try:
+            self.tokenizer = AutoTokenizer.from_pretrained(self.model_name, local_files_only=LLM_LOCAL_FILES_ONLY)
+            model = AutoModel.from_pretrained(self.model_name, local_files_only=LLM_LOCAL_FILES_ONLY)
+        except OSError as e:
+            if not LLM_LOCAL_FILES_ONLY:
+                raise
+            raise OSError(f"{self.model_name} no está en la caché local; "
+                          f"ejecute 'python setup_resources.py' para descargarlo") from e
+        self.attach(self.tokenizer, model)
+    
+    def _set_threads(self):
+        """Optimización para CPU: por defecto usar todas las CPUs disponibles"""
+        if self.device.type == "cpu":
+            torch.set_num_threads(self.num_threads or LLM_NUM_THREADS or available_cpus())
+    
+    def attach(self, tokenizer, model):
+        """Usa un tokenizer/modelo ya cargados (p. ej. por setup_resources) sin volver a leerlos"""
+        self._set_threads()
+        self.tokenizer = tokenizer
+        model = model.to(self.device)
+        model.eval()
+        self.backend = load_backend(self.backend_name, model, self.model_name, LLM_BACKEND_DIR)
+        self.model = model
+        print(f"✅ Modelo LLM cargado exitosamente (backend: {self.backend.name})")
+    
+    @property
+    def hidden_size(self):
+        """Dimensión del embedding (sin cargar los pesos si aún no hacen falta)"""
+        if self.model is not None:
+            return self.model.config.hidden_size
+        return AutoConfig.from_pretrained(self.model_name, local_files_only=LLM_LOCAL_FILES_ONLY).hidden_size
+    
+    @property
+    def cache(self):
+        if self._cache is None and self.use_cache:
+            self._cache = EmbeddingCache(
+                LLM_CACHE_DIR,
+                self.cache_namespace(),
+                self.hidden_size,
+                max_entries=LLM_CACHE_MAX_ENTRIES,
+                memory_entries=LLM_CACHE_MEMORY_ENTRIES
+            )
+            print(f"🗃️ Caché de embeddings activa: {self._cache.path} ({len(self._cache.slots)} entradas)")
+        return self._cache
+    
+    @contextmanager
+    def cache_disabled(self):
+        """Desactiva temporalmente la caché (p. ej. para medir tiempos reales de embedding)"""
+        use_cache, cache = self.use_cache, self._cache
+        self.use_cache, self._cache = False, None
+        try:
+            yield self
+        finally:
+            self.use_cache, self._cache = use_cache, cache
+    
+    def cache_namespace(self):
+        """Parámetros que determinan el embedding y forman parte de la clave de caché"""
+        namespace = f"{self.model_name}|max_length={self.max_length}|pooling={self.pooling}|backend={self.backend_name}"
+        if self.long_text:
+            namespace += f"|windows={self.window_stride}x{self.max_windows}:{self.window_aggregation}"
+        return namespace
+    
+    def window_options(self):
+        """Opciones de ventanas para textos largos (para workers y manifest)"""
+        return {
+            'long_text': self.long_text,
+            'window_stride': self.window_stride,
+            'max_windows': self.max_windows,
+            'window_aggregation': self.window_aggregation
+        }
+    
+    def embed(self, texts):
+        """Genera embeddings optimizados para CPU"""
+        if not texts:
+            return []
+            
+        if isinstance(texts, str):
+            texts = [texts]
+        
+        metrics = get_metrics()
+        metrics.incr('embed.texts', len(texts))
+        cache = self.cache
+        if cache is None:
+            return self._compute(texts)
+        
+        # Si todo está en caché el transformer ni siquiera se carga
+        with metrics.timer('embed.cache_lookup'):
+            embeddings, missing, keys = cache.get_many(texts)
+        metrics.incr('embed.cache_hits', len(texts) - len(missing))
+        metrics.incr('embed.cache_misses', len(missing))
+        if missing:
+            # Calcular una sola vez cada texto distinto que no esté en caché
+            unique = {}
+            for i in missing:
+                unique.setdefault(keys[i], i)
+            computed = self._compute([texts[i] for i in unique.values()])
+            by_key = dict(zip(unique.keys(), computed))
+            for i in missing:
+                embeddings[i] = by_key[keys[i]]
+            cache.put_many(list(unique.keys()), computed)
+        cache.flush()
+        if metrics.enabled:
+            metrics.gauge('embed.cache_hit_rate', cache.stats()['hit_rate'])
+        return embeddings
+    
+    def _compute(self, texts):
+        """Calcula embeddings en este proceso o repartidos entre workers"""
+        if not self.parallel or len(texts) <= LLM_SHARD_SIZE:
+            return self._embed_texts(texts)
+        if self._pool is None:
+            self._pool = ParallelEmbedder(
+                self.model_name,
+                self.backend_name,
+                self.max_length,
+                pooling=self.pooling,
+                window_options=self.window_options(),
+                num_workers=LLM_NUM_WORKERS,
+                threads_per_worker=LLM_THREADS_PER_WORKER,
+                shard_size=LLM_SHARD_SIZE
+            )
+        return self._pool.embed(texts, self.hidden_size)
+    
+    def close(self):
+        """Detiene los workers de embedding paralelo y cierra la caché, si existen"""
+        if self._pool is not None:
+            self._pool.close()
+            self._pool = None
+        if self._cache is not None:
+            self._cache.close()
+            self._cache = None
+    
+    def __getstate__(self):
+        # Ni los pesos del transformer ni los workers se serializan: solo la
+        # configuración. El modelo se vuelve a cargar por nombre en el primer uso.
+        state = self.__dict__.copy()
+        for attr in ('tokenizer', 'model', 'backend', '_pool'):
+            state[attr] = None
+        return state
+    
+    def __setstate__(self, state):
+        # Pickles anteriores a estas opciones. El formato original solo guardaba
+        # device, tokenizer y model (distilroberta-base, 128 tokens, fp32, sin caché)
+        state.setdefault('model_name', 'distilroberta-base')
+        state.setdefault('max_length', 128)
+        state.setdefault('backend_name', 'torch')
+        state.setdefault('use_cache', LLM_CACHE_ENABLED)
+        state.setdefault('parallel', False)
+        state.setdefault('num_threads', None)
+        for attr in ('tokenizer', 'model', 'backend', '_cache', '_pool'):
+            state.setdefault(attr, None)
+        # Pooling CLS y sin pipeline
+        state.setdefault('pooling', 'cls')
+        state.setdefault('pipeline', False)
+        state.setdefault('long_text', False)
+        state.setdefault('window_stride', LLM_WINDOW_STRIDE)
+        state.setdefault('max_windows', LLM_MAX_WINDOWS)
+        state.setdefault('window_aggregation', LLM_WINDOW_AGGREGATION)
+        self.__dict__.update(state)
+    
+    def _tokenize(self, texts):
+        """Ids de tokens de cada texto (con tokens especiales, truncados a max_length)"""
+        with get_metrics().timer('embed.tokenize'):
+            return self.tokenizer(
+                texts,
+                truncation=True,
+                max_length=self.max_length
+            )['input_ids']
+    
+    def _window_rows(self, texts):
+        """Filas de tokens a embeber: una por texto corto y ventanas solapadas por texto largo
+        
+        Solo se vuelven a tokenizar (sin truncar) los textos que llenan max_length;
+        el resto conserva exactamente la fila del modo normal. Cada texto largo da
+        hasta `max_windows` ventanas separadas `window_stride` tokens; si harían
+        falta más, se reparten uniformemente para cubrir también el final.
+        
+        Returns:
+            (filas de ids, texto de cada fila) con las ventanas de un texto contiguas
+        """
+        input_ids = self._tokenize(texts)
+        long_texts = [i for i, ids in enumerate(input_ids) if len(ids) >= self.max_length]
+        if not long_texts:
+            return input_ids, np.arange(len(texts))
+        
+        metrics = get_metrics()
+        with metrics.timer('embed.tokenize'):
+            full = self.tokenizer([texts[i] for i in long_texts], add_special_tokens=False)['input_ids']
+        prefix, suffix = self._special_tokens()
+        body = self.max_length - len(prefix) - len(suffix)
+        stride = min(self.window_stride, body)   # Sin huecos entre ventanas
+        windows = {}
+        for i, tokens in zip(long_texts, full):
+            extra = max(len(tokens) - body, 0)
+            n_windows = min(math.ceil(extra / stride) + 1, self.max_windows)
+            starts = np.linspace(0, extra, n_windows).round().astype(int)
+            windows[i] = [prefix + tokens[s:s + body] + suffix for s in starts]
+        
+        rows, owners = [], []
+        for i, ids in enumerate(input_ids):
+            text_rows = windows.get(i, [ids])
+            rows.extend(text_rows)
+            owners.extend([i] * len(text_rows))
+        metrics.incr('embed.long_texts', len(long_texts))
+        metrics.incr('embed.windows', len(rows) - len(texts) + len(long_texts))
+        return rows, np.asarray(owners)
+    
+    def _special_tokens(self):
+        """Tokens especiales que el tokenizer añade antes y después de un texto (p. ej. <s> y </s>)"""
+        with_special = self.tokenizer('a')['input_ids']
+        plain = self.tokenizer('a', add_special_tokens=False)['input_ids']
+        for k in range(len(with_special) - len(plain) + 1):
+            if with_special[k:k + len(plain)] == plain:
+                return with_special[:k], with_special[k + len(plain):]
+        raise ValueError("No se pudieron identificar los tokens especiales del tokenizer")
+    
+    def _text_batches(self, texts):
+        """Lotes tokenizando por tramos de LLM_PIPELINE_WINDOW textos (el productor entrega pronto)"""
+        for offset in range(0, len(texts), LLM_PIPELINE_WINDOW):
+            for idx, inputs in self._iter_batches(self._tokenize(texts[offset:offset + LLM_PIPELINE_WINDOW])):
+                yield idx + offset, inputs
+    
+    def _iter_batches(self, input_ids):
+        """Ordena las filas de tokens por longitud y las agrupa por presupuesto de tokens
+        
+        Devuelve (índices originales, entradas con padding) para cada lote. Como
+        las filas de un lote tienen longitudes parecidas, casi no hay padding.
+        """
+        metrics = get_metrics()
+        lengths = np.fromiter(map(len, input_ids), dtype=np.int64, count=len(input_ids))
+        order = np.argsort(lengths, kind='stable')
+        pad_id = self.tokenizer.pad_token_id
+        metrics.incr('embed.tokens', int(lengths.sum()))
+        
+        start = 0
+        while start < len(order):
+            # Orden ascendente: la longitud del lote es la del último texto añadido
+            end = start + 1
+            while (end < len(order) and end - start < LLM_BATCH_SIZE
+                   and (end - start + 1) * lengths[order[end]] <= LLM_TOKEN_BUDGET):
+                end += 1
+            
+            idx = order[start:end]
+            width = int(lengths[idx[-1]])
+            with metrics.timer('embed.pad'):
+                # Relleno vectorizado: la máscara marca las posiciones reales de cada fila
+                mask = np.arange(width) < lengths[idx][:, np.newaxis]
+                ids = np.full((len(idx), width), pad_id, dtype=np.int64)
+                ids[mask] = np.concatenate([input_ids[i] for i in idx])
+                ids, mask = torch.from_numpy(ids), torch.from_numpy(mask.astype(np.int64))
+            metrics.incr('embed.batches')
+            metrics.incr('embed.padded_tokens', len(idx) * width)
+            
+            yield idx, {'input_ids': ids, 'attention_mask': mask}
+            start = end
+    
+    def _embed_texts(self, texts):
+        """Pasada del transformer sobre `texts` (sin caché), en el orden original"""
+        self.load()
+        if self.long_text:
+            rows, owners = self._window_rows(texts)
+            embeddings = self._embed_rows(self._iter_batches(rows), len(rows))
+            if len(rows) == len(texts):
+                return embeddings
+            return aggregate_windows(embeddings, owners, self.window_aggregation)
+        # Con pipeline la tokenización ocurre por tramos dentro del productor
+        batches = self._text_batches(texts) if self.pipeline else self._iter_batches(self._tokenize(texts))
+        return self._embed_rows(batches, len(texts))
+    
+    def _embed_rows(self, batches, n_rows):
+        """Forward y pooling de los lotes de `batches` hacia un arreglo (n_rows, dim)"""
+        embeddings = np.empty((n_rows, self.model.config.hidden_size), dtype=np.float32)
+        if self.pipeline:
+            return self._embed_pipelined(batches, embeddings)
+        metrics = get_metrics()
+        
+        for idx, inputs in batches:
+            with metrics.timer('embed.forward'):
+                hidden = self.backend.forward(
+                    inputs['input_ids'].to(self.device),
+                    inputs['attention_mask'].to(self.device)
+                )
+            with metrics.timer('embed.pool'):
+                embeddings[idx] = pool_hidden(hidden, inputs['attention_mask'], self.pooling).cpu().numpy()
+        
+        return embeddings
+    
+    def _embed_pipelined(self, batches_source, embeddings):
+        """Igual que `_embed_rows`, pero con tres etapas solapadas
+        
+        - Productor (hilo): consume `batches_source` (tokeniza y rellena por tramos de LLM_PIPELINE_WINDOW textos)
+        - Forward (hilo actual): pasa cada lote por el backend
+        - Escritor (hilo): pooling y copia directa a `embeddings` en su posición original
+        
+        Las colas tienen tamaño LLM_PIPELINE_DEPTH, así que el productor nunca se
+        adelanta más de unos pocos lotes (memoria acotada).
+        """
+        metrics = get_metrics()
+        batches = queue.Queue(maxsize=LLM_PIPELINE_DEPTH)
+        outputs = queue.Queue(maxsize=LLM_PIPELINE_DEPTH)
+        stop = threading.Event()
+        writer_errors = []
+        
+        def produce():
+            try:
+                for item in batches_source:
+                    if not _put(batches, item, stop):
+                        return
+            except BaseException as e:
+                _put(batches, e, stop)
+                return
+            _put(batches, _DONE, stop)
+        
+        def write():
+            while True:
+                item = outputs.get()
+                if item is _DONE:
+                    return
+                if writer_errors:
+                    continue  # Tras un error solo se vacía la cola para no bloquear el forward
+                try:
+                    idx, hidden, attention_mask = item
+                    with metrics.timer('embed.pool'):
+                        embeddings[idx] = pool_hidden(hidden, attention_mask, self.pooling).cpu().numpy()
+                except BaseException as e:
+                    writer_errors.append(e)
+        
+        producer = threading.Thread(target=produce, name='embed-tokenize', daemon=True)
+        writer = threading.Thread(target=write, name='embed-write', daemon=True)
+        producer.start()
+        writer.start()
+        try:
+            while True:
+                item = batches.get()
+                if item is _DONE:
+                    break
+                if isinstance(item, BaseException):
+                    raise item
+                idx, inputs = item
+                with metrics.timer('embed.forward'):
+                    hidden = self.backend.forward(
+                        inputs['input_ids'].to(self.device),
+                        inputs['attention_mask'].to(self.device)
+                    )
+                outputs.put((idx, hidden, inputs['attention_mask']))
+        finally:
+            stop.set()
+            outputs.put(_DONE)
+            producer.join()
+            writer.join()
+        
+        if writer_errors:
+            raise writer_errors[0]
+        return embeddings
+    
+    def parity_check(self, texts):
+        """Mide la deriva coseno de los embeddings del backend actual frente a fp32 eager"""
+        if isinstance(texts, str):
+            texts = [texts]
+        self.load()
+        candidate = self._embed_texts(texts)
+        
+        if self.backend.name == 'torch':
+            reference = candidate
+        else:
+            backend = self.backend
+            self.backend = TorchBackend(self.model)
+            try:
+                reference = self._embed_texts(texts)
+            finally:
+                self.backend = backend
+        
+        report = cosine_drift(reference, candidate)
+        report['backend'] = self.backend.name
+        return report
@@ -0,0 +1,229 @@
+import json
+import os
+import re
+import sys
+import threading
+import time
+
+try:
+    import resource  # Solo en sistemas tipo Unix
+except ImportError:
+    resource = None
+
+
+class _Timer:
+    """Context manager que acumula la duración de un bloque en el registro"""
+    __slots__ = ('registry', 'name', 'start')
+
+    def __init__(self, registry, name):
+        self.registry = registry
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.registry.observe(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class _NullTimer:
+    """Timer que no hace nada (instrumentación desactivada)"""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class NullMetrics:
+    """Registro desactivado: todas las operaciones son no-ops sin asignaciones"""
+    enabled = False
+
+    def timer(self, name):
+        return _NULL_TIMER
+
+    def observe(self, name, seconds):
+        pass
+
+    def incr(self, name, value=1):
+        pass
+
+    def gauge(self, name, value):
+        pass
+
+    def snapshot(self):
+        return {'timers': {}, 'counters': {}, 'gauges': {}}
+
+    def emit(self):
+        pass
+
+    def reset(self):
+        pass
+
+
+class Metrics(NullMetrics):
+    """Registro en memoria de temporizadores, contadores y gauges por etapa"""
+    enabled = True
+
+    def __init__(self, sinks=None):
+        self.sinks = list(sinks or [])
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.timers = {}    # nombre -> [count, total, min, max]
+            self.counters = {}
+            self.gauges = {}
+
+    def timer(self, name):
+        return _Timer(self, name)
+
+    def observe(self, name, seconds):
+        with self._lock:
+            stat = self.timers.get(name)
+            if stat is None:
+                self.timers[name] = [1, seconds, seconds, seconds]
+            else:
+                stat[0] += 1
+                stat[1] += seconds
+                stat[2] = min(stat[2], seconds)
+                stat[3] = max(stat[3], seconds)
+
+    def incr(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def gauge(self, name, value):
+        with self._lock:
+            self.gauges[name] = value
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'timers': {
+                    name: {'count': c, 'total_s': t, 'mean_s': t / c, 'min_s': lo, 'max_s': hi}
+                    for name, (c, t, lo, hi) in self.timers.items()
+                },
+                'counters': dict(self.counters),
+                'gauges': dict(self.gauges)
+            }
+
+    def emit(self):
+        """Envía la instantánea actual a todos los sinks configurados"""
+        snapshot = self.snapshot()
+        for sink in self.sinks:
+            sink.write(snapshot)
+
+
+class InMemorySink:
+    """Guarda la última instantánea emitida"""
+
+    def __init__(self):
+        self.last = None
+
+    def write(self, snapshot):
+        self.last = snapshot
+
+
+class JsonLinesSink:
+    """Escribe una línea JSON por emisión (fichero o stream)"""
+
+    def __init__(self, target=None):
+        self.target = target
+
+    def write(self, snapshot):
+        line = json.dumps({'timestamp': time.time(), **snapshot})
+        if self.target is None or hasattr(self.target, 'write'):
+            stream = self.target or sys.stderr
+            stream.write(line + '\n')
+            stream.flush()
+        else:
+            with open(self.target, 'a', encoding='utf-8') as f:
+                f.write(line + '\n')
+
+
+def _prom_name(prefix, name):
+    return re.sub(r'[^a-zA-Z0-9_]', '_', f'{prefix}_{name}')
+
+
+def render_prometheus(snapshot, prefix='toxicity'):
+    """Formato de texto de Prometheus (timers como summary: _count y _sum en segundos)"""
+    lines = []
+    for name, stat in sorted(snapshot['timers'].items()):
+        metric = _prom_name(prefix, name) + '_seconds'
+        lines.append(f'# TYPE {metric} summary')
+        lines.append(f'{metric}_count {stat["count"]}')
+        lines.append(f'{metric}_sum {stat["total_s"]:.9f}')
+    for name, value in sorted(snapshot['counters'].items()):
+        metric = _prom_name(prefix, name) + '_total'
+        lines.append(f'# TYPE {metric} counter')
+        lines.append(f'{metric} {value}')
+    for name, value in sorted(snapshot['gauges'].items()):
+        metric = _prom_name(prefix, name)
+        lines.append(f'# TYPE {metric} gauge')
+        lines.append(f'{metric} {value}')
+    return '\n'.join(lines) + '\n'
+
+
+class PrometheusSink:
+    """Reescribe un fichero .prom (p. ej. para el textfile collector de node_exporter)"""
+
+    def __init__(self, path, prefix='toxicity'):
+        self.path = path
+        self.prefix = prefix
+        self.last = None
+
+    def write(self, snapshot):
+        self.last = render_prometheus(snapshot, self.prefix)
+        if self.path is not None:
+            tmp_path = f'{self.path}.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(self.last)
+            os.replace(tmp_path, self.path)
+
+
+# Registro global; desactivado por defecto (coste prácticamente nulo)
+_registry = NullMetrics()
+
+
+def get_metrics():
+    return _registry
+
+
+def enable_metrics(sinks=None):
+    """Activa la instrumentación y devuelve el registro"""
+    global _registry
+    _registry = Metrics(sinks)
+    return _registry
+
+
+def disable_metrics():
+    global _registry
+    _registry = NullMetrics()
+
+
+def peak_rss_mb():
+    """Pico de memoria residente del proceso en MB (NaN si el SO no lo expone)"""
+    if resource is None:
+        return float('nan')
+    # ru_maxrss está en KB en Linux y en bytes en macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def current_rss_mb():
+    """Memoria residente actual en MB (en Linux vía /proc; si no, el pico)"""
+    try:
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError, AttributeError):
+        return peak_rss_mb()
@@ -1,16 +1,39 @@
 from .llm_embedder import LLMEmbedder
+from .embedding_store import EmbeddingStore
+from .fast_forest import FlatForest
+from .reduction import EmbeddingReducer
+from .contextual_adjustment import ContextualAdjuster
+from .metrics import get_metrics, peak_rss_mb, current_rss_mb
+from .parallel_embedding import available_cpus
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.calibration import CalibratedClassifierCV
+from sklearn.utils.class_weight import compute_class_weight
+from pathlib import Path
+import json
+import time
+import joblib
 import pandas as pd
 import numpy as np
 from imblearn.over_sampling import SMOTE
 
+# Versión del formato de artefacto (directorio con manifest.json)
+ARTIFACT_FORMAT_VERSION = 1
+
 class ToxicityModel:
-    def __init__(self, use_llm=True):
+    def __init__(self, use_llm=True, use_cache=None, reduce_dim=None, reduce_method='pca', adjuster=None, **embedder_options):
         self.use_llm = use_llm
+        self.threshold = 0.5
+        # Post-ajuste contextual opcional (sarcasmo/identidad/sentimiento) sobre las probabilidades
+        self.adjuster = adjuster
+        # Reducción opcional de los embeddings (PCA/proyección aleatoria a float16) antes del bosque
+        self.reducer = None
         
         if self.use_llm:
-            self.embedder = LLMEmbedder()
+            # use_cache=None toma el valor por defecto de llm_config; el resto de
+            # opciones (model_name, backend, max_length, pooling...) van al LLMEmbedder
+            self.embedder = LLMEmbedder(use_cache=use_cache, **embedder_options)
+            if reduce_dim:
+                self.reducer = EmbeddingReducer(reduce_method, reduce_dim)
         else:
             from sklearn.feature_extraction.text import TfidfVectorizer
             self.vectorizer = TfidfVectorizer(max_features=15000)
@@ -22,35 +45,412 @@ class ToxicityModel:
             class_weight='balanced',  # Penalizar más los falsos positivos
             n_jobs=-1
         )
+        # Copia aplanada del bosque para inferencia de baja latencia (solo embeddings densos)
+        self.forest = None
+    
+    def compile_forest(self):
+        """Exporta el RandomForest entrenado a un FlatForest (mismas probabilidades, menos latencia)"""
+        self.forest = FlatForest.from_sklearn(self.clf) if self.use_llm else None
+        return self.forest
+    
+    def _reduce(self, X, fit=False):
+        """Aplica la reducción de embeddings, si la hay (con `fit` la ajusta antes)"""
+        if self.reducer is None:
+            return X
+        if fit:
+            self.reducer.fit(X)
+        return self.reducer.transform(X)
     
-    def train(self, texts, labels):
+    def train(self, texts, labels, store_path=None):
+        """Entrenamiento completo; con `store_path` guarda además los embeddings para `train_incremental`"""
+        metrics = get_metrics()
+        metrics.incr('train.texts', len(texts))
         if self.use_llm:
             if isinstance(texts, pd.Series):
                 texts = texts.tolist()
             print("🔄 Generando embeddings con LLM...")
-            X = self.embedder.embed(texts)
+            with metrics.timer('train.embed'):
+                X = self.embedder.embed(texts)
             print(f"📊 Embeddings generados: {X.shape[0]} muestras, {X.shape[1]} dimensiones")
+            if store_path is not None:
+                store = self.open_store(store_path)
+                self._store_new(store, texts, X, labels)
+                print(f"🗄️ Almacén de embeddings: {len(store)} filas en {store.path}")
+            # El almacén guarda los embeddings completos; el bosque ve los reducidos
+            X = self._reduce(X, fit=True)
         else:
-            X = self.vectorizer.fit_transform(texts)
+            with metrics.timer('train.vectorize'):
+                X = self.vectorizer.fit_transform(texts)
         
         # Balancear clases adicionalmente
         print("🔁 Balanceando clases con SMOTE...")
         sm = SMOTE(random_state=42)
-        X_res, y_res = sm.fit_resample(X, labels)
+        with metrics.timer('train.smote'):
+            X_res, y_res = sm.fit_resample(X, labels)
+        metrics.incr('train.smote_samples', X_res.shape[0] - X.shape[0])
         
         print("🧠 Entrenando clasificador...")
-        self.clf.fit(X_res, y_res)
+        # Un entrenamiento completo parte de cero aunque antes hubiera incrementales
+        self.clf.set_params(warm_start=False, class_weight='balanced')
+        with metrics.timer('train.fit'):
+            self.clf.fit(X_res, y_res)
+        self.compile_forest()
         print("✅ Modelo entrenado")
+        metrics.emit()
+    
+    def open_store(self, path):
+        """Almacén de embeddings ligado a la configuración del embedder actual"""
+        return EmbeddingStore(path, self.embedder.cache_namespace(), self.embedder.hidden_size)
+    
+    @staticmethod
+    def _store_new(store, texts, X, labels):
+        """Añade al almacén las filas cuyo texto aún no está (la última etiqueta gana)"""
+        labels = np.asarray(labels, dtype=np.int8)
+        new = {}
+        for i, text in enumerate(texts):
+            key = store.key(text)
+            if key not in store.index:
+                new[key] = i
+        rows = list(new.values())
+        store.append(list(new.keys()), np.asarray(X)[rows], labels[rows])
+    
+    def train_incremental(self, texts, labels, store_path, n_new_trees=20, max_trees=None):
+        """Reentrena con filas nuevas sin volver a embeber ni reajustar todo
+        
+        Solo se embeben los textos que no están en el almacén; los ya guardados
+        solo actualizan su etiqueta. El bosque crece con `n_new_trees` árboles
+        (warm start) ajustados sobre todo el almacén leído de disco. En lugar de
+        SMOTE se usan pesos de clase calculados sobre el almacén. Con
+        `max_trees` se descartan los árboles más antiguos.
+        
+        Returns:
+            Diccionario con el trabajo hecho y el ahorro estimado frente a un
+            reentrenamiento completo
+        """
+        if not self.use_llm:
+            raise ValueError("El entrenamiento incremental requiere use_llm=True (embeddings densos)")
+        metrics = get_metrics()
+        start = time.perf_counter()
+        if isinstance(texts, pd.Series):
+            texts = texts.tolist()
+        labels = np.asarray(labels, dtype=np.int8)
+        store = self.open_store(store_path)
+        
+        # Textos ya almacenados: solo se corrige la etiqueta
+        keys = [store.key(text) for text in texts]
+        rows = store.lookup(keys)
+        known = rows >= 0
+        relabeled = store.set_labels(rows[known], labels[known])
+        
+        # Textos nuevos: cada texto distinto se embebe una sola vez
+        new = {}
+        for i in np.flatnonzero(~known):
+            new[keys[i]] = i
+        print(f"🔄 Generando embeddings de {len(new)} textos nuevos (de {len(texts)} recibidos)...")
+        embed_start = time.perf_counter()
+        if new:
+            with metrics.timer('train.embed'):
+                X_new = self.embedder.embed([texts[i] for i in new.values()])
+            store.append(list(new.keys()), X_new, labels[list(new.values())])
+        embed_seconds = time.perf_counter() - embed_start
+        metrics.incr('train.texts', len(new))
+        if len(store) == 0:
+            raise ValueError("El almacén de embeddings está vacío y no se recibieron textos: no hay nada que entrenar")
+        
+        # Sin SMOTE: el desbalance se compensa con pesos de clase sobre todo el almacén
+        fitted = hasattr(self.clf, 'estimators_')
+        # Con un bosque ya ajustado la reducción se mantiene (los árboles dependen de ella)
+        X, y = self._reduce(store.vectors(), fit=not fitted), store.labels
+        classes = np.unique(y)
+        class_weight = dict(zip(classes, compute_class_weight('balanced', classes=classes, y=y)))
+        n_before = len(self.clf.estimators_) if fitted else 0
+        n_estimators = n_before + n_new_trees if fitted else self.clf.n_estimators
+        self.clf.set_params(warm_start=fitted, n_estimators=n_estimators, class_weight=class_weight)
+        
+        print(f"🌲 Añadiendo {n_estimators - n_before} árboles sobre {len(store)} filas del almacén...")
+        fit_start = time.perf_counter()
+        with metrics.timer('train.fit'):
+            self.clf.fit(X, y)
+        fit_seconds = time.perf_counter() - fit_start
+        trees_fit = n_estimators - n_before
+        
+        if max_trees is not None and len(self.clf.estimators_) > max_trees:
+            # Descartar los árboles más antiguos (ajustados con menos datos)
+            self.clf.estimators_ = self.clf.estimators_[-max_trees:]
+            self.clf.n_estimators = max_trees
+        n_trees = len(self.clf.estimators_)
+        self.compile_forest()
+        
+        # Estimación de un reentrenamiento completo con los costes medidos ahora
+        # (reembeber todo el almacén y ajustar un bosque del mismo tamaño; sin contar SMOTE)
+        seconds = time.perf_counter() - start
+        full_seconds = None
+        if new and trees_fit:
+            full_seconds = embed_seconds / len(new) * len(store) + fit_seconds / trees_fit * n_trees
+        report = {
+            'received': len(texts),
+            'embedded': len(new),
+            'relabeled': relabeled,
+            'store_size': len(store),
+            'trees_fit': trees_fit,
+            'trees_total': n_trees,
+            'embed_saved': 1 - len(new) / len(store),
+            'trees_saved': 1 - trees_fit / n_trees,
+            'seconds': seconds,
+            'estimated_full_seconds': full_seconds
+        }
+        print(f"✅ Reentrenamiento incremental en {seconds:.2f}s: {len(new)}/{len(store)} textos embebidos "
+              f"({report['embed_saved']:.1%} evitado), {trees_fit}/{n_trees} árboles ajustados")
+        if full_seconds:
+            print(f"💾 Reentrenamiento completo estimado: {full_seconds:.2f}s ({full_seconds / seconds:.1f}x más lento)")
+        metrics.emit()
+        return report
+    
+    def train_out_of_core(self, texts, labels, work_dir, dtype='float16', chunk_size=8192, memory_budget_mb=4096, random_state=42):
+        """Entrenamiento con memoria acotada para corpus que no caben en RAM
+        
+        Los embeddings se escriben por bloques en un memmap en disco (`dtype`,
+        float16 por defecto) en lugar de concatenarse en memoria; con reducción,
+        esta se ajusta sobre el primer bloque y el memmap guarda ya los
+        vectores reducidos. No se usa
+        SMOTE: el desbalance se compensa con pesos de clase. Si la matriz float32
+        que necesita el bosque no cabe en `memory_budget_mb` (descontando la
+        memoria ya ocupada), se submuestrea de forma estratificada, conservando
+        primero la clase minoritaria.
+        
+        Returns:
+            Diccionario con filas usadas, tamaño en disco y pico de RSS (MB)
+        """
+        if not self.use_llm:
+            raise ValueError("El entrenamiento fuera de memoria requiere use_llm=True (embeddings densos)")
+        metrics = get_metrics()
+        if isinstance(texts, pd.Series):
+            texts = texts.tolist()
+        labels = np.asarray(labels, dtype=np.int8)
+        n = len(texts)
+        work_dir = Path(work_dir)
+        work_dir.mkdir(parents=True, exist_ok=True)
+        
+        # 1. Embeddings por bloques directamente a disco
+        #    (el memmap se crea tras el primer bloque: la reducción fija entonces la dimensión)
+        X_disk = None
+        print(f"🔄 Generando embeddings con LLM en bloques de {chunk_size} hacia {work_dir}...")
+        with metrics.timer('train.embed'):
+            for start in range(0, n, chunk_size):
+                X_chunk = self._reduce(self.embedder.embed(texts[start:start + chunk_size]), fit=start == 0)
+                if X_disk is None:
+                    X_disk = np.memmap(work_dir / f'embeddings.{np.dtype(dtype).name}', dtype=dtype, mode='w+',
+                                       shape=(n, X_chunk.shape[1]))
+                X_disk[start:start + chunk_size] = X_chunk
+                print(f"📦 Embebidos {min(start + chunk_size, n)}/{n} textos (RSS pico {peak_rss_mb():.0f} MB)")
+        X_disk.flush()
+        dim = X_disk.shape[1]
+        metrics.incr('train.texts', n)
+        
+        # 2. Filas que caben en el presupuesto: copia float32 para el bosque más
+        #    los índices/pesos por muestra que cada hilo asigna al construir su árbol
+        n_jobs = self.clf.n_jobs if self.clf.n_jobs and self.clf.n_jobs > 0 else available_cpus()
+        row_bytes = dim * 4 + 40 * n_jobs
+        free_mb = memory_budget_mb - current_rss_mb()
+        max_rows = max(int(free_mb * 1024 * 1024 / row_bytes), 0)
+        if max_rows < 2:
+            raise MemoryError(f"Presupuesto de {memory_budget_mb} MB insuficiente (RSS actual {current_rss_mb():.0f} MB)")
+        
+        rows = np.arange(n)
+        if n > max_rows:
+            rng = np.random.default_rng(random_state)
+            by_class = sorted((np.flatnonzero(labels == c) for c in np.unique(labels)), key=len)
+            # Clases de menor a mayor: cada una toma hasta su parte del cupo restante
+            chosen, remaining = [], max_rows
+            for i, idx in enumerate(by_class):
+                take = min(len(idx), remaining // (len(by_class) - i))
+                chosen.append(rng.choice(idx, take, replace=False))
+                remaining -= take
+            rows = np.sort(np.concatenate(chosen))
+            print(f"✂️ Submuestreo estratificado: {len(rows)}/{n} filas caben en {memory_budget_mb} MB")
+        
+        # Lectura secuencial del memmap hacia un único arreglo float32
+        X = np.empty((len(rows), dim), dtype=np.float32)
+        for start in range(0, len(rows), chunk_size):
+            X[start:start + chunk_size] = X_disk[rows[start:start + chunk_size]]
+        y = labels[rows]
+        del X_disk
+        
+        # 3. Bosque con pesos de clase en lugar de SMOTE
+        print("🧠 Entrenando clasificador (pesos de clase, sin SMOTE)...")
+        self.clf.set_params(warm_start=False, class_weight='balanced')
+        with metrics.timer('train.fit'):
+            self.clf.fit(X, y)
+        self.compile_forest()
+        
+        report = {
+            'rows': n,
+            'rows_fit': len(rows),
+            'disk_mb': n * dim * np.dtype(dtype).itemsize / (1024 * 1024),
+            'memory_budget_mb': memory_budget_mb,
+            'peak_rss_mb': peak_rss_mb()
+        }
+        metrics.gauge('train.peak_rss_mb', report['peak_rss_mb'])
+        print(f"✅ Modelo entrenado con {len(rows)}/{n} filas | embeddings en disco {report['disk_mb']:.0f} MB | "
+              f"RSS pico {report['peak_rss_mb']:.0f} MB (presupuesto {memory_budget_mb} MB)")
+        metrics.emit()
+        return report
+    
+    def predict_batch(self, texts):
+        """Devuelve un arreglo de probabilidades de toxicidad alineado con `texts`"""
+        if isinstance(texts, str):
+            texts = [texts]
+        elif isinstance(texts, pd.Series):
+            texts = texts.tolist()
+        else:
+            texts = list(texts)
+        
+        if not texts:
+            return np.empty(0, dtype=np.float64)
+        
+        # Un solo paso por el embedder y por el bosque para todo el lote
+        metrics = get_metrics()
+        metrics.incr('predict.texts', len(texts))
+        # Las características de contexto se calculan en otro hilo mientras se embebe
+        context = self.adjuster.submit(texts) if self.adjuster is not None else None
+        with metrics.timer('predict.embed'):
+            if self.use_llm:
+                X = self._reduce(self.embedder.embed(texts))
+            else:
+                X = self.vectorizer.transform(texts)
+        
+        # Probabilidad de la clase tóxica para cada fila (sin aplicar umbral)
+        with metrics.timer('predict.forest'):
+            if self.forest is not None:
+                # Evaluación en el hilo actual: sin reparto de joblib por llamada
+                probas = self.forest.predict_proba(X)[:, 1]
+            else:
+                probas = self.clf.predict_proba(X)[:, 1]
+        
+        if context is not None:
+            # Solo se espera lo que el hilo de contexto no haya terminado ya
+            with metrics.timer('predict.adjust_wait'):
+                features = context.result()
+            probas = self.adjuster.adjust(probas, features)
+        return probas
     
     def predict(self, text):
-        """Devuelve la probabilidad de toxicidad (sin umbral ajustado)"""
+        """Devuelve la probabilidad de toxicidad (sin umbral ajustado)
+        
+        Para un solo texto devuelve un float; para una lista devuelve un arreglo
+        alineado con la entrada (equivalente a `predict_batch`).
+        """
+        probas = self.predict_batch(text)
         if isinstance(text, str):
-            text = [text]
+            return float(probas[0])
+        return probas
+    
+    def save(self, path):
+        """Guarda el modelo como directorio de artefacto
         
+        - manifest.json: configuración (modelo LLM, max_length, pooling, backend, ventanas, umbral)
+        - classifier.joblib: el RandomForest, sin comprimir para poder mapearlo en memoria
+        - vectorizer.joblib: el TF-IDF (solo si use_llm=False)
+        - forest/: el bosque aplanado en arreglos .npy mapeables (solo si use_llm=True)
+        - reducer/: media y componentes de la reducción de embeddings (si se usa)
+        - adjuster (en el manifest): parámetros del ajuste contextual (si se usa)
+        
+        El transformer no se copia: se referencia por nombre/ruta.
+        """
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        
+        manifest = {
+            'format_version': ARTIFACT_FORMAT_VERSION,
+            'use_llm': self.use_llm,
+            'threshold': self.threshold,
+            'classifier': 'classifier.joblib'
+        }
         if self.use_llm:
-            X = self.embedder.embed(text)
+            manifest.update({
+                'model_name': self.embedder.model_name,
+                'max_length': self.embedder.max_length,
+                'pooling': self.embedder.pooling,
+                'backend': self.embedder.backend_name,
+                **self.embedder.window_options()
+            })
         else:
-            X = self.vectorizer.transform(text)
+            manifest['vectorizer'] = 'vectorizer.joblib'
+            joblib.dump(self.vectorizer, path / manifest['vectorizer'])
+        
+        if self.adjuster is not None:
+            manifest['adjuster'] = self.adjuster.config()
+        
+        if self.reducer is not None:
+            manifest['reducer'] = 'reducer'
+            self.reducer.save(path / manifest['reducer'])
+        
+        if self.forest is not None:
+            manifest['forest'] = 'forest'
+            self.forest.save(path / manifest['forest'])
         
-        # Devuelve probabilidad (sin aplicar umbral)
-        return self.clf.predict_proba(X)[0][1]
\ No newline at end of file
+        joblib.dump(self.clf, path / manifest['classifier'])
+        (path / 'manifest.json').write_text(json.dumps(manifest, indent=2), encoding='utf-8')
+        return path
+    
+    @classmethod
+    def load(cls, path, mmap_mode='r', use_cache=None):
+        """Carga un artefacto guardado con `save` (o un .joblib antiguo)
+        
+        El clasificador se mapea en memoria (`mmap_mode`) y el transformer no se
+        carga hasta el primer embed, por lo que el arranque es casi inmediato.
+        """
+        path = Path(path)
+        start = time.perf_counter()
+        if path.is_file():
+            # Formato antiguo: todo el modelo en un único pickle
+            model = joblib.load(path)
+            model.__dict__.setdefault('threshold', 0.5)
+            model.__dict__.setdefault('reducer', None)
+            model.__dict__.setdefault('adjuster', None)
+            if model.use_llm and use_cache is not None:
+                model.embedder.use_cache = use_cache
+            model.compile_forest()
+        else:
+            manifest = json.loads((path / 'manifest.json').read_text(encoding='utf-8'))
+            if manifest['use_llm']:
+                # El embedder es perezoso: construirlo no carga el transformer
+                model = cls(
+                    use_llm=True,
+                    use_cache=use_cache,
+                    model_name=manifest['model_name'],
+                    max_length=manifest['max_length'],
+                    backend=manifest['backend'],
+                    pooling=manifest.get('pooling', 'cls'),
+                    long_text=manifest.get('long_text', False),
+                    window_stride=manifest.get('window_stride'),
+                    max_windows=manifest.get('max_windows'),
+                    window_aggregation=manifest.get('window_aggregation')
+                )
+                if 'reducer' in manifest:
+                    model.reducer = EmbeddingReducer.load(path / manifest['reducer'], mmap_mode=mmap_mode)
+            else:
+                model = cls(use_llm=False)
+                model.vectorizer = joblib.load(path / manifest['vectorizer'])
+            model.threshold = manifest.get('threshold', 0.5)
+            if 'adjuster' in manifest:
+                model.adjuster = ContextualAdjuster(**manifest['adjuster'])
+            model.clf = joblib.load(path / manifest['classifier'], mmap_mode=mmap_mode)
+            if 'forest' in manifest:
+                model.forest = FlatForest.load(path / manifest['forest'], mmap_mode=mmap_mode)
+            else:
+                model.compile_forest()
+        print(f"📂 Modelo cargado desde {path} en {time.perf_counter() - start:.2f}s")
+        return model
+
+
+def load_model(path, mmap_mode='r', use_cache=None):
+    """Carga cualquier artefacto guardado (ToxicityModel o CascadeModel) según su manifest"""
+    path = Path(path)
+    manifest_path = path / 'manifest.json'
+    if manifest_path.exists():
+        manifest = json.loads(manifest_path.read_text(encoding='utf-8'))
+        if manifest.get('type') == 'cascade':
+            from .cascade import CascadeModel
+            return CascadeModel.load(path, mmap_mode=mmap_mode, use_cache=use_cache)
+    return ToxicityModel.load(path, mmap_mode=mmap_mode, use_cache=use_cache)
@@ -0,0 +1,80 @@
+import multiprocessing as mp
+import os
+import numpy as np
+import torch
+
+# Embedder propio de cada proceso worker (se carga una sola vez en el initializer)
+_worker_embedder = None
+
+
+def available_cpus():
+    """CPUs disponibles para este proceso (respeta afinidad/cgroups si el SO lo permite)"""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def resolve_parallelism(num_workers=None, threads_per_worker=None):
+    """Valores automáticos: ~4 hilos por worker y tantos workers como quepan en las CPUs"""
+    cpus = available_cpus()
+    if threads_per_worker is None:
+        threads_per_worker = min(4, cpus) if num_workers is None else max(1, cpus // num_workers)
+    if num_workers is None:
+        num_workers = max(1, cpus // threads_per_worker)
+    return int(num_workers), int(threads_per_worker)
+
+
+def _init_worker(model_name, backend, max_length, pooling, window_options, threads):
+    global _worker_embedder
+    from .llm_embedder import LLMEmbedder
+    torch.set_num_threads(threads)
+    _worker_embedder = LLMEmbedder(
+        model_name=model_name,
+        use_cache=False,
+        backend=backend,
+        num_threads=threads,
+        parallel=False,
+        max_length=max_length,
+        pooling=pooling,
+        **window_options
+    )
+    _worker_embedder.load()
+
+
+def _embed_shard(shard):
+    start, texts = shard
+    return start, _worker_embedder._embed_texts(texts)
+
+
+class ParallelEmbedder:
+    """Reparte el embedding en shards entre varios procesos worker
+
+    Cada worker carga el modelo una vez con su propio número de hilos; los
+    resultados se escriben por posición en un arreglo preasignado, de modo que
+    el orden de salida coincide con el de entrada.
+    """
+
+    def __init__(self, model_name, backend, max_length, pooling='cls', window_options=None, num_workers=None, threads_per_worker=None, shard_size=512):
+        self.num_workers, self.threads_per_worker = resolve_parallelism(num_workers, threads_per_worker)
+        self.shard_size = int(shard_size)
+        print(f"🧵 Iniciando {self.num_workers} workers de embedding "
+              f"({self.threads_per_worker} hilos c/u, shards de {self.shard_size})...")
+        # 'spawn' evita heredar el estado de torch/hilos del proceso principal
+        ctx = mp.get_context('spawn')
+        self.pool = ctx.Pool(
+            self.num_workers,
+            initializer=_init_worker,
+            initargs=(model_name, backend, max_length, pooling, window_options or {}, self.threads_per_worker)
+        )
+
+    def embed(self, texts, dim):
+        embeddings = np.empty((len(texts), dim), dtype=np.float32)
+        shards = ((i, texts[i:i + self.shard_size]) for i in range(0, len(texts), self.shard_size))
+        for start, shard_embeds in self.pool.imap_unordered(_embed_shard, shards):
+            embeddings[start:start + len(shard_embeds)] = shard_embeds
+        return embeddings
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
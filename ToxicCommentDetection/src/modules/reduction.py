@@ -0,0 +1,137 @@
+import json
+import time
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from sklearn.base import clone
+from sklearn.metrics import roc_auc_score
+
+REDUCTION_METHODS = ('pca', 'random')
+
+# Filas máximas usadas para ajustar el PCA (el resto solo se transforma)
+FIT_MAX_ROWS = 100_000
+
+# Filas transformadas a la vez (acota la copia float32 de entradas grandes o memmaps)
+TRANSFORM_CHUNK = 65_536
+
+
+class EmbeddingReducer:
+    """Proyección lineal ajustada de los embeddings a pocas dimensiones, guardadas en float16
+
+    - 'pca': componentes principales (PCA aleatorizado de sklearn sobre una muestra)
+    - 'random': proyección gaussiana aleatoria (sin ajuste, solo depende de la semilla)
+
+    Solo se guardan `mean` y `components`, de modo que la transformación es la
+    misma multiplicación de matrices en entrenamiento y en predicción.
+    """
+
+    def __init__(self, method='pca', n_components=128, dtype='float16', random_state=42):
+        if method not in REDUCTION_METHODS:
+            raise ValueError(f"Método de reducción desconocido: {method} (opciones: {', '.join(REDUCTION_METHODS)})")
+        self.method = method
+        self.n_components = int(n_components)
+        self.dtype = np.dtype(dtype)
+        self.random_state = random_state
+        self.mean = None
+        self.components = None
+
+    def fit(self, X):
+        rng = np.random.default_rng(self.random_state)
+        if self.method == 'pca':
+            from sklearn.decomposition import PCA
+            rows = np.arange(len(X)) if len(X) <= FIT_MAX_ROWS else np.sort(rng.choice(len(X), FIT_MAX_ROWS, replace=False))
+            sample = np.asarray(X[rows], dtype=np.float32)
+            # PCA no admite más componentes que filas o columnas (p. ej. un primer bloque pequeño)
+            n_components = min(self.n_components, *sample.shape)
+            if n_components < self.n_components:
+                print(f"⚠️ PCA: {self.n_components} componentes no caben en {sample.shape[0]}x{sample.shape[1]}, se usan {n_components}")
+                self.n_components = n_components
+            pca = PCA(n_components=self.n_components, svd_solver='randomized', random_state=self.random_state)
+            pca.fit(sample)
+            self.mean = pca.mean_.astype(np.float32)
+            self.components = pca.components_.astype(np.float32)
+            explained = float(pca.explained_variance_ratio_.sum())
+            print(f"📉 PCA {X.shape[1]} -> {self.n_components} dimensiones ({explained:.1%} de la varianza)")
+        else:
+            self.mean = np.zeros(X.shape[1], dtype=np.float32)
+            self.components = (rng.standard_normal((self.n_components, X.shape[1])) /
+                               np.sqrt(self.n_components)).astype(np.float32)
+            print(f"📉 Proyección aleatoria {X.shape[1]} -> {self.n_components} dimensiones")
+        return self
+
+    def transform(self, X):
+        reduced = np.empty((len(X), self.n_components), dtype=self.dtype)
+        for start in range(0, len(X), TRANSFORM_CHUNK):
+            chunk = np.asarray(X[start:start + TRANSFORM_CHUNK], dtype=np.float32)
+            reduced[start:start + TRANSFORM_CHUNK] = (chunk - self.mean) @ self.components.T
+        return reduced
+
+    def fit_transform(self, X):
+        return self.fit(X).transform(X)
+
+    def save(self, path):
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        np.save(path / 'mean.npy', self.mean)
+        np.save(path / 'components.npy', self.components)
+        meta = {
+            'method': self.method,
+            'n_components': self.n_components,
+            'dtype': self.dtype.name,
+            'random_state': self.random_state
+        }
+        (path / 'reducer.json').write_text(json.dumps(meta), encoding='utf-8')
+        return path
+
+    @classmethod
+    def load(cls, path, mmap_mode='r'):
+        path = Path(path)
+        meta = json.loads((path / 'reducer.json').read_text(encoding='utf-8'))
+        reducer = cls(meta['method'], meta['n_components'], meta['dtype'], meta['random_state'])
+        reducer.mean = np.load(path / 'mean.npy', mmap_mode=mmap_mode)
+        reducer.components = np.load(path / 'components.npy', mmap_mode=mmap_mode)
+        return reducer
+
+
+def compare_reductions(X_train, y_train, X_test, y_test, classifier, n_components=(64, 128, 256), method='pca'):
+    """
+    Coste en AUC frente a la ganancia en memoria y velocidad de cada reducción
+    Args:
+        X_train, y_train: Embeddings completos y etiquetas de entrenamiento
+        X_test, y_test: Embeddings completos y etiquetas separados
+        classifier: Clasificador de referencia (se clona para cada variante)
+        n_components: Dimensiones a comparar contra los embeddings completos
+        method: 'pca' o 'random'
+    Returns:
+        DataFrame con AUC, bytes por fila y tiempos de ajuste/predicción
+    """
+    variants = [(None, np.asarray(X_train, dtype=np.float32), np.asarray(X_test, dtype=np.float32))]
+    for k in n_components:
+        reducer = EmbeddingReducer(method, k).fit(X_train)
+        variants.append((reducer, reducer.transform(X_train), reducer.transform(X_test)))
+
+    rows = []
+    for reducer, train_features, test_features in variants:
+        clf = clone(classifier)
+        start = time.perf_counter()
+        clf.fit(train_features, y_train)
+        fit_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        scores = clf.predict_proba(test_features)[:, 1]
+        predict_seconds = time.perf_counter() - start
+        rows.append({
+            'variant': 'full' if reducer is None else f'{method}-{reducer.n_components}',
+            'dims': train_features.shape[1],
+            'bytes_per_row': train_features.shape[1] * train_features.dtype.itemsize,
+            'auc': roc_auc_score(y_test, scores),
+            'fit_seconds': fit_seconds,
+            'predict_seconds': predict_seconds
+        })
+
+    report = pd.DataFrame(rows)
+    full = report.iloc[0]
+    report['auc_delta'] = report['auc'] - full['auc']
+    report['memory_ratio'] = full['bytes_per_row'] / report['bytes_per_row']
+    report['fit_speedup'] = full['fit_seconds'] / report['fit_seconds']
+    report['predict_speedup'] = full['predict_seconds'] / report['predict_seconds']
+    return report
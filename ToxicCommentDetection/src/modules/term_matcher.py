@@ -0,0 +1,69 @@
+import re
+import unicodedata
+import numpy as np
+
+
+def strip_accents(text):
+    """Elimina tildes y diacríticos (á -> a, ü -> u, ñ -> n)"""
+    decomposed = unicodedata.normalize('NFKD', text)
+    return ''.join(ch for ch in decomposed if not unicodedata.combining(ch))
+
+
+class TermMatcher:
+    """Buscador multi-término compilado una sola vez a partir de un diccionario de categorías
+
+    Todos los términos se combinan en una única expresión regular, de modo que
+    cada texto se recorre una sola vez para encontrar todas sus categorías.
+    """
+
+    def __init__(self, terms_by_category, whole_words=True, accent_insensitive=True, plurals=True):
+        self.categories = list(terms_by_category)
+        self.whole_words = whole_words
+        self.accent_insensitive = accent_insensitive
+
+        # Término normalizado -> índices de las categorías que lo contienen
+        self.term_categories = {}
+        for idx, terms in enumerate(terms_by_category.values()):
+            for term in terms:
+                self.term_categories.setdefault(self._normalize(term), set()).add(idx)
+
+        # Los términos más largos primero para que la alternancia prefiera la coincidencia completa
+        alternation = '|'.join(re.escape(term) for term in sorted(self.term_categories, key=len, reverse=True))
+        if whole_words:
+            # Palabra completa, admitiendo el plural regular en español (-s / -es)
+            suffix = r'(?:e?s)?' if plurals else ''
+            self.pattern = re.compile(rf'\b({alternation}){suffix}\b')
+        else:
+            # Búsqueda de subcadenas con lookahead para no perder coincidencias solapadas
+            self.pattern = re.compile(rf'(?=({alternation}))')
+
+    def _normalize(self, text):
+        text = text.lower()
+        if self.accent_insensitive:
+            text = strip_accents(text)
+        return text
+
+    def match(self, text):
+        """Índices de las categorías presentes en `text` (una sola pasada)"""
+        found = set()
+        if not isinstance(text, str):
+            return found
+        for term in self.pattern.findall(self._normalize(text)):
+            found |= self.term_categories[term]
+            if len(found) == len(self.categories):
+                break
+        return found
+
+    def detect(self, text):
+        """Diccionario categoría -> bool para un texto"""
+        found = self.match(text)
+        return {category: idx in found for idx, category in enumerate(self.categories)}
+
+    def match_matrix(self, texts):
+        """Matriz booleana (n_textos, n_categorías) para una lista o Series de textos"""
+        matrix = np.zeros((len(texts), len(self.categories)), dtype=bool)
+        for row, text in enumerate(texts):
+            found = self.match(text)
+            if found:
+                matrix[row, list(found)] = True
+        return matrix
@@ -1,27 +1,101 @@
 import re
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+import pandas as pd
 from nltk.stem import SnowballStemmer
 
+# URLs (se eliminan) y signos de puntuación (se sustituyen por espacio) en una sola pasada
+URL_OR_PUNCT = re.compile(r'(?P<url>http\S+|www\S+)|[^\w\s]')
+
+# Tamaño máximo de la caché de raíces (el vocabulario es zipfiano)
+STEM_CACHE_SIZE = 200_000
+
+# A partir de este tamaño clean_batch reparte el trabajo entre procesos
+PARALLEL_MIN_TEXTS = 500_000
+
+
+def _url_or_punct(match):
+    return '' if match.lastgroup == 'url' else ' '
+
+
 # Clase para limpiar y procesar texto
 class TextCleaner:
-    def __init__(self):
+    def __init__(self, stem_cache_size=STEM_CACHE_SIZE):
         self.stemmer = SnowballStemmer('english')
         self.toxic_patterns = re.compile(r"\b(idiota|estúpido|incompetente|imbécil|mierda|matar|jodido)\b", re.IGNORECASE)
-    
+        self.stem_cache_size = stem_cache_size
+        # Caché acotada de raíces compartida entre llamadas
+        self._stem = lru_cache(maxsize=stem_cache_size)(self.stemmer.stem)
+
     # Método para limpiar el texto
     # Conserva palabras tóxicas y realiza limpieza básica
     def clean(self, text):
         if not isinstance(text, str):
             return ""
-            
+
         # Conservar palabras tóxicas
         text = self.toxic_patterns.sub(lambda x: f"TOXIC_{x.group().upper()}", text.lower())
-        
+
         # Limpieza básica
-        text = re.sub(r'http\S+|www\S+|https\S+', '', text)
-        text = re.sub(r'[^\w\s]', ' ', text)
-        
+        text = URL_OR_PUNCT.sub(_url_or_punct, text)
+
         # Tokenización y stemming
         tokens = text.split()
-        tokens = [self.stemmer.stem(token) for token in tokens if len(token) > 2]
-        
-        return ' '.join(tokens)
\ No newline at end of file
+        tokens = [self._stem(token) for token in tokens if len(token) > 2]
+
+        return ' '.join(tokens)
+
+    # Normalización suave para comparar textos (deduplicación): minúsculas,
+    # sin URLs ni puntuación y con espacios colapsados, pero sin stemming ni
+    # eliminar palabras cortas (p. ej. "no"), que cambiarían el significado
+    def normalize(self, text):
+        if not isinstance(text, str):
+            return ""
+        return ' '.join(URL_OR_PUNCT.sub(_url_or_punct, text.lower()).split())
+
+    def _clean_many(self, texts):
+        return [self.clean(text) for text in texts]
+
+    # Limpia muchos textos; con entradas grandes usa un pool de procesos
+    def clean_batch(self, texts, n_jobs=None):
+        index = texts.index if isinstance(texts, pd.Series) else None
+        texts = list(texts)
+
+        if n_jobs is None:
+            n_jobs = 1 if len(texts) < PARALLEL_MIN_TEXTS else None
+
+        if n_jobs == 1:
+            cleaned = self._clean_many(texts)
+        else:
+            n_jobs = n_jobs or os.cpu_count() or 1
+            chunk_size = max(1, -(-len(texts) // (n_jobs * 4)))
+            chunks = [texts[i:i + chunk_size] for i in range(0, len(texts), chunk_size)]
+            with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+                cleaned = [text for chunk in executor.map(self._clean_many, chunks) for text in chunk]
+
+        if index is not None:
+            return pd.Series(cleaned, index=index)
+        return cleaned
+
+    # Estadísticas de la caché de raíces (solo del proceso actual)
+    def stats(self):
+        info = self._stem.cache_info()
+        total = info.hits + info.misses
+        return {
+            'hits': info.hits,
+            'misses': info.misses,
+            'hit_rate': info.hits / total if total else 0.0,
+            'size': info.currsize,
+            'max_size': info.maxsize
+        }
+
+    def __getstate__(self):
+        # La función cacheada no es serializable; se recrea al deserializar
+        state = self.__dict__.copy()
+        state.pop('_stem', None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._stem = lru_cache(maxsize=self.stem_cache_size)(self.stemmer.stem)
@@ -6,8 +6,12 @@ from sklearn.utils import shuffle
 # Función para cargar y preprocesar datos automáticamente detectando columnas de toxicidad
 # Modifica la función load_and_preprocess() así:
 
-def load_and_preprocess():
-    """Carga y preprocesa datos automáticamente detectando columnas de toxicidad"""
+def load_and_preprocess(balance=True):
+    """Carga y preprocesa datos automáticamente detectando columnas de toxicidad
+
+    Con balance=False no se sobremuestrea (el entrenamiento fuera de memoria
+    compensa el desbalance con pesos de clase y no necesita filas duplicadas).
+    """
     try:
         train = pd.read_csv(DATA_RAW / 'train.csv').copy()
         test = pd.read_csv(DATA_RAW / 'test.csv').copy()
@@ -35,7 +39,7 @@ def load_and_preprocess():
         train['target_binary'] = train[toxic_col].astype(int)
 
     # Balanceo de clases SOLO SI hay suficientes datos
-    if 'target_binary' in train.columns:
+    if balance and 'target_binary' in train.columns:
         toxic = train[train['target_binary'] == 1].copy()
         non_toxic = train[train['target_binary'] == 0].copy()
         
@@ -0,0 +1,48 @@
+import argparse
+import json
+import logging
+import pandas as pd
+from modules.models import ToxicityModel
+from config import MODELS_DIR, EMBEDDING_STORE_DIR, INCREMENTAL_NEW_TREES, INCREMENTAL_MAX_TREES
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def load_labeled(path):
+    """Lee un CSV de nuevas decisiones de moderación (comment_text + columna de toxicidad)"""
+    df = pd.read_csv(path)
+    toxic_cols = [col for col in df.columns if 'toxic' in col.lower() or col == 'target']
+    if 'comment_text' not in df.columns or not toxic_cols:
+        raise ValueError(f"{path} debe tener 'comment_text' y una columna de toxicidad")
+    texts = df['comment_text'].fillna('').astype(str)
+    labels = df[toxic_cols[0]]
+    # Igual que en preprocessing: puntuaciones continuas se binarizan en 0.5
+    if labels.dtype == 'float64':
+        labels = labels >= 0.5
+    return texts.tolist(), labels.astype(int).to_numpy()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reentrenamiento incremental con nuevas filas etiquetadas")
+    parser.add_argument('data', help="CSV con comment_text y la etiqueta de toxicidad")
+    parser.add_argument('--model', default=str(MODELS_DIR / 'llm_toxicity_model'), help="Directorio del modelo entrenado")
+    parser.add_argument('--store', default=str(EMBEDDING_STORE_DIR), help="Almacén de embeddings de entrenamiento")
+    parser.add_argument('--new-trees', type=int, default=INCREMENTAL_NEW_TREES)
+    parser.add_argument('--max-trees', type=int, default=INCREMENTAL_MAX_TREES)
+    args = parser.parse_args()
+
+    texts, labels = load_labeled(args.data)
+    logger.info(f"📥 {len(texts)} filas nuevas ({labels.mean():.1%} tóxicas)")
+
+    # Sin mmap: el artefacto se sobrescribe al final con el bosque ampliado
+    model = ToxicityModel.load(args.model, mmap_mode=None)
+    report = model.train_incremental(texts, labels, args.store, n_new_trees=args.new_trees, max_trees=args.max_trees)
+    model.save(args.model)
+    logger.info(f"✅ Modelo actualizado en {args.model}")
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
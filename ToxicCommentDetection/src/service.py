@@ -0,0 +1,285 @@
+import argparse
+import asyncio
+import json
+import logging
+import time
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from modules.models import load_model
+from modules.metrics import enable_metrics, get_metrics
+from config import (
+    MODELS_DIR, SERVICE_HOST, SERVICE_PORT,
+    SERVICE_MAX_BATCH_SIZE, SERVICE_MAX_WAIT_MS, SERVICE_MAX_BODY_BYTES
+)
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+HTTP_REASONS = {
+    200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+    413: 'Payload Too Large', 500: 'Internal Server Error'
+}
+
+
+class LatencyStats:
+    """Latencias recientes (ventana acotada) y su resumen en percentiles"""
+
+    def __init__(self, window=10000):
+        self.samples = deque(maxlen=window)
+        self.count = 0
+
+    def add(self, seconds):
+        self.samples.append(seconds)
+        self.count += 1
+
+    def summary(self):
+        if not self.samples:
+            return {'count': self.count, 'p50_ms': None, 'p99_ms': None, 'max_ms': None}
+        values = np.fromiter(self.samples, dtype=np.float64) * 1000
+        p50, p99 = np.percentile(values, [50, 99])
+        return {'count': self.count, 'p50_ms': float(p50), 'p99_ms': float(p99), 'max_ms': float(values.max())}
+
+
+class MicroBatcher:
+    """Agrupa peticiones concurrentes en micro-lotes antes de llamar al modelo
+
+    Cada petición entra a una cola asyncio en tramos de hasta `max_batch_size`
+    textos; el bucle de lotes toma el primero, espera como máximo
+    `max_wait_ms` a que lleguen más (sin pasar de `max_batch_size` textos) y
+    puntúa todo el lote de una vez en un hilo aparte para no bloquear el event
+    loop. Una petición grande encola su siguiente tramo solo cuando el
+    anterior está puntuado, así que las demás peticiones se intercalan con ella
+    en lugar de esperar a que termine entera.
+    """
+
+    def __init__(self, score_fn, max_batch_size=SERVICE_MAX_BATCH_SIZE, max_wait_ms=SERVICE_MAX_WAIT_MS):
+        self.score_fn = score_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.queue = None
+        self.executor = ThreadPoolExecutor(max_workers=1)  # El modelo se invoca de forma serializada
+        self.batch_sizes = Counter()
+        self.batch_latency = LatencyStats()
+        self._carry = None   # Tramo que no cupo en el lote anterior
+        self._task = None
+
+    def start(self):
+        self.queue = asyncio.Queue()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self.executor.shutdown(wait=True)
+
+    async def score(self, texts):
+        """Puntúa `texts` junto con las demás peticiones en curso, en tramos de `max_batch_size`"""
+        scores = []
+        for start in range(0, len(texts), self.max_batch_size):
+            future = asyncio.get_running_loop().create_future()
+            await self.queue.put((texts[start:start + self.max_batch_size], future))
+            scores.extend(await future)
+        return scores
+
+    async def _collect(self):
+        if self._carry is not None:
+            items, self._carry = [self._carry], None
+        else:
+            items = [await self.queue.get()]
+        n_texts = len(items[0][0])
+        deadline = asyncio.get_running_loop().time() + self.max_wait
+        while n_texts < self.max_batch_size:
+            timeout = deadline - asyncio.get_running_loop().time()
+            if timeout <= 0:
+                break
+            try:
+                item = await asyncio.wait_for(self.queue.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+            if n_texts + len(item[0]) > self.max_batch_size:
+                self._carry = item   # Abre el siguiente lote
+                break
+            items.append(item)
+            n_texts += len(item[0])
+        return items
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            items = await self._collect()
+            texts = [text for item_texts, _ in items for text in item_texts]
+            start = time.perf_counter()
+            try:
+                scores = await loop.run_in_executor(self.executor, self.score_fn, texts)
+            except Exception as e:
+                for _, future in items:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            self.batch_latency.add(time.perf_counter() - start)
+            self.batch_sizes[len(texts)] += 1
+
+            # Devolver a cada petición su tramo del lote
+            offset = 0
+            for item_texts, future in items:
+                if not future.done():
+                    future.set_result([float(s) for s in scores[offset:offset + len(item_texts)]])
+                offset += len(item_texts)
+
+    def metrics(self):
+        return {
+            'batch_latency': self.batch_latency.summary(),
+            'batch_size_histogram': {str(size): count for size, count in sorted(self.batch_sizes.items())}
+        }
+
+
+class ScoringService:
+    """Rutas del servicio independientes del transporte (se pueden probar sin red)"""
+
+    def __init__(self, model, max_batch_size=SERVICE_MAX_BATCH_SIZE, max_wait_ms=SERVICE_MAX_WAIT_MS, threshold=None,
+                 max_body_bytes=SERVICE_MAX_BODY_BYTES):
+        self.model = model
+        self.max_body_bytes = max_body_bytes
+        # Umbral del manifest del modelo salvo que se indique otro
+        self.threshold = threshold if threshold is not None else getattr(model, 'threshold', 0.5)
+        self.batcher = MicroBatcher(model.predict_batch, max_batch_size, max_wait_ms)
+        self.request_latency = LatencyStats()
+
+    async def start(self):
+        self.batcher.start()
+
+    async def stop(self):
+        await self.batcher.stop()
+
+    async def handle(self, method, path, body=b''):
+        """Atiende una petición y devuelve (código HTTP, payload JSON)"""
+        path = path.split('?', 1)[0]
+        if path == '/health':
+            return 200, {'status': 'ok', 'model': type(self.model).__name__}
+        if path == '/metrics':
+            payload = {'request_latency': self.request_latency.summary(), **self.batcher.metrics()}
+            if get_metrics().enabled:
+                payload['pipeline'] = get_metrics().snapshot()
+            return 200, payload
+        if path != '/score':
+            return 404, {'error': f'Ruta no encontrada: {path}'}
+        if method != 'POST':
+            return 405, {'error': 'Use POST en /score'}
+
+        # Acepta {"text": "..."} o {"texts": ["...", ...]}
+        try:
+            payload = json.loads(body or b'{}')
+            texts = payload['texts'] if 'texts' in payload else [payload['text']]
+            if not isinstance(texts, list) or not all(isinstance(t, str) for t in texts):
+                raise ValueError
+        except (ValueError, KeyError, TypeError):
+            return 400, {'error': 'Se espera JSON con "text" (str) o "texts" (lista de str)'}
+
+        start = time.perf_counter()
+        try:
+            scores = await self.batcher.score(texts) if texts else []
+        except Exception as e:
+            logger.exception("Error puntuando petición")
+            return 500, {'error': str(e)}
+        self.request_latency.add(time.perf_counter() - start)
+        return 200, {
+            'scores': scores,
+            'toxic': [score >= self.threshold for score in scores]
+        }
+
+    async def handle_connection(self, reader, writer):
+        """HTTP/1.1 mínimo sobre asyncio (keep-alive, cuerpo por Content-Length)"""
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b'\r\n\r\n')
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+                    break
+                lines = head.decode('latin-1').split('\r\n')
+                try:
+                    method, path, version = lines[0].split(' ', 2)
+                except ValueError:
+                    break
+                headers = {}
+                for line in lines[1:]:
+                    if ':' in line:
+                        name, value = line.split(':', 1)
+                        headers[name.strip().lower()] = value.strip()
+                try:
+                    length = int(headers.get('content-length', 0) or 0)
+                    if length < 0:
+                        raise ValueError
+                except ValueError:
+                    # Sin una longitud válida no se sabe dónde acaba el cuerpo: se cierra la conexión
+                    status, payload = 400, {'error': f"Content-Length inválido: {headers['content-length']!r}"}
+                    keep_alive = False
+                else:
+                    if length > self.max_body_bytes:
+                        # El cuerpo no se lee: se responde y se cierra la conexión
+                        status, payload = 413, {'error': f'Cuerpo de {length} bytes; el máximo es {self.max_body_bytes}'}
+                        keep_alive = False
+                    else:
+                        body = await reader.readexactly(length) if length else b''
+                        status, payload = await self.handle(method.upper(), path, body)
+                        keep_alive = headers.get('connection', '').lower() != 'close' and version == 'HTTP/1.1'
+                data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+                writer.write(
+                    f"HTTP/1.1 {status} {HTTP_REASONS.get(status, '')}\r\n"
+                    f"Content-Type: application/json; charset=utf-8\r\n"
+                    f"Content-Length: {len(data)}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode('latin-1') + data
+                )
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+async def serve(model, host=SERVICE_HOST, port=SERVICE_PORT, max_batch_size=SERVICE_MAX_BATCH_SIZE, max_wait_ms=SERVICE_MAX_WAIT_MS,
+                max_body_bytes=SERVICE_MAX_BODY_BYTES):
+    service = ScoringService(model, max_batch_size, max_wait_ms, max_body_bytes=max_body_bytes)
+    await service.start()
+    server = await asyncio.start_server(service.handle_connection, host, port)
+    logger.info(f"🚀 Servicio de puntuación escuchando en http://{host}:{port} "
+                f"(lote máx. {max_batch_size}, espera máx. {max_wait_ms} ms)")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await service.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Servicio HTTP de puntuación de toxicidad")
+    parser.add_argument('--model', default=str(MODELS_DIR / 'llm_toxicity_model'), help="Directorio del modelo entrenado (ToxicityModel o cascada)")
+    parser.add_argument('--host', default=SERVICE_HOST)
+    parser.add_argument('--port', type=int, default=SERVICE_PORT)
+    parser.add_argument('--max-batch-size', type=int, default=SERVICE_MAX_BATCH_SIZE)
+    parser.add_argument('--max-wait-ms', type=float, default=SERVICE_MAX_WAIT_MS)
+    parser.add_argument('--max-body-bytes', type=int, default=SERVICE_MAX_BODY_BYTES, help="Cuerpo máximo por petición (413 si se supera)")
+    parser.add_argument('--metrics', action='store_true', help="Activar la instrumentación por etapa en /metrics")
+    args = parser.parse_args()
+
+    if args.metrics:
+        enable_metrics()
+
+    logger.info(f"Cargando modelo desde {args.model}...")
+    model = load_model(args.model)
+    try:
+        asyncio.run(serve(model, args.host, args.port, args.max_batch_size, args.max_wait_ms, args.max_body_bytes))
+    except KeyboardInterrupt:
+        logger.info("Servicio detenido")
+
+
+if __name__ == "__main__":
+    main()
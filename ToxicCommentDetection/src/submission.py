@@ -0,0 +1,176 @@
+import argparse
+import json
+import logging
+import os
+import time
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from modules.models import load_model
+from modules.deduplication import Deduplicator
+from modules.metrics import get_metrics
+from config import (
+    DATA_RAW, MODELS_DIR, SUBMISSION_PATH, SUBMISSION_CHUNK_SIZE,
+    DEDUP_ENABLED, DEDUP_THRESHOLD, DEDUP_NUM_PERM, DEDUP_NEAR_DUPLICATES
+)
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def _fingerprint(input_path, chunk_size, model_path, dedup=None):
+    """Identifica una ejecución: solo se reanuda con la misma entrada, bloque, modelo y deduplicación"""
+    stat = Path(input_path).stat()
+    fingerprint = {
+        'input': str(Path(input_path).resolve()),
+        'input_size': stat.st_size,
+        'input_mtime_ns': stat.st_mtime_ns,
+        'chunk_size': chunk_size,
+        'model': None,
+        'dedup': None
+    }
+    if model_path is not None:
+        model_path = Path(model_path)
+        manifest = model_path / 'manifest.json' if model_path.is_dir() else model_path
+        fingerprint['model'] = [str(model_path.resolve()), manifest.stat().st_mtime_ns]
+    if dedup is not None:
+        # Otra configuración agrupa (y por tanto puntúa) los textos de otra forma
+        fingerprint['dedup'] = {
+            'threshold': dedup.threshold,
+            'num_perm': dedup.num_perm,
+            'shingle_size': dedup.shingle_size,
+            'near_duplicates': dedup.near_duplicates,
+            'seed': dedup.seed
+        }
+    return fingerprint
+
+
+def _write_checkpoint(path, checkpoint):
+    """Escritura atómica: el checkpoint nunca queda a medias"""
+    tmp_path = path.with_suffix(path.suffix + '.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(checkpoint, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    tmp_path.replace(path)
+
+
+def _format_eta(seconds):
+    return time.strftime('%H:%M:%S', time.gmtime(seconds)) if np.isfinite(seconds) else '--:--:--'
+
+
+def write_submission(model, input_path, output_path, checkpoint_path=None, chunk_size=2000, dedup=None, model_path=None):
+    """Puntúa el CSV de test por bloques y escribe la submission de forma incremental
+
+    Tras cada bloque la salida se sincroniza a disco y se guarda un checkpoint
+    (bloques completados y tamaño en bytes de la salida). Si la ejecución se
+    interrumpe, la siguiente trunca la salida a ese tamaño y continúa desde el
+    primer bloque pendiente, por lo que el archivo final es idéntico byte a
+    byte al de una ejecución sin cortes. La deduplicación (`dedup`) se aplica
+    dentro de cada bloque.
+
+    Returns:
+        Diccionario con filas, bloques, filas reanudadas, segundos y textos/s
+    """
+    input_path, output_path = Path(input_path), Path(output_path)
+    checkpoint_path = Path(checkpoint_path) if checkpoint_path else output_path.with_name(output_path.name + '.checkpoint.json')
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    fingerprint = _fingerprint(input_path, chunk_size, model_path, dedup)
+
+    checkpoint = None
+    if checkpoint_path.exists() and output_path.exists():
+        checkpoint = json.loads(checkpoint_path.read_text(encoding='utf-8'))
+        if checkpoint.get('fingerprint') != fingerprint:
+            logger.warning("⚠️ El checkpoint corresponde a otra entrada, tamaño de bloque, modelo o deduplicación: se empieza de cero")
+            checkpoint = None
+
+    if checkpoint is None:
+        # Total de filas para el ETA (solo se lee la columna id)
+        total = sum(len(chunk) for chunk in pd.read_csv(input_path, usecols=['id'], chunksize=100_000))
+        checkpoint = {'fingerprint': fingerprint, 'total_rows': total, 'chunks_done': 0, 'rows_done': 0, 'output_bytes': 0}
+        output = open(output_path, 'wb')
+    else:
+        # Descartar lo escrito después del último bloque confirmado
+        output = open(output_path, 'r+b')
+        output.truncate(checkpoint['output_bytes'])
+        output.seek(checkpoint['output_bytes'])
+        logger.info(f"⏯️ Reanudando desde el bloque {checkpoint['chunks_done']} "
+                    f"({checkpoint['rows_done']}/{checkpoint['total_rows']} filas ya escritas)")
+
+    total, resumed_rows = checkpoint['total_rows'], checkpoint['rows_done']
+    scored_texts = 0   # Textos realmente puntuados en esta ejecución (tras deduplicar)
+    start = time.perf_counter()
+    metrics = get_metrics()
+    try:
+        reader = pd.read_csv(input_path, chunksize=chunk_size)
+        for chunk_index, chunk in enumerate(reader):
+            if chunk_index < checkpoint['chunks_done']:
+                continue   # Ya escrito: los bloques son los mismos en cada lectura
+
+            texts = chunk['comment_text'].fillna('').astype(str).tolist()
+            if dedup is not None:
+                predictions = dedup.score(texts, model.predict_batch)
+                scored_texts += dedup.report['groups']
+            else:
+                predictions = model.predict_batch(texts)
+                scored_texts += len(texts)
+
+            rows = pd.DataFrame({'id': chunk['id'], 'prediction': predictions})
+            output.write(rows.to_csv(index=False, header=chunk_index == 0).encode('utf-8'))
+            output.flush()
+            os.fsync(output.fileno())
+
+            checkpoint['chunks_done'] = chunk_index + 1
+            checkpoint['rows_done'] += len(chunk)
+            checkpoint['output_bytes'] = output.tell()
+            _write_checkpoint(checkpoint_path, checkpoint)
+            metrics.emit()
+
+            elapsed = time.perf_counter() - start
+            rate = (checkpoint['rows_done'] - resumed_rows) / elapsed if elapsed else 0.0
+            eta = (total - checkpoint['rows_done']) / rate if rate else float('inf')
+            logger.info(f"📦 Bloque {chunk_index + 1}: {checkpoint['rows_done']}/{total} filas "
+                        f"({checkpoint['rows_done'] / max(total, 1):.1%}) | {rate:.0f} textos/s | ETA {_format_eta(eta)}")
+    finally:
+        output.close()
+
+    # Ejecución completa: el checkpoint ya no hace falta
+    checkpoint_path.unlink(missing_ok=True)
+    seconds = time.perf_counter() - start
+    scored = checkpoint['rows_done'] - resumed_rows
+    report = {
+        'rows': checkpoint['rows_done'],
+        'chunks': checkpoint['chunks_done'],
+        'resumed_rows': resumed_rows,
+        'scored_texts': scored_texts,
+        'seconds': seconds,
+        'throughput': scored / seconds if seconds else 0.0
+    }
+    logger.info(f"✅ Submission generada: {output_path} ({report['rows']} filas, "
+                f"{scored} puntuadas en {seconds:.1f}s, {report['throughput']:.0f} textos/s)")
+    if dedup is not None and scored:
+        logger.info(f"🧬 Deduplicación: {scored_texts} textos únicos para {scored} filas "
+                    f"({1 - scored_texts / scored:.1%} menos por puntuar)")
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Genera la submission de Kaggle por bloques, reanudable tras un corte")
+    parser.add_argument('data', nargs='?', default=str(DATA_RAW / 'test.csv'), help="CSV con id y comment_text")
+    parser.add_argument('--model', default=str(MODELS_DIR / 'llm_toxicity_model'), help="Directorio del modelo entrenado")
+    parser.add_argument('--output', default=str(SUBMISSION_PATH))
+    parser.add_argument('--chunk-size', type=int, default=SUBMISSION_CHUNK_SIZE)
+    parser.add_argument('--dedup', action='store_true', help="Puntuar un solo texto por grupo de duplicados (como DEDUP_ENABLED)")
+    args = parser.parse_args()
+
+    model = load_model(args.model)
+    dedup = None
+    if DEDUP_ENABLED or args.dedup:
+        dedup = Deduplicator(threshold=DEDUP_THRESHOLD, num_perm=DEDUP_NUM_PERM, near_duplicates=DEDUP_NEAR_DUPLICATES)
+    report = write_submission(model, args.data, args.output, chunk_size=args.chunk_size, dedup=dedup, model_path=args.model)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -2,8 +2,8 @@ from pathlib import Path
 import joblib
 from config import MODELS_DIR, IDENTITY_TERMS
 from modules.text_processing import TextCleaner
-from modules.context_analysis import ContextAnalyzer
 from modules.identity_detection import IdentityDetector
+from modules.contextual_adjustment import ContextualAdjuster
 
 def run_custom_tests():
     """Ejecuta casos de prueba personalizados con análisis detallado"""
@@ -16,8 +16,8 @@ def run_custom_tests():
     model = joblib.load(MODELS_DIR / 'toxicity_model.joblib')
     vectorizer = joblib.load(MODELS_DIR / 'tfidf_vectorizer.joblib')
     cleaner = TextCleaner()
-    context_analyzer = ContextAnalyzer()
     identity_detector = IdentityDetector(IDENTITY_TERMS)
+    adjuster = ContextualAdjuster(IDENTITY_TERMS)
     
     # 2. Casos de prueba detallados por frase, categoria y lo esperado
     test_cases = [
@@ -73,31 +73,23 @@ def run_custom_tests():
         }
     ]
     
-    # 3. Procesar y evaluar cada caso
+    # 3. Procesar y evaluar todos los casos en un solo lote
     print(f"\n...Evaluando {len(test_cases)} casos de prueba...")
+    texts = [case["text"] for case in test_cases]
+    clean_texts = [cleaner.clean(text) for text in texts]
+    
+    # Predicción base
+    base_probas = model.predict(vectorizer.transform(clean_texts))
+    
+    # Ajustes contextuales (sarcasmo, identidad + sentimiento) con las mismas reglas que ToxicityModel
+    features = adjuster.features(texts)
+    adjusted_probas = adjuster.adjust(base_probas, features)
     
     # Iterar sobre los casos de prueba
-    for case in test_cases:
-        # Preprocesamiento
-        clean_text = cleaner.clean(case["text"])
-        
-        # Análisis de contexto e identidades
-        context = context_analyzer.analyze(clean_text)
-        identities = identity_detector.detect(clean_text)
-        
-        # Predicción base
-        text_vector = vectorizer.transform([clean_text])
-        base_proba = model.predict(text_vector)[0]
-        
-        # Ajustes contextuales
-        adjusted_proba = base_proba
-        if context['sarcasm_score'] > 0:
-            adjusted_proba = min(base_proba + 0.25, 1.0)
-        elif any(identities.values()):
-            if context['sentiment'] > 0.3:  # Declaración positiva
-                adjusted_proba = max(base_proba - 0.2, 0.0)
-            elif context['sentiment'] < -0.3:  # Declaración negativa
-                adjusted_proba = min(base_proba + 0.1, 1.0)
+    for i, case in enumerate(test_cases):
+        clean_text = clean_texts[i]
+        base_proba, adjusted_proba = base_probas[i], adjusted_probas[i]
+        identities = identity_detector.detect(cleaner.normalize(case["text"]))
         
         # Resultado final
         prediction = "TÓXICO" if adjusted_proba >= 0.5 else "No tóxico"
@@ -107,7 +99,7 @@ def run_custom_tests():
         print(f"\n🔹 {case['name'].upper()} {correct}")
         print(f"📜 Texto original: '{case['text']}'")
         print(f"🧹 Texto limpio: '{clean_text[:80]}...'")
-        print(f"🎭 Contexto: Sarcasmo={context['sarcasm_score']}, Sentimiento={context['sentiment']:.2f}")
+        print(f"🎭 Contexto: Sarcasmo={int(features['sarcasm'][i])}, Sentimiento={features['sentiment'][i]:.2f}")
         print(f"👥 Identidades detectadas: {', '.join(k for k, v in identities.items() if v) or 'Ninguna'}")
         print(f"📊 Probabilidades: Base={base_proba:.4f}, Ajustada={adjusted_proba:.4f}")
         print(f"🔮 Predicción: {prediction} (Esperado: {case['expected']})")
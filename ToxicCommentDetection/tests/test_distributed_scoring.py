@@ -0,0 +1,66 @@
+import sys
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'src'))
+
+from distributed_scoring import ShardQueue, run_local  # noqa: E402
+from modules.models import ToxicityModel  # noqa: E402
+
+TOXIC = ['eres un idiota', 'te odio idiota', 'cállate estúpido', 'eres basura']
+CLEAN = ['hoy es un buen día', 'me encanta este lugar', 'gracias por la ayuda', 'qué bonito jardín']
+
+
+@pytest.fixture
+def model_path(tmp_path):
+    """Modelo TF-IDF pequeño (sin transformer) para los workers"""
+    model = ToxicityModel(use_llm=False)
+    model.clf.set_params(n_estimators=5, n_jobs=1, random_state=0)
+    model.train(TOXIC * 3 + CLEAN * 3, [1] * 12 + [0] * 12)
+    return model.save(tmp_path / 'model')
+
+
+def write_input(path, ids, texts):
+    pd.DataFrame({'id': ids, 'comment_text': texts}).to_csv(path, index=False)
+    return path
+
+
+def test_run_local_scores_each_new_input(tmp_path, model_path):
+    queue_dir = tmp_path / 'scoring_queue'
+    a = write_input(tmp_path / 'a.csv', [1, 2], TOXIC[:1] + CLEAN[:1])
+    b = write_input(tmp_path / 'b.csv', [10, 11, 12], CLEAN[1:3] + TOXIC[1:2])
+
+    run_local(a, tmp_path / 'out_a.csv', queue_dir, model_path, workers=2, shard_size=1, lease_seconds=60)
+    assert not ShardQueue(queue_dir).exists()
+
+    # Misma cola por defecto en la siguiente ejecución: se puntúa la entrada nueva
+    run_local(b, tmp_path / 'out_b.csv', queue_dir, model_path, workers=2, shard_size=1, lease_seconds=60)
+    out_b = pd.read_csv(tmp_path / 'out_b.csv')
+    assert out_b['id'].tolist() == [10, 11, 12]
+    assert out_b['prediction'].tolist() == pytest.approx(
+        ToxicityModel.load(model_path).predict_batch(pd.read_csv(b)['comment_text']).tolist())
+
+
+def test_run_local_refuses_queue_of_another_input(tmp_path, model_path):
+    queue_dir = tmp_path / 'scoring_queue'
+    a = write_input(tmp_path / 'a.csv', [1, 2], TOXIC[:1] + CLEAN[:1])
+    b = write_input(tmp_path / 'b.csv', [10, 11, 12], CLEAN[1:3] + TOXIC[1:2])
+    ShardQueue(queue_dir).split(a, 1)
+
+    with pytest.raises(ValueError, match='otra entrada'):
+        run_local(b, tmp_path / 'out_b.csv', queue_dir, model_path, workers=1, shard_size=1, lease_seconds=60)
+    assert not (tmp_path / 'out_b.csv').exists()
+
+    # La misma entrada sí reanuda la cola
+    run_local(a, tmp_path / 'out_a.csv', queue_dir, model_path, workers=1, shard_size=1, lease_seconds=60)
+    assert pd.read_csv(tmp_path / 'out_a.csv')['id'].tolist() == [1, 2]
+
+
+def test_run_local_aborts_when_workers_fail(tmp_path):
+    a = write_input(tmp_path / 'a.csv', [1, 2], TOXIC[:1] + CLEAN[:1])
+    with pytest.raises(RuntimeError, match='Workers con error'):
+        run_local(a, tmp_path / 'out.csv', tmp_path / 'queue', tmp_path / 'missing_model',
+                  workers=1, shard_size=1, lease_seconds=60)
+    assert not (tmp_path / 'out.csv').exists()
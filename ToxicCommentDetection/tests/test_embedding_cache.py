@@ -0,0 +1,50 @@
+import hashlib
+import multiprocessing
+import sys
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'src'))
+
+from modules.embedding_cache import EmbeddingCache  # noqa: E402
+
+
+def fake_embedding(text):
+    """Vector determinista por texto: permite comprobar qué devuelve la caché"""
+    return np.frombuffer(hashlib.sha256(text.encode('utf-8')).digest(), dtype=np.uint8)[:8].astype(np.float32)
+
+
+def _score_with_cache(args):
+    """Proceso que lee y escribe la caché compartida; devuelve los aciertos con vector incorrecto"""
+    cache_dir, seed = args
+    cache = EmbeddingCache(cache_dir, 'test', 8, max_entries=300, memory_entries=0)
+    rng = np.random.default_rng(seed)
+    wrong = 0
+    for _ in range(200):
+        texts = [f'texto {i}' for i in rng.integers(0, 600, 20)]
+        embeddings, missing, keys = cache.get_many(texts)
+        missing_set = set(missing)
+        wrong += sum(not np.array_equal(embeddings[i], fake_embedding(text))
+                     for i, text in enumerate(texts) if i not in missing_set)
+        unique = {keys[i]: texts[i] for i in missing}
+        cache.put_many(list(unique), [fake_embedding(text) for text in unique.values()])
+    return wrong
+
+
+def test_concurrent_writers_never_return_another_texts_vector(tmp_path):
+    # Caché más pequeña que el vocabulario: los procesos se desalojan slots entre sí
+    EmbeddingCache(tmp_path, 'test', 8, max_entries=300)
+    with multiprocessing.get_context('fork').Pool(4) as pool:
+        wrong = pool.map(_score_with_cache, [(tmp_path, seed) for seed in range(4)])
+    assert wrong == [0, 0, 0, 0]
+
+
+def test_hits_do_not_mark_cache_dirty(tmp_path):
+    cache = EmbeddingCache(tmp_path, 'test', 8, max_entries=100)
+    texts = [f'texto {i}' for i in range(10)]
+    _, missing, keys = cache.get_many(texts)
+    cache.put_many(keys, [fake_embedding(text) for text in texts])
+    embeddings, missing, _ = cache.get_many(texts)
+    assert not missing and not cache._dirty
+    np.testing.assert_array_equal(embeddings, np.stack([fake_embedding(text) for text in texts]))
@@ -0,0 +1,68 @@
+import sys
+from pathlib import Path
+
+import joblib
+import numpy as np
+import torch
+from sklearn.ensemble import RandomForestClassifier
+from tokenizers import Tokenizer
+from tokenizers.models import WordLevel
+from tokenizers.pre_tokenizers import Whitespace
+from tokenizers.processors import TemplateProcessing
+from transformers import PreTrainedTokenizerFast, RobertaConfig, RobertaModel
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'src'))
+
+from modules.llm_embedder import LLMEmbedder  # noqa: E402
+from modules.models import ToxicityModel  # noqa: E402
+
+WORDS = ['eres', 'un', 'idiota', 'hoy', 'es', 'día', 'soleado', 'me', 'encanta', 'este', 'lugar']
+
+
+def tiny_transformer():
+    """Tokenizer y RoBERTa diminutos construidos en memoria (sin descargas)"""
+    vocab = {token: i for i, token in enumerate(['<s>', '<pad>', '</s>', '<unk>'] + WORDS)}
+    tokenizer = Tokenizer(WordLevel(vocab, unk_token='<unk>'))
+    tokenizer.pre_tokenizer = Whitespace()
+    tokenizer.post_processor = TemplateProcessing(
+        single='<s> $A </s>', special_tokens=[('<s>', vocab['<s>']), ('</s>', vocab['</s>'])]
+    )
+    tokenizer = PreTrainedTokenizerFast(
+        tokenizer_object=tokenizer, bos_token='<s>', eos_token='</s>', pad_token='<pad>', unk_token='<unk>'
+    )
+    torch.manual_seed(0)
+    config = RobertaConfig(
+        vocab_size=len(vocab), hidden_size=32, num_hidden_layers=1, num_attention_heads=2,
+        intermediate_size=37, max_position_embeddings=160, pad_token_id=vocab['<pad>']
+    )
+    return tokenizer, RobertaModel(config).eval()
+
+
+def test_baseline_pickle_loads_and_predicts(tmp_path, monkeypatch):
+    tokenizer, transformer = tiny_transformer()
+    texts = ['eres un idiota', 'hoy es un día soleado', 'me encanta este lugar', 'idiota']
+    with torch.no_grad():
+        inputs = tokenizer(texts, padding=True, truncation=True, max_length=128, return_tensors='pt')
+        X = transformer(**inputs).last_hidden_state[:, 0, :].numpy()
+    clf = RandomForestClassifier(n_estimators=5, max_depth=3, random_state=0, n_jobs=1).fit(X, [1, 0, 0, 1])
+
+    # Mismos atributos que los objetos del formato original (un único .joblib)
+    embedder = object.__new__(LLMEmbedder)
+    embedder.__dict__.update({'device': torch.device('cpu'), 'tokenizer': tokenizer, 'model': transformer})
+    model = object.__new__(ToxicityModel)
+    model.__dict__.update({'use_llm': True, 'embedder': embedder, 'clf': clf})
+
+    # El formato original serializaba el transformer completo (sin __getstate__)
+    path = tmp_path / 'llm_toxicity_model.joblib'
+    monkeypatch.delattr(LLMEmbedder, '__getstate__')
+    joblib.dump(model, path)
+    monkeypatch.undo()
+
+    loaded = ToxicityModel.load(path)
+    assert isinstance(loaded.predict(texts[0]), float)
+    np.testing.assert_array_equal(loaded.predict_batch(texts), clf.predict_proba(X)[:, 1])
+
+    # Y vuelve a guardarse en el formato de directorio actual
+    resaved = ToxicityModel.load(loaded.save(tmp_path / 'artifact'))
+    assert resaved.embedder.model_name == 'distilroberta-base'
+    assert resaved.embedder.max_length == 128
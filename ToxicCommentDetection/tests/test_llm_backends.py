@@ -0,0 +1,36 @@
+import sys
+from pathlib import Path
+
+import pytest
+import torch
+from transformers import RobertaConfig, RobertaModel
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'src'))
+
+from modules.llm_backends import load_backend  # noqa: E402
+
+
+def tiny_roberta(seed):
+    torch.manual_seed(seed)
+    config = RobertaConfig(vocab_size=20, hidden_size=32, num_hidden_layers=1, num_attention_heads=2,
+                           intermediate_size=37, max_position_embeddings=40, pad_token_id=1)
+    return RobertaModel(config).eval()
+
+
+@pytest.mark.parametrize('backend', ['torch_int8', 'onnx'])
+def test_artifact_regenerated_when_weights_change(tmp_path, backend):
+    if backend == 'onnx':
+        pytest.importorskip('onnxruntime')
+    input_ids = torch.tensor([[0, 5, 6, 7, 2], [0, 8, 9, 2, 1]])
+    attention_mask = (input_ids != 1).long()
+
+    # Mismo nombre de modelo, pesos distintos (p. ej. un checkpoint ajustado)
+    first = load_backend(backend, tiny_roberta(0), 'tiny', tmp_path).forward(input_ids, attention_mask)
+    second = load_backend(backend, tiny_roberta(1), 'tiny', tmp_path).forward(input_ids, attention_mask)
+    assert not torch.allclose(first, second)
+
+    expected = load_backend('torch', tiny_roberta(1), 'tiny', tmp_path).forward(input_ids, attention_mask)
+    assert torch.nn.functional.cosine_similarity(second.flatten(), expected.flatten(), dim=0) > 0.99
+
+    # Con el mismo modelo se reutiliza el artefacto guardado
+    assert torch.allclose(load_backend(backend, tiny_roberta(1), 'tiny', tmp_path).forward(input_ids, attention_mask), second)
@@ -0,0 +1,43 @@
+import sys
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'src'))
+
+from modules.deduplication import Deduplicator  # noqa: E402
+from submission import write_submission  # noqa: E402
+
+
+class FailingModel:
+    """Modelo falso: puntúa por longitud y falla tras `fail_after` lotes (simula un corte)"""
+
+    def __init__(self, fail_after=None):
+        self.fail_after = fail_after
+        self.calls = 0
+
+    def predict_batch(self, texts):
+        if self.fail_after is not None and self.calls >= self.fail_after:
+            raise KeyboardInterrupt
+        self.calls += 1
+        return [len(text) / 100 for text in texts]
+
+
+def test_resume_requires_same_dedup_config(tmp_path):
+    data = tmp_path / 'test.csv'
+    pd.DataFrame({'id': range(6), 'comment_text': ['hola', 'hola', 'adiós', 'adiós', 'hoy', 'ayer']}).to_csv(data, index=False)
+    output = tmp_path / 'submission.csv'
+
+    # Corte tras el primer bloque, sin deduplicación
+    with pytest.raises(KeyboardInterrupt):
+        write_submission(FailingModel(fail_after=1), data, output, chunk_size=2)
+
+    # Con deduplicación no se reanuda: las puntuaciones se calcularían de otra forma
+    with pytest.raises(KeyboardInterrupt):
+        write_submission(FailingModel(fail_after=1), data, output, chunk_size=2, dedup=Deduplicator(near_duplicates=True))
+
+    # Misma deduplicación: se reanuda desde el bloque confirmado
+    report = write_submission(FailingModel(), data, output, chunk_size=2, dedup=Deduplicator(near_duplicates=True))
+    assert report['resumed_rows'] == 2
+    assert pd.read_csv(output)['id'].tolist() == list(range(6))